@@ -0,0 +1,272 @@
+"""
+Headless batch generation over many source matrices and parameter grids.
+
+Usage:
+    python batch_generate.py manifest.json
+
+With "streaming" set, tasks whose output doesn't fit in the memory budget are
+written band by band with streaming_expansion instead of being skipped; their
+properties and losses are not computed. Only the "expand" mode can stream, so
+"coarsen" and "kronecker" tasks that don't fit are skipped.
+
+The manifest is a JSON file such as:
+    {
+        "output_directory": "batch-matrices",
+        "sources": ["original-matrices/*.mtx"],
+        "sizes": [[2000, 2000], [5000, 5000]],
+        "densities": [1, 3],
+        "count": 10,
+        "streaming": true,
+        "workers": 4,
+        "memory_budget_gb": 8
+    }
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import scipy.io
+from scipy.sparse import csr_matrix
+
+from memory_planner import read_mtx_size, plan_job, get_default_memory_budget, format_bytes
+
+def expand_manifest(manifest):
+    """
+    Expand a manifest into one task per source x size x density.
+
+    :param manifest: dict with "sources" (paths or glob patterns), "sizes"
+                     ([rows, cols] pairs), "densities", "count", "output_directory"
+                     and optionally "mode", "pattern" and "noise" (see
+                     dynamic_matrix_expansion.create_matrix) and "streaming"
+    :return: list of task dicts
+    """
+    output_directory = manifest.get("output_directory", "batch-matrices")
+    count = int(manifest.get("count", 1))
+    mode = manifest.get("mode", "auto")
+
+    sources = []
+    for pattern in manifest["sources"]:
+        matches = sorted(glob.glob(pattern))
+        sources.extend(matches if matches else [pattern])
+
+    tasks = []
+    for source in sources:
+        source_rows, source_cols, source_nnz = read_mtx_size(source)
+        source_name = os.path.splitext(os.path.basename(source))[0]
+        for rows, cols in manifest["sizes"]:
+            for density in manifest["densities"]:
+                name = f"{source_name}_{rows}x{cols}_d{density}"
+                tasks.append({
+                    "name": name,
+                    "source": source,
+                    "source_shape": (source_rows, source_cols),
+                    "source_nnz": source_nnz,
+                    "rows": int(rows),
+                    "cols": int(cols),
+                    "density": int(density),
+                    "count": count,
+                    "mode": mode,
+                    "pattern": manifest.get("pattern", "tridiagonal"),
+                    "noise": float(manifest.get("noise", 0.0)),
+                    "streaming": bool(manifest.get("streaming", False)),
+                    "output_directory": os.path.join(output_directory, name)
+                })
+    return tasks
+
+def plan_tasks(tasks, memory_budget):
+    """
+    Pick the engine of every task and record its estimated peak memory.
+    Tasks that can't fit in the budget fall back to the streaming engine when
+    they allow it and their mode is "expand", and get an "error" otherwise.
+    """
+    from dynamic_matrix_expansion import is_downscale
+
+    for task in tasks:
+        mode = task["mode"]
+        if mode == "auto":
+            mode = "coarsen" if is_downscale(task["source_shape"], task["rows"], task["cols"]) else "expand"
+        try:
+            plan = plan_job(task["source_shape"], task["source_nnz"], task["rows"], task["cols"],
+                            task["density"], memory_budget=memory_budget, mode=mode, pattern=task["pattern"])
+        except ValueError as e:
+            task["error"] = str(e)
+            continue
+        except MemoryError as e:
+            if not task.get("streaming"):
+                task["error"] = str(e)
+                continue
+            if mode != "expand":
+                task["error"] = f"{e} The {mode} mode can't fall back to the streaming engine."
+                continue
+            try:
+                plan = plan_job(task["source_shape"], task["source_nnz"], task["rows"], task["cols"],
+                                task["density"], memory_budget=memory_budget, engine="streaming")
+            except MemoryError as e:
+                task["error"] = str(e)
+                continue
+        task["engine"] = plan["engine"]
+        task["estimated_memory"] = plan["peak_memory"]
+        task["estimated_time"] = plan["total_time"]
+    return tasks
+
+def run_task(task):
+    """
+    Generate all matrices of one task and save them. Runs inside a worker process.
+
+    :param task: task dict from expand_manifest
+    :return: dict with per-matrix timings and losses
+    """
+    from dynamic_matrix_expansion import load_matrix, load_matrix_sparse, create_matrix
+    from compute_loss import compute_matrix_properties, compute_property_loss, compile_property_plan, weights
+    from streaming_expansion import expand_matrix_streaming
+
+    start = time.perf_counter()
+    os.makedirs(task["output_directory"], exist_ok=True)
+
+    if task.get("engine") == "streaming":
+        if task["mode"] not in ("expand", "auto"):
+            raise ValueError(f"The streaming engine can't run the {task['mode']} mode")
+        original_matrix = load_matrix_sparse(task["source"])
+        if original_matrix is None:
+            raise ValueError(f"Failed to load {task['source']}")
+        setup_time = time.perf_counter() - start
+        matrices = []
+        for i in range(task["count"]):
+            matrix_start = time.perf_counter()
+            save_path = os.path.join(task["output_directory"], f"expanded_matrix_{i + 1}.mtx")
+            expand_matrix_streaming(original_matrix, save_path, task["rows"], task["cols"], task["density"])
+            elapsed = time.perf_counter() - matrix_start
+            matrices.append({"path": save_path, "loss": None, "expand_time": elapsed, "total_time": elapsed})
+        return {
+            "setup_time": setup_time,
+            "total_time": time.perf_counter() - start,
+            "matrices": matrices
+        }
+
+    sparse = task.get("engine") == "sparse"
+    original_matrix = load_matrix_sparse(task["source"]) if sparse else load_matrix(task["source"])
+    if original_matrix is None:
+        raise ValueError(f"Failed to load {task['source']}")
+    plan = compile_property_plan(weights)
+    original_props = compute_matrix_properties(original_matrix, plan=plan)
+    setup_time = time.perf_counter() - start
+
+    matrices = []
+    for i in range(task["count"]):
+        matrix_start = time.perf_counter()
+        expanded_matrix = create_matrix(original_matrix, task["rows"], task["cols"], task["density"],
+                                        engine=task.get("engine", "dense"), mode=task["mode"],
+                                        pattern=task["pattern"], noise=task["noise"])
+        expand_time = time.perf_counter() - matrix_start
+
+        new_props = compute_matrix_properties(expanded_matrix, plan=plan)
+        loss_val = compute_property_loss(original_props, new_props, weights)
+
+        save_path = os.path.join(task["output_directory"], f"expanded_matrix_{i + 1}.mtx")
+        scipy.io.mmwrite(save_path, csr_matrix(expanded_matrix))
+
+        matrices.append({
+            "path": save_path,
+            "loss": float(loss_val),
+            "expand_time": expand_time,
+            "total_time": time.perf_counter() - matrix_start
+        })
+
+    return {
+        "setup_time": setup_time,
+        "total_time": time.perf_counter() - start,
+        "matrices": matrices
+    }
+
+def run_batch(tasks, workers=None, memory_budget=None):
+    """
+    Run tasks on a process pool, largest first, admitting a task only while the
+    estimated memory of all running tasks stays within the budget.
+
+    :param tasks: list of task dicts from expand_manifest
+    :param workers: number of worker processes (default: CPU count)
+    :param memory_budget: memory budget in bytes (default: half of physical memory)
+    :return: list of result dicts, one per task
+    """
+    workers = workers or os.cpu_count() or 1
+    if memory_budget is None:
+        memory_budget = get_default_memory_budget() or float("inf")
+    plan_tasks(tasks, memory_budget)
+
+    results = []
+    queue = []
+    for task in tasks:
+        if "error" in task:
+            # Tasks that can't fit even when running alone are refused up front
+            print(f"[skip] {task['name']}: {task['error']}")
+            results.append({"task": task, "status": "skipped", "error": task["error"]})
+        else:
+            queue.append(task)
+    queue.sort(key=lambda task: task["estimated_memory"], reverse=True)
+
+    running = {}
+    used_memory = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while queue or running:
+            # Admit the largest tasks that still fit next to the running ones
+            for task in list(queue):
+                if len(running) >= workers:
+                    break
+                if used_memory + task["estimated_memory"] <= memory_budget:
+                    queue.remove(task)
+                    used_memory += task["estimated_memory"]
+                    running[executor.submit(run_task, task)] = task
+                    print(f"[start] {task['name']} ({task['engine']}, ~{format_bytes(task['estimated_memory'])})")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                used_memory -= task["estimated_memory"]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"[fail] {task['name']}: {e}")
+                    results.append({"task": task, "status": "failed", "error": str(e)})
+                    continue
+                losses = [matrix["loss"] for matrix in result["matrices"] if matrix["loss"] is not None]
+                loss_text = (f", best loss = {min(losses):.1f}, mean loss = {np.mean(losses):.1f}"
+                             if losses else "")
+                print(f"[done] {task['name']}: {result['total_time']:.1f} s{loss_text}")
+                results.append({"task": task, "status": "done", **result})
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate matrices for a manifest of sources and parameters.")
+    parser.add_argument("manifest", help="Path to the JSON manifest")
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    parser.add_argument("--memory-budget-gb", type=float, help="Memory budget shared by running tasks")
+    args = parser.parse_args()
+
+    with open(args.manifest, "r") as file:
+        manifest = json.load(file)
+
+    workers = args.workers or manifest.get("workers")
+    memory_budget_gb = args.memory_budget_gb or manifest.get("memory_budget_gb")
+    memory_budget = int(memory_budget_gb * 1e9) if memory_budget_gb else None
+
+    tasks = expand_manifest(manifest)
+    print(f"{len(tasks)} tasks expanded from {args.manifest}")
+
+    start = time.perf_counter()
+    results = run_batch(tasks, workers=workers, memory_budget=memory_budget)
+    print(f"Batch finished in {time.perf_counter() - start:.1f} s")
+
+    output_directory = manifest.get("output_directory", "batch-matrices")
+    os.makedirs(output_directory, exist_ok=True)
+    report_path = os.path.join(output_directory, "batch_report.json")
+    with open(report_path, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Report saved to {report_path}")
+
+if __name__ == "__main__":
+    main()
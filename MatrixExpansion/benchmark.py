@@ -0,0 +1,216 @@
+"""
+Benchmarks for the generation pipeline over the bundled datasets.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --output bench.json --baseline baseline.json --threshold 0.2
+
+Every dataset is expanded at several factors and densities, and each stage
+(expand_matrix, compute_matrix_properties, perturb_matrix and
+optimize_multiple_matrices) is timed. Results are written as JSON; when a
+baseline is given, stages slower or heavier than the baseline by more than the
+threshold are reported and the exit code is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.sparse
+
+from dynamic_matrix_expansion import load_matrix, load_matrix_sparse, expand_matrix, expand_matrix_sparse
+from compute_loss import compute_matrix_properties, perturb_matrix, weights
+from generate_matrices import optimize_multiple_matrices
+from memory_planner import read_mtx_size, plan_job
+
+DATASET_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "New Files", "Datasets")
+DATASETS = ["685_bus", "arc130", "cage7", "cage8", "bcsstk11", "bcsstk16", "epb1"]
+DEFAULT_FACTORS = [1, 2, 4]
+DEFAULT_DENSITIES = [1, 3]
+DEFAULT_OPTIMIZE_ITERS = 20
+DEFAULT_THRESHOLD = 0.2
+SEED = 0
+
+def count_nonzeros(matrix):
+    return matrix.nnz if scipy.sparse.issparse(matrix) else int(np.count_nonzero(matrix))
+
+def measure(func, repeat=1, track_memory=True):
+    """
+    Time a call and measure its peak traced memory.
+
+    :param func: zero-argument callable
+    :param repeat: number of timed runs; the fastest one is reported
+    :param track_memory: run once more under tracemalloc to record peak memory
+    :return: (result of the last call, seconds, peak bytes or None)
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        np.random.seed(SEED)
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    peak_memory = None
+    if track_memory:
+        np.random.seed(SEED)
+        tracemalloc.start()
+        func()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, min(times), peak_memory
+
+def benchmark_case(dataset, factor, density, engine="auto", memory_budget=None,
+                   optimize_iters=DEFAULT_OPTIMIZE_ITERS, repeat=1, track_memory=True):
+    """
+    Benchmark every pipeline stage for one dataset, expansion factor and density.
+
+    :return: dict mapping stage name to its record
+    """
+    file_path = os.path.join(DATASET_DIRECTORY, f"{dataset}.mtx")
+    source_rows, source_cols, source_nnz = read_mtx_size(file_path)
+    rows, cols = source_rows * factor, source_cols * factor
+
+    try:
+        plan = plan_job((source_rows, source_cols), source_nnz, rows, cols, density,
+                        memory_budget=memory_budget, engine=engine)
+    except MemoryError as e:
+        return {"skipped": str(e)}
+
+    sparse = plan["engine"] == "sparse"
+    original_matrix = load_matrix_sparse(file_path) if sparse else load_matrix(file_path)
+    expand = expand_matrix_sparse if sparse else expand_matrix
+    records = {}
+
+    def record(stage, seconds, peak_memory, work, unit):
+        records[stage] = {
+            "engine": plan["engine"],
+            "shape": [rows, cols],
+            "time": seconds,
+            "peak_memory": peak_memory,
+            "throughput": work / seconds if seconds > 0 else None,
+            "throughput_unit": unit
+        }
+
+    expanded_matrix, seconds, peak = measure(
+        lambda: expand(original_matrix, rows, cols, density), repeat, track_memory)
+    nnz = count_nonzeros(expanded_matrix)
+    record("expand_matrix", seconds, peak, nnz, "nnz/s")
+
+    _, seconds, peak = measure(lambda: compute_matrix_properties(expanded_matrix), repeat, track_memory)
+    record("compute_matrix_properties", seconds, peak, nnz, "nnz/s")
+
+    _, seconds, peak = measure(lambda: perturb_matrix(expanded_matrix), repeat, track_memory)
+    record("perturb_matrix", seconds, peak, nnz, "nnz/s")
+
+    if optimize_iters > 0:
+        def optimize():
+            # The optimizer prints every iteration
+            with contextlib.redirect_stdout(io.StringIO()):
+                return optimize_multiple_matrices(original_matrix, [expanded_matrix], weights, max_iters=optimize_iters)
+        _, seconds, peak = measure(optimize, repeat, track_memory)
+        record("optimize_multiple_matrices", seconds, peak, optimize_iters, "iterations/s")
+
+    return records
+
+def run_benchmarks(datasets=DATASETS, factors=DEFAULT_FACTORS, densities=DEFAULT_DENSITIES, **kwargs):
+    """
+    Run benchmark_case over the whole grid.
+
+    :return: dict with "meta" and "results" keyed by "dataset/xfactor/ddensity/stage"
+    """
+    results = {}
+    for dataset in datasets:
+        for factor in factors:
+            for density in densities:
+                case = f"{dataset}/x{factor}/d{density}"
+                print(f"Benchmarking {case} ...")
+                records = benchmark_case(dataset, factor, density, **kwargs)
+                if "skipped" in records:
+                    print(f"  skipped: {records['skipped']}")
+                    results[case] = records
+                    continue
+                for stage, stage_record in records.items():
+                    results[f"{case}/{stage}"] = stage_record
+                    memory = stage_record["peak_memory"]
+                    memory_text = f"{memory / 1e6:9.1f} MB" if memory is not None else ""
+                    throughput = stage_record["throughput"]
+                    throughput_text = f"{throughput:.3g}" if throughput is not None else "n/a"
+                    print(f"  {stage:<28} {stage_record['time']:9.4f} s {memory_text}  "
+                          f"{throughput_text} {stage_record['throughput_unit']}")
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count()
+        },
+        "results": results
+    }
+
+def compare_to_baseline(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Find stages whose time or peak memory grew by more than 'threshold' (a fraction).
+
+    :return: list of (key, metric, baseline value, current value, relative change)
+    """
+    regressions = []
+    for key, record in current["results"].items():
+        baseline_record = baseline["results"].get(key)
+        if baseline_record is None or "skipped" in record or "skipped" in baseline_record:
+            continue
+        for metric in ["time", "peak_memory"]:
+            old, new = baseline_record.get(metric), record.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change > threshold:
+                regressions.append((key, metric, old, new, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the matrix generation pipeline.")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown/growth reported as a regression")
+    parser.add_argument("--datasets", nargs="+", default=DATASETS)
+    parser.add_argument("--factors", nargs="+", type=int, default=DEFAULT_FACTORS)
+    parser.add_argument("--densities", nargs="+", type=int, default=DEFAULT_DENSITIES)
+    parser.add_argument("--engine", choices=["auto", "dense", "sparse"], default="auto")
+    parser.add_argument("--optimize-iters", type=int, default=DEFAULT_OPTIMIZE_ITERS)
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage; the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak memory run")
+    args = parser.parse_args()
+
+    current = run_benchmarks(
+        datasets=args.datasets, factors=args.factors, densities=args.densities,
+        engine=args.engine, optimize_iters=args.optimize_iters,
+        repeat=args.repeat, track_memory=not args.no_memory
+    )
+    with open(args.output, "w") as file:
+        json.dump(current, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        regressions = compare_to_baseline(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for key, metric, old, new, change in regressions:
+                print(f"  {key} {metric}: {old:.4g} -> {new:.4g} (+{change:.0%})")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
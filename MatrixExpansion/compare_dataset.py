@@ -0,0 +1,247 @@
+"""
+Compare a folder of generated matrices against their original.
+
+Usage:
+    python compare_dataset.py original-matrices/cage7.mtx generated-matrices --workers 8 --output cage7_report
+
+The matrices are loaded and their property vectors computed in worker
+processes, then summarised per property: distribution over the dataset,
+deviation from the original and the matrices that stand out. Writes
+<output>.json with everything, <output>_properties.csv with one row per
+property and <output>_matrices.csv with one row per matrix.
+
+The condition number is left out unless asked for, since it dominates the
+property time of large matrices. With --sample-size the properties are
+estimated from a sample of rows and columns (see estimate_matrix_properties).
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from compute_loss import (PROPERTY_GROUPS, PROPERTY_KEYS, PropertyVector, compile_property_plan,
+                          compute_matrix_properties, compute_population_loss, estimate_matrix_properties,
+                          weights)
+from dynamic_matrix_expansion import load_matrix_sparse
+
+# Robust z-score (distance to the dataset median in scaled MADs) above which a value is an outlier
+DEFAULT_OUTLIER_THRESHOLD = 3.5
+# Scale the median (mean) absolute deviation to the standard deviation of normal data
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+def comparison_plan(condition_number=False):
+    """Plan computing every property, with or without the condition number."""
+    skipped = set() if condition_number else set(PROPERTY_GROUPS["condition_number"])
+    return compile_property_plan({name: 1 for name in PROPERTY_KEYS if name not in skipped})
+
+def matrix_property_values(path, plan, sample_size=None, seed=None):
+    """
+    Property values of one .mtx file in PROPERTY_KEYS order (NaN where missing).
+    Runs inside a worker process.
+
+    :return: (values, error) where error is None or the reason the matrix was skipped
+    """
+    matrix = load_matrix_sparse(path)
+    if matrix is None:
+        return None, "failed to load"
+    try:
+        if sample_size:
+            props, _ = estimate_matrix_properties(matrix, sample_size=sample_size, plan=plan, seed=seed)
+        else:
+            props = compute_matrix_properties(matrix, plan=plan)
+    except Exception as e:
+        return None, str(e)
+    return props.values, None
+
+def collect_property_values(paths, plan, workers=None, sample_size=None, seed=None):
+    """
+    Property values of many files on a process pool.
+
+    :return: (paths of the loaded matrices, (matrices x properties) array, {path: error} of the others)
+    """
+    workers = workers or os.cpu_count() or 1
+    count = len(paths)
+    arguments = (paths, [plan] * count, [sample_size] * count, [seed] * count)
+    if workers == 1 or count <= 1:
+        results = list(map(matrix_property_values, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, count // (workers * 4))
+            results = list(executor.map(matrix_property_values, *arguments, chunksize=chunksize))
+
+    loaded, rows, errors = [], [], {}
+    for path, (values, error) in zip(paths, results):
+        if error is None:
+            loaded.append(path)
+            rows.append(values)
+        else:
+            errors[path] = error
+    values = np.vstack(rows) if rows else np.empty((0, len(PROPERTY_KEYS)))
+    return loaded, values, errors
+
+def summarize_dataset(original_values, values, threshold=DEFAULT_OUTLIER_THRESHOLD):
+    """
+    Per-property statistics of a dataset and its deviation from the original.
+
+    :param original_values: property values of the original, in PROPERTY_KEYS order
+    :param values: (matrices x properties) array of the dataset
+    :param threshold: robust z-score above which a value is flagged as an outlier
+    :return: (list of per-property dicts, (matrices x properties) robust z-scores)
+    """
+    summaries = []
+    scores = np.full(values.shape, np.nan)
+    for index, name in enumerate(PROPERTY_KEYS):
+        column = values[:, index]
+        present = ~np.isnan(column)
+        if not present.any():
+            continue
+        known = column[present]
+        original = original_values[index]
+        median = np.median(known)
+        spread = MAD_SCALE * np.median(np.abs(known - median))
+        if spread == 0:
+            # More than half the values are equal: fall back to the mean absolute deviation
+            spread = MEAN_AD_SCALE * np.mean(np.abs(known - median))
+        scores[present, index] = (known - median) / spread if spread > 0 else 0.0
+
+        deviation = known - original
+        relative = np.abs(deviation) / abs(original) if original else np.full(known.size, np.nan)
+        summaries.append({
+            "property": name,
+            "original": None if np.isnan(original) else float(original),
+            "count": int(known.size),
+            "mean": float(np.mean(known)),
+            "std": float(np.std(known)),
+            "min": float(np.min(known)),
+            "p05": float(np.percentile(known, 5)),
+            "median": float(median),
+            "p95": float(np.percentile(known, 95)),
+            "max": float(np.max(known)),
+            "mean_deviation": float(np.mean(deviation)) if not np.isnan(original) else None,
+            "mean_abs_deviation": float(np.mean(np.abs(deviation))) if not np.isnan(original) else None,
+            "mean_relative_deviation": float(np.mean(relative)) if original and not np.isnan(original) else None,
+            "num_outliers": int(np.count_nonzero(np.abs(scores[present, index]) > threshold))
+        })
+    return summaries, scores
+
+def compare_dataset(original_path, paths, workers=None, condition_number=False, sample_size=None,
+                    threshold=DEFAULT_OUTLIER_THRESHOLD, seed=None):
+    """
+    Compare generated matrices against their original.
+
+    :param original_path: .mtx file of the original matrix
+    :param paths: .mtx files of the generated matrices
+    :param workers: number of worker processes (default: CPU count)
+    :param condition_number: also compare the estimated condition number
+    :param sample_size: estimate the properties from this many rows and columns instead of computing them
+    :param threshold: robust z-score above which a property value makes a matrix an outlier
+    :param seed: seed of the row/column samples
+    :return: report dict with "original", "properties", "matrices", "outliers" and "errors"
+    """
+    plan = comparison_plan(condition_number)
+    original_values, error = matrix_property_values(original_path, plan, sample_size, seed)
+    if error is not None:
+        raise ValueError(f"Failed to compute the properties of {original_path}: {error}")
+
+    loaded, values, errors = collect_property_values(paths, plan, workers, sample_size, seed)
+    summaries, scores = summarize_dataset(original_values, values, threshold)
+    losses = compute_population_loss(PropertyVector(original_values), values, weights) if len(loaded) else []
+
+    matrices = []
+    outliers = []
+    for row, path in enumerate(loaded):
+        flagged = {PROPERTY_KEYS[index]: float(scores[row, index])
+                   for index in np.flatnonzero(np.abs(np.nan_to_num(scores[row])) > threshold)}
+        matrices.append({
+            "path": path,
+            "loss": float(losses[row]),
+            "properties": dict(PropertyVector(values[row])),
+            "outlier_properties": flagged
+        })
+        if flagged:
+            outliers.append({"path": path, "loss": float(losses[row]), "properties": flagged})
+    outliers.sort(key=lambda outlier: len(outlier["properties"]), reverse=True)
+
+    return {
+        "original": {"path": original_path, "properties": dict(PropertyVector(original_values))},
+        "num_matrices": len(loaded),
+        "sampled": bool(sample_size),
+        "outlier_threshold": threshold,
+        "loss": {
+            "min": float(np.min(losses)) if len(loaded) else None,
+            "mean": float(np.mean(losses)) if len(loaded) else None,
+            "max": float(np.max(losses)) if len(loaded) else None
+        },
+        "properties": summaries,
+        "matrices": matrices,
+        "outliers": outliers,
+        "errors": errors
+    }
+
+def write_report(report, output):
+    """Write <output>.json, <output>_properties.csv and <output>_matrices.csv; returns the three paths."""
+    json_path = f"{output}.json"
+    properties_path = f"{output}_properties.csv"
+    matrices_path = f"{output}_matrices.csv"
+
+    with open(json_path, "w") as file:
+        json.dump(report, file, indent=2)
+
+    with open(properties_path, "w", newline="") as file:
+        if report["properties"]:
+            writer = csv.DictWriter(file, fieldnames=list(report["properties"][0]))
+            writer.writeheader()
+            writer.writerows(report["properties"])
+
+    names = [summary["property"] for summary in report["properties"]]
+    with open(matrices_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["path", "loss", "num_outlier_properties"] + names)
+        for matrix in report["matrices"]:
+            writer.writerow([matrix["path"], matrix["loss"], len(matrix["outlier_properties"])]
+                            + [matrix["properties"].get(name) for name in names])
+    return json_path, properties_path, matrices_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a folder of generated matrices against their original.")
+    parser.add_argument("original", help="Original .mtx file")
+    parser.add_argument("dataset", help="Folder (or glob pattern) of generated .mtx files")
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    parser.add_argument("--output", default="dataset_report", help="Path prefix of the report files")
+    parser.add_argument("--condition-number", action="store_true", help="Also compare the condition number")
+    parser.add_argument("--sample-size", type=int, help="Estimate properties from this many rows/columns")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_OUTLIER_THRESHOLD,
+                        help="Robust z-score above which a property value is an outlier")
+    parser.add_argument("--seed", type=int, help="Seed of the row/column samples")
+    args = parser.parse_args()
+
+    pattern = os.path.join(args.dataset, "*.mtx") if os.path.isdir(args.dataset) else args.dataset
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        print(f"No .mtx files found in {args.dataset}")
+        return
+
+    start = time.perf_counter()
+    report = compare_dataset(args.original, paths, workers=args.workers, condition_number=args.condition_number,
+                             sample_size=args.sample_size, threshold=args.threshold, seed=args.seed)
+    print(f"Compared {report['num_matrices']} matrices in {time.perf_counter() - start:.1f} s")
+    for path, error in report["errors"].items():
+        print(f"[skip] {path}: {error}")
+    if report["num_matrices"]:
+        loss = report["loss"]
+        print(f"Loss: min {loss['min']:.1f}, mean {loss['mean']:.1f}, max {loss['max']:.1f}")
+        print(f"{len(report['outliers'])} outlier matrices")
+        for outlier in report["outliers"][:10]:
+            print(f"  {outlier['path']}: {', '.join(outlier['properties'])}")
+
+    for path in write_report(report, args.output):
+        print(f"Saved {path}")
+
+if __name__ == "__main__":
+    main()
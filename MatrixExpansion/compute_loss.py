@@ -1,4 +1,12 @@
+import contextlib
+import time
+import tracemalloc
+from collections.abc import Mapping
+from statistics import NormalDist
+
 import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
 
 weights = {
     # Original keys
@@ -108,214 +116,863 @@ weights = {
     "estimated_condition_number": 0.001
 }
 
-def compute_matrix_properties(matrix: np.ndarray):
+# Block size of the ||A^-1||_1 estimator; larger is more accurate and slower
+CONDITION_ESTIMATE_COLUMNS = 4
+# Per-row / per-column statistics summarized by the row_stats and col_stats groups
+LINE_STATISTICS = ["min", "max", "mean", "std", "median"]
+# Rows and columns sampled by estimate_matrix_properties
+APPROXIMATE_SAMPLE_SIZE = 1000
+
+# Properties produced by each section of compute_matrix_properties
+PROPERTY_GROUPS = {
+    "basic": [],
+    "symmetry": ["pattern_symmetry", "numerical_symmetry"],
+    "nonzeros_per_row": [f"nonzeros_per_row_{agg}" for agg in ["min", "max", "avg", "std"]],
+    "nonzeros_per_col": [f"nonzeros_per_col_{agg}" for agg in ["min", "max", "avg", "std"]],
+    "value_stats": ["value_min", "value_max", "value_avg", "value_std"],
+    "row_stats": [f"row_{stat}_{agg}" for stat in ["min", "max", "mean", "std", "median"]
+                  for agg in ["min", "max", "mean", "std"]],
+    "col_stats": [f"col_{stat}_{agg}" for stat in ["min", "max", "mean", "std", "median"]
+                  for agg in ["min", "max", "mean", "std"]],
+    "distance_to_diagonal": ["avg_distance_to_diagonal", "num_diagonals_with_nonzeros", "bandwidth"],
+    "structural_unsymmetry": ["num_structurally_unsymmetric_elements"],
+    "norms": ["norm_1", "norm_inf", "frobenius_norm"],
+    "condition_number": ["estimated_condition_number"],
+}
+
+# Fixed order of every property in a PropertyVector
+PROPERTY_KEYS = [name for names in PROPERTY_GROUPS.values() for name in names]
+PROPERTY_INDEX = {name: index for index, name in enumerate(PROPERTY_KEYS)}
+
+class PropertyVector(Mapping):
+    """
+    Matrix properties stored as one float64 array in PROPERTY_KEYS order, with NaN
+    for properties that are missing (not computed or None).
+    Reads like the old props dict: props["bandwidth"], props.items(), dict(props).
+    Known properties that are missing read as None and are left out of iteration.
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        self.values = np.full(len(PROPERTY_KEYS), np.nan) if values is None else np.asarray(values, dtype=np.float64)
+
+    @classmethod
+    def from_props(cls, props):
+        if isinstance(props, PropertyVector):
+            return props
+        vector = cls()
+        for name, value in props.items():
+            if value is not None:
+                vector.values[PROPERTY_INDEX[name]] = value
+        return vector
+
+    @property
+    def missing(self):
+        return np.isnan(self.values)
+
+    def __getitem__(self, name):
+        value = self.values[PROPERTY_INDEX[name]]
+        return None if np.isnan(value) else float(value)
+
+    def __contains__(self, name):
+        return name in PROPERTY_INDEX and not np.isnan(self.values[PROPERTY_INDEX[name]])
+
+    def __iter__(self):
+        return (PROPERTY_KEYS[index] for index in np.flatnonzero(~self.missing))
+
+    def __len__(self):
+        return int(np.count_nonzero(~self.missing))
+
+    def __repr__(self):
+        return f"PropertyVector({dict(self)})"
+
+def weight_vector(weights):
+    """
+    Weights dict as an array in PROPERTY_KEYS order; unweighted properties get 0.
+    Arrays are passed through, so the conversion can be done once and reused.
+    """
+    if isinstance(weights, np.ndarray):
+        return weights
+    vector = np.zeros(len(PROPERTY_KEYS))
+    for name, w in weights.items():
+        if w:
+            vector[PROPERTY_INDEX[name]] = w
+    return vector
+
+class PropertyProfile:
+    """
+    Time, call count and allocated bytes of every property group, accumulated
+    over any number of compute_matrix_properties calls.
+    Bytes are the tracemalloc peak above the memory in use when the group started.
+    """
+    def __init__(self, track_memory=True):
+        self.track_memory = track_memory
+        self.groups = {}
+
+    @contextlib.contextmanager
+    def section(self, group):
+        tracing = self.track_memory and tracemalloc.is_tracing()
+        if tracing:
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self.groups.setdefault(group, {"time": 0.0, "calls": 0, "bytes": 0})
+            stats["time"] += elapsed
+            stats["calls"] += 1
+            if tracing:
+                stats["bytes"] += max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+
+    def merge(self, other):
+        for group, other_stats in other.groups.items():
+            stats = self.groups.setdefault(group, {"time": 0.0, "calls": 0, "bytes": 0})
+            for key in stats:
+                stats[key] += other_stats[key]
+        return self
+
+    def summary(self, weights=None):
+        """
+        One row per group, most expensive first, with the summed loss weight of its
+        properties and the time spent per unit of that weight.
+        """
+        rows = []
+        for group, stats in self.groups.items():
+            weight = sum(abs(weights.get(name, 0.0)) for name in PROPERTY_GROUPS.get(group, [])) if weights else None
+            rows.append({
+                "group": group,
+                **stats,
+                "weight": weight,
+                "time_per_weight": stats["time"] / weight if weight else None
+            })
+        return sorted(rows, key=lambda row: row["time"], reverse=True)
+
+    def report(self, weights=None):
+        total = sum(stats["time"] for stats in self.groups.values()) or 1.0
+        lines = [f"{'group':<24}{'time (s)':>10}{'share':>8}{'calls':>8}{'MB':>10}{'weight':>10}{'s/weight':>10}"]
+        for row in self.summary(weights):
+            weight = f"{row['weight']:.4g}" if row["weight"] is not None else "-"
+            per_weight = f"{row['time_per_weight']:.4g}" if row["time_per_weight"] is not None else "-"
+            lines.append(f"{row['group']:<24}{row['time']:>10.4f}{row['time'] / total:>8.1%}{row['calls']:>8}"
+                         f"{row['bytes'] / 1e6:>10.2f}{weight:>10}{per_weight:>10}")
+        return "\n".join(lines)
+
+def _no_section(group):
+    return contextlib.nullcontext()
+
+def _start_profile(profile):
+    """
+    Normalize the 'profile' argument of compute_matrix_properties.
+    Returns the profile (or None) and whether tracemalloc was started for it.
+    """
+    if profile is True:
+        profile = PropertyProfile()
+    started_tracing = bool(profile) and profile.track_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    return profile or None, started_tracing
+
+def _finish_profile(props, profile, started_tracing):
+    if started_tracing:
+        tracemalloc.stop()
+    props = PropertyVector.from_props(props)
+    return (props, profile) if profile else props
+
+def compile_property_plan(weights):
+    """
+    Work out the minimal work compute_matrix_properties has to do for a weights dict.
+    Properties with a zero or missing weight are dropped, and so is every group
+    (and every per-row/per-column statistic) left without a weighted property.
+
+    :param weights: dictionary of property weights
+    :return: dict with "properties" (weighted names), "groups" (PROPERTY_GROUPS keys to run)
+             and "axis_stats" (needed per-row/per-column statistics such as "row_median")
+    """
+    properties = frozenset(name for name, w in weights.items() if w)
+    groups = {"basic"}
+    groups.update(group for group, names in PROPERTY_GROUPS.items() if properties.intersection(names))
+    axis_stats = {name.rsplit("_", 1)[0] for name in properties
+                  if name in PROPERTY_GROUPS["row_stats"] or name in PROPERTY_GROUPS["col_stats"]}
+    return {"properties": properties, "groups": frozenset(groups), "axis_stats": frozenset(axis_stats)}
+
+def _plan_filters(plan):
+    """(wants_group, wants_axis_stat) predicates for a plan; None means everything."""
+    if plan is None:
+        return (lambda group: True), (lambda stat: True)
+    return (lambda group: group in plan["groups"]), (lambda stat: stat in plan["axis_stats"])
+
+def _shared_cache():
+    """
+    Memo for intermediates shared by several property groups (non-zero mask,
+    coordinates, absolute values ...), computed the first time a group asks.
+    """
+    cache = {}
+    def shared(name, compute):
+        if name not in cache:
+            cache[name] = compute()
+        return cache[name]
+    return shared
+
+def compute_matrix_properties(matrix: np.ndarray, profile=None, plan=None):
+    """
+    Compute every property used by the loss.
+
+    :param matrix: dense array or scipy.sparse matrix
+    :param profile: opt-in profiling; True or a PropertyProfile to accumulate into.
+                    When given, (props, profile) is returned instead of props.
+                    Memory tracking runs tracemalloc, which slows numpy down.
+    :param plan: plan from compile_property_plan; only the properties it needs are
+                 computed and the others are left out of the result. None computes all.
+    """
+    if scipy.sparse.issparse(matrix):
+        return compute_matrix_properties_sparse(matrix, profile, plan)
+
+    profile, started_tracing = _start_profile(profile)
+    section = profile.section if profile else _no_section
+    wants, wants_stat = _plan_filters(plan)
+    shared = _shared_cache()
     props = {}
-    
+
+    def nonzero_mask():
+        return shared("nonzero_mask", lambda: matrix != 0)
+
+    def nonzero_coords():
+        return shared("nonzero_coords", lambda: np.nonzero(nonzero_mask()))
+
+    def num_unsymmetric():
+        # Entries of A without a counterpart in A^T (and vice versa), via linear position keys
+        def count():
+            i_coords, j_coords = nonzero_coords()
+            key_base = max(num_rows, num_cols)
+            return np.setxor1d(i_coords * key_base + j_coords, j_coords * key_base + i_coords).size
+        return shared("num_unsymmetric", count)
+
     # Basic dimensions
-    num_rows, num_cols = matrix.shape
-    # props["num_rows"] = num_rows
-    # props["num_cols"] = num_cols
+    with section("basic"):
+        num_rows, num_cols = matrix.shape
+        # props["num_rows"] = num_rows
+        # props["num_cols"] = num_cols
     
-    # Count nonzero elements
-    num_nonzeros = np.count_nonzero(matrix)
-    # props["num_nonzeros"] = num_nonzeros
-    total_elements = num_rows * num_cols
-    density_percent = (num_nonzeros / total_elements * 100.0) if total_elements > 0 else 0.0
-    # props["density_percent"] = density_percent
+        # Count nonzero elements
+        num_nonzeros = np.count_nonzero(matrix)
+        # props["num_nonzeros"] = num_nonzeros
+        total_elements = num_rows * num_cols
+        density_percent = (num_nonzeros / total_elements * 100.0) if total_elements > 0 else 0.0
+        # props["density_percent"] = density_percent
     
     # Symmetry checks
-    # Pattern symmetry: Compare sets of nonzero indices
-    nonzero_positions = set(zip(*np.nonzero(matrix)))
-    transpose_nonzero_positions = set(zip(*np.nonzero(matrix.T)))
-    pattern_symmetry = (nonzero_positions == transpose_nonzero_positions)
-    props["pattern_symmetry"] = pattern_symmetry
+    if wants("symmetry"):
+        with section("symmetry"):
+            # Pattern symmetry: the non-zero positions of A and A^T match
+            pattern_symmetry = num_unsymmetric() == 0
     
-    # Numerical symmetry: Check if matrix is approximately equal to its transpose
-    numerical_symmetry = np.allclose(matrix, matrix.T, atol=1e-14)
-    props["numerical_symmetry"] = numerical_symmetry
+            # Numerical symmetry: Check if matrix is approximately equal to its transpose
+            numerical_symmetry = np.allclose(matrix, matrix.T, atol=1e-14)
 
-    props["pattern_symmetry"] = 1.0 if pattern_symmetry else 0.0
-    props["numerical_symmetry"] = 1.0 if numerical_symmetry else 0.0
+            props["pattern_symmetry"] = 1.0 if pattern_symmetry else 0.0
+            props["numerical_symmetry"] = 1.0 if numerical_symmetry else 0.0
 
-    
     # Nonzeros per row
-    row_nnz = (matrix != 0).sum(axis=1)
-    props["nonzeros_per_row_min"] = row_nnz.min() if num_rows > 0 else None
-    props["nonzeros_per_row_max"] = row_nnz.max() if num_rows > 0 else None
-    props["nonzeros_per_row_avg"] = row_nnz.mean() if num_rows > 0 else None
-    props["nonzeros_per_row_std"] = row_nnz.std(ddof=1) if num_rows > 1 else None
+    if wants("nonzeros_per_row"):
+        with section("nonzeros_per_row"):
+            row_nnz = nonzero_mask().sum(axis=1)
+            props["nonzeros_per_row_min"] = row_nnz.min() if num_rows > 0 else None
+            props["nonzeros_per_row_max"] = row_nnz.max() if num_rows > 0 else None
+            props["nonzeros_per_row_avg"] = row_nnz.mean() if num_rows > 0 else None
+            props["nonzeros_per_row_std"] = row_nnz.std(ddof=1) if num_rows > 1 else None
     
     # Nonzeros per column
-    col_nnz = (matrix != 0).sum(axis=0)
-    props["nonzeros_per_col_min"] = col_nnz.min() if num_cols > 0 else None
-    props["nonzeros_per_col_max"] = col_nnz.max() if num_cols > 0 else None
-    props["nonzeros_per_col_avg"] = col_nnz.mean() if num_cols > 0 else None
-    props["nonzeros_per_col_std"] = col_nnz.std(ddof=1) if num_cols > 1 else None
+    if wants("nonzeros_per_col"):
+        with section("nonzeros_per_col"):
+            col_nnz = nonzero_mask().sum(axis=0)
+            props["nonzeros_per_col_min"] = col_nnz.min() if num_cols > 0 else None
+            props["nonzeros_per_col_max"] = col_nnz.max() if num_cols > 0 else None
+            props["nonzeros_per_col_avg"] = col_nnz.mean() if num_cols > 0 else None
+            props["nonzeros_per_col_std"] = col_nnz.std(ddof=1) if num_cols > 1 else None
     
     # Nonzero values statistics
-    nonzero_values = matrix[matrix != 0]
-    if nonzero_values.size > 0:
-        props["value_min"] = nonzero_values.min()
-        props["value_max"] = nonzero_values.max()
-        props["value_avg"] = nonzero_values.mean()
-        props["value_std"] = nonzero_values.std(ddof=1) if nonzero_values.size > 1 else 0.0
-    else:
-        props["value_min"] = None
-        props["value_max"] = None
-        props["value_avg"] = None
-        props["value_std"] = None
+    if wants("value_stats"):
+        with section("value_stats"):
+            nonzero_values = matrix[nonzero_mask()]
+            if nonzero_values.size > 0:
+                props["value_min"] = nonzero_values.min()
+                props["value_max"] = nonzero_values.max()
+                props["value_avg"] = nonzero_values.mean()
+                props["value_std"] = nonzero_values.std(ddof=1) if nonzero_values.size > 1 else 0.0
+            else:
+                props["value_min"] = None
+                props["value_max"] = None
+                props["value_avg"] = None
+                props["value_std"] = None
     
-    # Row-wise statistics
-    # Compute per-row min, max, mean, std, median
-    if num_rows > 0 and num_cols > 0:
-        row_mins = np.min(matrix, axis=1)
-        row_maxs = np.max(matrix, axis=1)
-        row_means = np.mean(matrix, axis=1)
-        row_stds = np.std(matrix, axis=1, ddof=1) if num_cols > 1 else np.zeros(num_rows)
-        row_medians = np.median(matrix, axis=1)
-        
-        # For each of these arrays, compute min, max, mean, std
-        # row_min_*
-        props["row_min_min"] = row_mins.min()
-        props["row_min_max"] = row_mins.max()
-        props["row_min_mean"] = row_mins.mean()
-        props["row_min_std"] = row_mins.std(ddof=1) if num_rows > 1 else 0.0
-        
-        # row_max_*
-        props["row_max_min"] = row_maxs.min()
-        props["row_max_max"] = row_maxs.max()
-        props["row_max_mean"] = row_maxs.mean()
-        props["row_max_std"] = row_maxs.std(ddof=1) if num_rows > 1 else 0.0
-        
-        # row_mean_*
-        props["row_mean_min"] = row_means.min()
-        props["row_mean_max"] = row_means.max()
-        props["row_mean_mean"] = row_means.mean()
-        props["row_mean_std"] = row_means.std(ddof=1) if num_rows > 1 else 0.0
-        
-        # row_std_*
-        props["row_std_min"] = row_stds.min() if row_stds.size > 0 else None
-        props["row_std_max"] = row_stds.max() if row_stds.size > 0 else None
-        props["row_std_mean"] = row_stds.mean() if row_stds.size > 0 else None
-        props["row_std_std"] = row_stds.std(ddof=1) if num_rows > 1 else 0.0
-        
-        # row_median_*
-        props["row_median_min"] = row_medians.min()
-        props["row_median_max"] = row_medians.max()
-        props["row_median_mean"] = row_medians.mean()
-        props["row_median_std"] = row_medians.std(ddof=1) if num_rows > 1 else 0.0
-    else:
-        # No rows/columns: set these to None
-        for stat in ["row_min","row_max","row_mean","row_std","row_median"]:
-            for agg in ["min","max","mean","std"]:
-                props[f"{stat}_{agg}"] = None
-    
-    # Column-wise statistics
-    if num_cols > 0 and num_rows > 0:
-        col_mins = np.min(matrix, axis=0)
-        col_maxs = np.max(matrix, axis=0)
-        col_means = np.mean(matrix, axis=0)
-        col_stds = np.std(matrix, axis=0, ddof=1) if num_rows > 1 else np.zeros(num_cols)
-        col_medians = np.median(matrix, axis=0)
-        
-        # col_min_*
-        props["col_min_min"] = col_mins.min()
-        props["col_min_max"] = col_mins.max()
-        props["col_min_mean"] = col_mins.mean()
-        props["col_min_std"] = col_mins.std(ddof=1) if num_cols > 1 else 0.0
-        
-        # col_max_*
-        props["col_max_min"] = col_maxs.min()
-        props["col_max_max"] = col_maxs.max()
-        props["col_max_mean"] = col_maxs.mean()
-        props["col_max_std"] = col_maxs.std(ddof=1) if num_cols > 1 else 0.0
-        
-        # col_mean_*
-        props["col_mean_min"] = col_means.min()
-        props["col_mean_max"] = col_means.max()
-        props["col_mean_mean"] = col_means.mean()
-        props["col_mean_std"] = col_means.std(ddof=1) if num_cols > 1 else 0.0
-        
-        # col_std_*
-        props["col_std_min"] = col_stds.min() if col_stds.size > 0 else None
-        props["col_std_max"] = col_stds.max() if col_stds.size > 0 else None
-        props["col_std_mean"] = col_stds.mean() if col_stds.size > 0 else None
-        props["col_std_std"] = col_stds.std(ddof=1) if num_cols > 1 else 0.0
-        
-        # col_median_*
-        props["col_median_min"] = col_medians.min()
-        props["col_median_max"] = col_medians.max()
-        props["col_median_mean"] = col_medians.mean()
-        props["col_median_std"] = col_medians.std(ddof=1) if num_cols > 1 else 0.0
-    else:
-        for stat in ["col_min","col_max","col_mean","col_std","col_median"]:
-            for agg in ["min","max","mean","std"]:
-                props[f"{stat}_{agg}"] = None
+    # Row-wise / column-wise statistics: min, max, mean, std and median of every
+    # row (column), each summarized by its min, max, mean and std
+    for prefix, axis, count, length in (("row", 1, num_rows, num_cols), ("col", 0, num_cols, num_rows)):
+        if not wants(f"{prefix}_stats"):
+            continue
+        with section(f"{prefix}_stats"):
+            if count > 0 and length > 0:
+                stats = [stat for stat in LINE_STATISTICS if wants_stat(f"{prefix}_{stat}")]
+                for stat, line_values in _dense_line_statistics(matrix, axis, stats).items():
+                    _aggregate_stats(line_values, f"{prefix}_{stat}", props)
+            else:
+                # No rows/columns: set these to None
+                for stat in ["min", "max", "mean", "std", "median"]:
+                    for agg in ["min", "max", "mean", "std"]:
+                        props[f"{prefix}_{stat}_{agg}"] = None
     
     # Distance to Diagonal
-    # Distances for nonzero elements
-    if num_nonzeros > 0:
-        i_coords, j_coords = np.nonzero(matrix)
-        distances = np.abs(i_coords - j_coords)
-        props["avg_distance_to_diagonal"] = distances.mean()
-        props["num_diagonals_with_nonzeros"] = len(np.unique(i_coords - j_coords))
-        # bandwidth was computed as max(|i-j|)
-        bandwidth = distances.max() if distances.size > 0 else 0
-    else:
-        props["avg_distance_to_diagonal"] = None
-        props["num_diagonals_with_nonzeros"] = 0
-        bandwidth = 0
-    props["bandwidth"] = bandwidth
+    if wants("distance_to_diagonal"):
+        with section("distance_to_diagonal"):
+            # Distances for nonzero elements
+            if num_nonzeros > 0:
+                i_coords, j_coords = nonzero_coords()
+                distances = np.abs(i_coords - j_coords)
+                props["avg_distance_to_diagonal"] = distances.mean()
+                props["num_diagonals_with_nonzeros"] = len(np.unique(i_coords - j_coords))
+                # bandwidth was computed as max(|i-j|)
+                bandwidth = distances.max() if distances.size > 0 else 0
+            else:
+                props["avg_distance_to_diagonal"] = None
+                props["num_diagonals_with_nonzeros"] = 0
+                bandwidth = 0
+            props["bandwidth"] = bandwidth
     
     # Structural Unsymmetry
-    # Count how many entries do not have a symmetric counterpart
-    # We define structural unsymmetry as the number of indices in A but not in A^T, plus vice versa.
-    # Actually, since pattern_symmetry checks equality, we can measure the difference:
-    diff_1 = nonzero_positions - transpose_nonzero_positions
-    diff_2 = transpose_nonzero_positions - nonzero_positions
-    num_structurally_unsymmetric_elements = len(diff_1.union(diff_2))
-    props["num_structurally_unsymmetric_elements"] = num_structurally_unsymmetric_elements
+    if wants("structural_unsymmetry"):
+        with section("structural_unsymmetry"):
+            # Number of indices in A but not in A^T, plus vice versa
+            props["num_structurally_unsymmetric_elements"] = num_unsymmetric()
     
     # Norms
-    # 1-norm: max absolute column sum
-    norm_1 = np.linalg.norm(matrix, 1) if total_elements > 0 else None
-    props["norm_1"] = norm_1
-    
-    # Infinity norm: max absolute row sum
-    # numpy doesn't have a direct norm_inf for 2D. 
-    # Infinity norm can be computed as max over rows of sum of absolute values:
-    if total_elements > 0:
-        norm_inf = np.max(np.sum(np.abs(matrix), axis=1))
-    else:
-        norm_inf = None
-    props["norm_inf"] = norm_inf
+    if wants("norms"):
+        with section("norms"):
+            abs_matrix = np.abs(matrix) if total_elements > 0 else None
+            # 1-norm: max absolute column sum
+            props["norm_1"] = abs_matrix.sum(axis=0).max() if total_elements > 0 else None
+    
+            # Infinity norm: max absolute row sum
+            props["norm_inf"] = abs_matrix.sum(axis=1).max() if total_elements > 0 else None
     
-    # Frobenius norm
-    fro_norm = np.linalg.norm(matrix, 'fro')
-    props["frobenius_norm"] = fro_norm
+            # Frobenius norm
+            props["frobenius_norm"] = np.linalg.norm(matrix, 'fro')
     
     # Condition number (1-norm)
-    # Can fail if matrix is singular. We'll catch and return None if that happens.
-    try:
-        estimated_condition_number = float(np.linalg.cond(matrix, 1))
-    except np.linalg.LinAlgError:
-        estimated_condition_number = None
-    props["estimated_condition_number"] = estimated_condition_number
+    if wants("condition_number"):
+        with section("condition_number"):
+            # Can fail if matrix is singular. We'll catch and return None if that happens.
+            try:
+                estimated_condition_number = float(np.linalg.cond(matrix, 1))
+            except np.linalg.LinAlgError:
+                estimated_condition_number = None
+            props["estimated_condition_number"] = estimated_condition_number
     
-    return props
+    return _finish_profile(props, profile, started_tracing)
+
+def _aggregate_stats(values, prefix, props):
+    """Store min/max/mean/std (ddof=1) of a per-row or per-column statistic."""
+    props[f"{prefix}_min"] = values.min()
+    props[f"{prefix}_max"] = values.max()
+    props[f"{prefix}_mean"] = values.mean()
+    props[f"{prefix}_std"] = values.std(ddof=1) if values.size > 1 else 0.0
+
+def _dense_line_statistics(matrix, axis, stats=LINE_STATISTICS):
+    """The requested LINE_STATISTICS of every row (axis=1) or column (axis=0) of a dense matrix."""
+    length = matrix.shape[axis]
+    per_axis = {
+        "min": lambda: np.min(matrix, axis=axis),
+        "max": lambda: np.max(matrix, axis=axis),
+        "mean": lambda: np.mean(matrix, axis=axis),
+        "std": lambda: np.std(matrix, axis=axis, ddof=1) if length > 1 else np.zeros(matrix.shape[1 - axis]),
+        "median": lambda: np.median(matrix, axis=axis),
+    }
+    return {stat: per_axis[stat]() for stat in stats}
+
+def _sparse_line_statistics(compressed, axis, stats=LINE_STATISTICS):
+    """
+    The requested LINE_STATISTICS of every row (axis=1, CSR input) or column
+    (axis=0, CSC input) of a sparse matrix, counting implicit zeros.
+    """
+    length = compressed.shape[axis]
+    count = compressed.shape[1 - axis]
+    sums = np.asarray(compressed.sum(axis=axis)).ravel() if {"mean", "std"} & set(stats) else None
+
+    def stds():
+        if length <= 1:
+            return np.zeros(count)
+        squares = np.asarray(compressed.multiply(compressed).sum(axis=axis)).ravel()
+        means = sums / length
+        return np.sqrt(np.maximum(squares - length * means ** 2, 0.0) / (length - 1))
+
+    def medians():
+        # Medians work on rows, so columns use the transposed CSC arrays
+        as_rows = compressed if axis == 1 else scipy.sparse.csr_matrix(
+            (compressed.data, compressed.indices, compressed.indptr), shape=(count, length))
+        return _sparse_axis_medians(as_rows, length)
+
+    per_axis = {
+        "min": lambda: np.asarray(compressed.min(axis=axis).todense()).ravel(),
+        "max": lambda: np.asarray(compressed.max(axis=axis).todense()).ravel(),
+        "mean": lambda: sums / length,
+        "std": stds,
+        "median": medians,
+    }
+    return {stat: per_axis[stat]() for stat in stats}
+
+def _sparse_axis_medians(csr, length):
+    """
+    Median of every row of a CSR matrix, counting its implicit zeros, where
+    'length' is the full row length. Runs in O(nnz log nnz).
+    """
+    num_rows = csr.shape[0]
+    counts = np.diff(csr.indptr)
+    row_ids = np.repeat(np.arange(num_rows), counts)
+    # Sort values inside each row
+    order = np.lexsort((csr.data, row_ids))
+    sorted_data = csr.data[order]
+    negatives = np.bincount(row_ids[sorted_data < 0], minlength=num_rows)
+    zeros = length - counts
+
+    def value_at(position):
+        # Full sorted row = negatives, then implicit zeros, then positives
+        in_negatives = position < negatives
+        in_positives = position >= negatives + zeros
+        index = csr.indptr[:-1] + np.where(in_positives, position - zeros, position)
+        index = np.clip(index, 0, max(sorted_data.size - 1, 0))
+        stored = sorted_data[index] if sorted_data.size else np.zeros(num_rows)
+        return np.where(in_negatives | in_positives, stored, 0.0)
 
-def compute_property_loss(original_props: dict, new_props: dict, weights: dict):
+    return 0.5 * (value_at(np.full(num_rows, (length - 1) // 2)) + value_at(np.full(num_rows, length // 2)))
+
+def compute_matrix_properties_sparse(matrix, profile=None, plan=None):
+    """
+    Same properties as 'compute_matrix_properties' for a scipy.sparse matrix,
+    computed without ever forming the dense array.
+    Row/column statistics still count the implicit zeros, like the dense version.
+    """
+    profile, started_tracing = _start_profile(profile)
+    section = profile.section if profile else _no_section
+    wants, wants_stat = _plan_filters(plan)
+    shared = _shared_cache()
+    props = {}
+
+    def csc():
+        return shared("csc", csr.tocsc)
+
+    def coordinates():
+        def compute():
+            coo = csr.tocoo()
+            return coo.row.astype(np.int64), coo.col.astype(np.int64)
+        return shared("coordinates", compute)
+
+    def num_unsymmetric():
+        # Entries of A without a counterpart in A^T, via linear position keys
+        def count():
+            i_coords, j_coords = coordinates()
+            key_base = max(num_rows, num_cols)
+            return np.setxor1d(i_coords * key_base + j_coords, j_coords * key_base + i_coords).size
+        return shared("num_unsymmetric", count)
+
+    with section("basic"):
+        # Copied, since a float64 CSR input would otherwise share the arrays cleaned up below
+        csr = scipy.sparse.csr_matrix(matrix, dtype=np.float64, copy=True)
+        csr.sum_duplicates()
+        csr.eliminate_zeros()
+        num_rows, num_cols = csr.shape
+        num_nonzeros = csr.nnz
+        # CSR keeps its values in the same row-major order as tocoo()
+        values = csr.data
+
+    if wants("symmetry"):
+        with section("symmetry"):
+            props["pattern_symmetry"] = 1.0 if num_unsymmetric() == 0 else 0.0
+            numerical_symmetry = False
+            if num_rows == num_cols:
+                # Same test as np.allclose(A, A.T, atol=1e-14) with its default rtol
+                difference = abs(csr - csr.T) - 1e-5 * abs(csr.T)
+                numerical_symmetry = difference.nnz == 0 or difference.max() <= 1e-14
+            props["numerical_symmetry"] = 1.0 if numerical_symmetry else 0.0
+
+    # Nonzeros per row / column
+    if wants("nonzeros_per_row"):
+        with section("nonzeros_per_row"):
+            row_nnz = np.diff(csr.indptr)
+            props["nonzeros_per_row_min"] = row_nnz.min() if num_rows > 0 else None
+            props["nonzeros_per_row_max"] = row_nnz.max() if num_rows > 0 else None
+            props["nonzeros_per_row_avg"] = row_nnz.mean() if num_rows > 0 else None
+            props["nonzeros_per_row_std"] = row_nnz.std(ddof=1) if num_rows > 1 else None
+
+    if wants("nonzeros_per_col"):
+        with section("nonzeros_per_col"):
+            col_nnz = np.diff(csc().indptr)
+            props["nonzeros_per_col_min"] = col_nnz.min() if num_cols > 0 else None
+            props["nonzeros_per_col_max"] = col_nnz.max() if num_cols > 0 else None
+            props["nonzeros_per_col_avg"] = col_nnz.mean() if num_cols > 0 else None
+            props["nonzeros_per_col_std"] = col_nnz.std(ddof=1) if num_cols > 1 else None
+
+    # Nonzero values statistics
+    if wants("value_stats"):
+        with section("value_stats"):
+            if values.size > 0:
+                props["value_min"] = values.min()
+                props["value_max"] = values.max()
+                props["value_avg"] = values.mean()
+                props["value_std"] = values.std(ddof=1) if values.size > 1 else 0.0
+            else:
+                for stat in ["value_min", "value_max", "value_avg", "value_std"]:
+                    props[stat] = None
+
+    # Row-wise / column-wise statistics, counting implicit zeros
+    for prefix, length, count in (("row", num_cols, num_rows), ("col", num_rows, num_cols)):
+        if not wants(f"{prefix}_stats"):
+            continue
+        with section(f"{prefix}_stats"):
+            if count > 0 and length > 0:
+                axis = 1 if prefix == "row" else 0
+                stats = [stat for stat in LINE_STATISTICS if wants_stat(f"{prefix}_{stat}")]
+                compressed = csr if prefix == "row" else csc()
+                for stat, line_values in _sparse_line_statistics(compressed, axis, stats).items():
+                    _aggregate_stats(line_values, f"{prefix}_{stat}", props)
+            else:
+                for stat in ["min", "max", "mean", "std", "median"]:
+                    for agg in ["min", "max", "mean", "std"]:
+                        props[f"{prefix}_{stat}_{agg}"] = None
+
+    # Distance to Diagonal
+    if wants("distance_to_diagonal"):
+        with section("distance_to_diagonal"):
+            if num_nonzeros > 0:
+                i_coords, j_coords = coordinates()
+                offsets = i_coords - j_coords
+                distances = np.abs(offsets)
+                props["avg_distance_to_diagonal"] = distances.mean()
+                props["num_diagonals_with_nonzeros"] = len(np.unique(offsets))
+                bandwidth = distances.max()
+            else:
+                props["avg_distance_to_diagonal"] = None
+                props["num_diagonals_with_nonzeros"] = 0
+                bandwidth = 0
+            props["bandwidth"] = bandwidth
+
+    if wants("structural_unsymmetry"):
+        with section("structural_unsymmetry"):
+            props["num_structurally_unsymmetric_elements"] = num_unsymmetric()
+
+    # Norms
+    if wants("norms"):
+        with section("norms"):
+            total_elements = num_rows * num_cols
+            abs_csr = abs(csr)
+            props["norm_1"] = np.asarray(abs_csr.sum(axis=0)).max() if total_elements > 0 else None
+            props["norm_inf"] = np.asarray(abs_csr.sum(axis=1)).max() if total_elements > 0 else None
+            props["frobenius_norm"] = np.sqrt(np.sum(values ** 2))
+
+    # Condition number (1-norm), estimated from a sparse LU factorization
+    if wants("condition_number"):
+        with section("condition_number"):
+            props["estimated_condition_number"] = estimate_condition_number_sparse(csc())
+
+    return _finish_profile(props, profile, started_tracing)
+
+def estimate_condition_number_sparse(matrix):
+    """
+    Estimate the 1-norm condition number ||A||_1 * ||A^-1||_1 of a sparse matrix
+    without forming the inverse. ||A^-1||_1 comes from Hager/Higham's block
+    estimator, which is exact for small matrices and a lower bound otherwise.
+    Returns inf for singular and None for non-square matrices, matching the dense path.
+    """
+    num_rows, num_cols = matrix.shape
+    if num_rows != num_cols or num_rows == 0:
+        return None
+    csc = scipy.sparse.csc_matrix(matrix)
+    try:
+        lu = scipy.sparse.linalg.splu(csc)
+    except RuntimeError:
+        return float("inf")
+    inverse = scipy.sparse.linalg.LinearOperator(
+        csc.shape,
+        matvec=lu.solve,
+        rmatvec=lambda x: lu.solve(x, trans="T"),
+        dtype=np.float64
+    )
+    norm_1 = np.asarray(abs(csc).sum(axis=0)).max()
+    return float(norm_1 * scipy.sparse.linalg.onenormest(inverse, t=CONDITION_ESTIMATE_COLUMNS))
+
+def estimate_matrix_properties(matrix, sample_size=APPROXIMATE_SAMPLE_SIZE, confidence=0.95, plan=None, seed=None):
+    """
+    Approximate the properties from a random sample of whole rows and whole columns.
+
+    Per-row/per-column statistics (and non-zeros per row/column) are aggregated
+    over the sampled lines; value statistics, the distance to the diagonal and the
+    Frobenius norm are ratio or total estimates over the entries of the sampled
+    rows. Dense input costs O(sample_size * (rows + cols)) instead of O(rows * cols).
+
+    Means, totals and spreads get a normal-approximation confidence interval with
+    the finite population correction, so they are exact when the sample covers
+    the matrix. A sampled minimum or maximum only bounds the true one from one
+    side, so its interval is open on the other side. Symmetry, structural
+    unsymmetry, the number of diagonals and the condition number can't be
+    estimated from a sample and are left missing; losses between two estimates
+    then ignore them.
+
+    :param matrix: dense array or scipy.sparse matrix
+    :param sample_size: rows and columns sampled (without replacement)
+    :param confidence: confidence level of the intervals
+    :param plan: plan from compile_property_plan (None estimates everything)
+    :param seed: seed of the sample
+    :return: (PropertyVector of estimates, dict of property name -> (low, high))
+    """
+    wants, wants_stat = _plan_filters(plan)
+    rng = np.random.default_rng(seed)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    sparse = scipy.sparse.issparse(matrix)
+    if sparse:
+        matrix = scipy.sparse.csr_matrix(matrix, dtype=np.float64, copy=True)
+        matrix.sum_duplicates()
+        matrix.eliminate_zeros()
+    num_rows, num_cols = matrix.shape
+    row_index = np.sort(rng.choice(num_rows, min(sample_size, num_rows), replace=False))
+    col_index = np.sort(rng.choice(num_cols, min(sample_size, num_cols), replace=False))
+    props = {}
+    intervals = {}
+
+    # Aggregates over whole lines, estimated from the statistics of the sampled lines
+    for prefix, index, population, axis in (("row", row_index, num_rows, 1), ("col", col_index, num_cols, 0)):
+        stats = [stat for stat in LINE_STATISTICS if wants_stat(f"{prefix}_{stat}")] if wants(f"{prefix}_stats") else []
+        counts_wanted = wants(f"nonzeros_per_{prefix}")
+        column_norm = prefix == "col" and wants("norms")
+        if not (stats or counts_wanted or column_norm) or index.size == 0:
+            continue
+        block = matrix[index] if prefix == "row" else matrix[:, index]
+        if sparse:
+            block = block.tocsr() if prefix == "row" else block.tocsc()
+            lines = _sparse_line_statistics(block, axis, stats)
+            line_counts = np.diff(block.indptr)
+        else:
+            lines = _dense_line_statistics(block, axis, stats)
+            line_counts = np.count_nonzero(block, axis=axis)
+        for stat, line_values in lines.items():
+            _estimate_line_aggregates(line_values, f"{prefix}_{stat}", "mean", population, z, props, intervals)
+        if counts_wanted:
+            _estimate_line_aggregates(line_counts, f"nonzeros_per_{prefix}", "avg", population, z, props, intervals)
+        if column_norm:
+            col_sums = np.asarray(abs(block).sum(axis=0)).ravel()
+            _sampled_extreme(props, intervals, "norm_1", col_sums.max(), index.size == population)
+
+    # Entry statistics as ratios over the sampled rows
+    entry_groups = [group for group in ("value_stats", "distance_to_diagonal", "norms") if wants(group)]
+    if entry_groups and row_index.size > 0:
+        sample = row_index.size
+        exhaustive = sample == num_rows
+        correction = np.sqrt(1 - sample / num_rows)
+        block = matrix[row_index]
+        if sparse:
+            coo = block.tocoo()
+            local_rows, cols, values = coo.row, coo.col, coo.data
+        else:
+            local_rows, cols = np.nonzero(block)
+            values = block[local_rows, cols]
+        def per_row(entry_values=None):
+            # Sum of the entry values (or count of entries) of every sampled row
+            return np.bincount(local_rows, weights=entry_values, minlength=sample)
+
+        counts = per_row()
+
+        def ratio(totals):
+            # Ratio estimator sum(totals) / sum(counts) with its linearized standard error
+            estimate = totals.sum() / counts.sum()
+            residuals = totals - estimate * counts
+            spread = residuals.std(ddof=1) if sample > 1 else np.inf
+            return estimate, z * correction * spread / (np.sqrt(sample) * counts.mean())
+
+        if "value_stats" in entry_groups and values.size > 0:
+            mean, mean_half = ratio(per_row(values))
+            props["value_avg"], intervals["value_avg"] = mean, (mean - mean_half, mean + mean_half)
+            square_mean, _ = ratio(per_row(values ** 2))
+            std = np.sqrt(max(square_mean - mean ** 2, 0.0))
+            # Values of one row are correlated, so count rows rather than entries
+            std_half = z * correction * _std_standard_error(values, std, np.count_nonzero(counts))
+            props["value_std"], intervals["value_std"] = std, (max(std - std_half, 0.0), std + std_half)
+            _sampled_extreme(props, intervals, "value_min", values.min(), exhaustive, maximum=False)
+            _sampled_extreme(props, intervals, "value_max", values.max(), exhaustive)
+
+        if "distance_to_diagonal" in entry_groups and values.size > 0:
+            distances = np.abs(row_index[local_rows] - cols)
+            mean, half = ratio(per_row(distances))
+            props["avg_distance_to_diagonal"] = mean
+            intervals["avg_distance_to_diagonal"] = (max(mean - half, 0.0), mean + half)
+            _sampled_extreme(props, intervals, "bandwidth", distances.max(), exhaustive,
+                             limit=max(num_rows, num_cols) - 1)
+
+        if "norms" in entry_groups:
+            squares = per_row(values ** 2)
+            total = num_rows * squares.mean()
+            half = z * correction * num_rows * (squares.std(ddof=1) if sample > 1 else np.inf) / np.sqrt(sample)
+            props["frobenius_norm"] = np.sqrt(total)
+            intervals["frobenius_norm"] = (np.sqrt(max(total - half, 0.0)), np.sqrt(total + half))
+            _sampled_extreme(props, intervals, "norm_inf", per_row(np.abs(values)).max(), exhaustive)
+
+    return PropertyVector.from_props(props), intervals
+
+def _std_standard_error(values, std, count):
+    """Standard error of a standard deviation estimated from 'count' observations, corrected for kurtosis."""
+    if count < 2 or std == 0:
+        return 0.0 if std == 0 else np.inf
+    kurtosis = np.mean((values - values.mean()) ** 4) / std ** 4
+    return std * np.sqrt(max(kurtosis - (count - 3) / (count - 1), 0.0) / (4 * count))
+
+def _estimate_line_aggregates(line_values, prefix, mean_suffix, population, z, props, intervals):
+    """
+    Store min/max/mean/std (ddof=1) of a per-line statistic measured on a sample
+    of 'population' lines, with their confidence intervals.
+    """
+    sample = line_values.size
+    exhaustive = sample == population
+    correction = np.sqrt(1 - sample / population)
+    mean = line_values.mean()
+    std = line_values.std(ddof=1) if sample > 1 else 0.0
+    _sampled_extreme(props, intervals, f"{prefix}_min", line_values.min(), exhaustive, maximum=False)
+    _sampled_extreme(props, intervals, f"{prefix}_max", line_values.max(), exhaustive)
+
+    mean_half = z * correction * std / np.sqrt(sample) if sample > 1 or exhaustive else np.inf
+    props[f"{prefix}_{mean_suffix}"] = mean
+    intervals[f"{prefix}_{mean_suffix}"] = (mean - mean_half, mean + mean_half)
+    std_half = z * correction * _std_standard_error(line_values, std, sample) if not exhaustive else 0.0
+    props[f"{prefix}_std"] = std
+    intervals[f"{prefix}_std"] = (max(std - std_half, 0.0), std + std_half)
+
+def _sampled_extreme(props, intervals, name, value, exhaustive, maximum=True, limit=np.inf):
+    """
+    Store a sampled maximum (or minimum), which only bounds the true one from
+    below (above); 'limit' is the largest value the maximum can take.
+    """
+    props[name] = value
+    if exhaustive:
+        intervals[name] = (value, value)
+    elif maximum:
+        intervals[name] = (value, limit)
+    else:
+        intervals[name] = (-np.inf, value)
+
+def compute_property_loss(original_props, new_props, weights):
     """
     Compute total property-based loss between original and new matrix properties.
-    We use a simple squared difference for each property, weighted by 'weights'.
+    We use the absolute difference of each property, weighted by 'weights'.
+
+    :param original_props: PropertyVector or props dict of the reference matrix
+    :param new_props: PropertyVector or props dict of the candidate
+    :param weights: weights dict, or the array from weight_vector(weights)
+    :return: the loss as a float; properties with a zero weight are ignored and a
+             property missing on both sides counts as equal
+    """
+    return float(compute_population_loss(original_props, [new_props], weights)[0])
+
+def compute_population_loss(original_props, population, weights):
+    """
+    Loss of every candidate of a population in one matrix-vector product.
+
+    :param original_props: PropertyVector or props dict of the reference matrix
+    :param population: list of PropertyVectors / props dicts, or a (candidates x properties) array
+    :param weights: weights dict, or the array from weight_vector(weights)
+    :return: array with one loss per candidate
+    """
+    w = weight_vector(weights)
+    return _weighted_differences(original_props, population, w) @ w
+
+def loss_contributions(original_props, new_props, weights):
+    """
+    Weighted loss term of every property, in PROPERTY_KEYS order; they sum to
+    compute_property_loss.
+    """
+    w = weight_vector(weights)
+    return _weighted_differences(original_props, [new_props], w)[0] * w
+
+def population_loss_parts(original_props, population, weights):
     """
+    Loss of every candidate split into its number of infinite terms and the sum of
+    its finite terms, so two infinite losses can still be compared: fewer infinite
+    terms is better, and on a tie the smaller finite part is.
+
+    :return: (array of infinite term counts, array of finite losses), one entry per candidate
+    """
+    w = weight_vector(weights)
+    terms = _weighted_differences(original_props, population, w) * w
+    infinite = np.isinf(terms)
+    return infinite.sum(axis=1), np.where(infinite, 0.0, terms).sum(axis=1)
+
+# Property groups of cascade_score by increasing cost: O(nnz) pattern and value
+# statistics first, then the passes over (a transpose of) the whole matrix, the
+# per-row/per-column statistics with their medians, and the condition number last
+CASCADE_TIERS = [
+    ["nonzeros_per_row", "nonzeros_per_col", "value_stats", "distance_to_diagonal"],
+    ["symmetry", "structural_unsymmetry", "norms"],
+    ["row_stats", "col_stats"],
+    ["condition_number"],
+]
+
+def restrict_plan(plan, groups):
+    """The part of a plan (None meaning everything) that belongs to the given property groups."""
+    if plan is None:
+        plan = compile_property_plan(dict.fromkeys(PROPERTY_KEYS, 1))
+    names = frozenset(name for group in groups for name in PROPERTY_GROUPS[group])
+    return {
+        "properties": plan["properties"] & names,
+        "groups": plan["groups"] & (frozenset(groups) | {"basic"}),
+        "axis_stats": frozenset(stat for stat in plan["axis_stats"]
+                                if stat.split("_", 1)[0] + "_stats" in groups)
+    }
+
+def cascade_score(matrix, original_props, weights, threshold=np.inf, plan=None, profile=None, tiers=CASCADE_TIERS):
+    """
+    Score a candidate by computing its properties one tier at a time, cheapest
+    first, and stop as soon as the loss of the tiers done so far exceeds the
+    threshold. Every loss term is non-negative for non-negative weights, so that
+    partial loss is a lower bound on the full one and a stopped candidate would
+    have been rejected anyway.
+
+    :param matrix: dense array or scipy.sparse matrix
+    :param original_props: PropertyVector or props dict of the reference matrix
+    :param weights: weights dict, or the array from weight_vector(weights)
+    :param threshold: loss above which the candidate is rejected, e.g. the current best
+    :param plan: plan from compile_property_plan (None computes everything)
+    :param profile: PropertyProfile to accumulate the property timings into
+    :return: (loss, props, complete); when complete is False the candidate was
+             rejected early, loss is the lower bound that exceeded the threshold and
+             props only holds the tiers computed so far
+    """
+    w = weight_vector(weights)
+    props = PropertyVector()
+    computed = np.zeros(len(PROPERTY_KEYS), dtype=bool)
     loss = 0.0
-    for prop_name, w in weights.items():
-        orig_val = original_props[prop_name]
-        new_val  = new_props[prop_name]
-        diff = np.abs(orig_val - new_val)
-        loss += w * diff
-    return loss
+    for tier in tiers:
+        tier_plan = restrict_plan(plan, tier)
+        if not tier_plan["properties"]:
+            continue
+        if profile:
+            tier_props, _ = compute_matrix_properties(matrix, profile=profile, plan=tier_plan)
+        else:
+            tier_props = compute_matrix_properties(matrix, plan=tier_plan)
+        tier_indices = [PROPERTY_INDEX[name] for group in tier for name in PROPERTY_GROUPS[group]]
+        props.values[tier_indices] = tier_props.values[tier_indices]
+        computed[tier_indices] = True
+        loss = float(loss_contributions(original_props, props, w)[computed].sum())
+        if loss > threshold:
+            return loss, props, False
+    return loss, props, True
+
+def _weighted_differences(original_props, population, w):
+    """|original - candidate| per candidate and property, zeroed where the weight is 0."""
+    original = PropertyVector.from_props(original_props).values
+    if isinstance(population, np.ndarray):
+        candidates = np.atleast_2d(population)
+    else:
+        candidates = np.vstack([PropertyVector.from_props(props).values for props in population])
+    diff = np.abs(candidates - original)
+    diff[np.isnan(candidates) & np.isnan(original)] = 0.0
+    diff[:, w == 0] = 0.0
+    return diff
 
 def perturb_matrix(matrix_to_perturbed):
     """
@@ -327,6 +984,9 @@ def perturb_matrix(matrix_to_perturbed):
        - Perturb all other non-zero elements by assigning random values 
          between the previously found global min and max.
     """
+    if scipy.sparse.issparse(matrix_to_perturbed):
+        return perturb_matrix_sparse(matrix_to_perturbed)
+
     # Copy the matrix so we don't modify the original
     perturbed_matrix = matrix_to_perturbed.copy()
     
@@ -357,3 +1017,28 @@ def perturb_matrix(matrix_to_perturbed):
     
     return perturbed_matrix
 
+
+
+def perturb_matrix_sparse(matrix_to_perturbed):
+    """
+    Same perturbation as 'perturb_matrix' for a scipy.sparse matrix, done on the
+    CSR data array in one vectorized pass.
+    """
+    perturbed_matrix = scipy.sparse.csr_matrix(matrix_to_perturbed, dtype=np.float64, copy=True)
+    perturbed_matrix.eliminate_zeros()
+    perturbed_matrix.sort_indices()
+    if perturbed_matrix.nnz == 0:
+        return perturbed_matrix
+
+    min_val = np.min(perturbed_matrix.data)
+    max_val = np.max(perturbed_matrix.data)
+
+    # Middle non-zero of every non-empty row is preserved
+    counts = np.diff(perturbed_matrix.indptr)
+    non_empty = counts > 0
+    middle_positions = perturbed_matrix.indptr[:-1][non_empty] + counts[non_empty] // 2
+    perturb_mask = np.ones(perturbed_matrix.nnz, dtype=bool)
+    perturb_mask[middle_positions] = False
+
+    perturbed_matrix.data[perturb_mask] = np.random.randint(min_val, max_val + 1, perturb_mask.sum())
+    return perturbed_matrix
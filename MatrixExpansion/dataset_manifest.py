@@ -0,0 +1,117 @@
+"""
+Manifest of a generated dataset, for incremental regeneration.
+
+The manifest (MANIFEST_NAME in the output directory) records, for every output
+file, the recipe it was generated from and the checksum of the file. The recipe
+holds a hash of the source matrix, the generation parameters, the seed and the
+version of the generation code. A rerun regenerates only the outputs that are
+stale: the recipe changed, or the file is missing or fails its checksum.
+
+The manifest is rewritten after every output, so a run that crashes halfway
+keeps everything it finished.
+"""
+import hashlib
+import importlib
+import json
+import os
+
+import numpy as np
+import scipy.sparse
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Modules whose source decides what create_matrix generates; editing one makes every output stale
+GENERATOR_MODULES = ["dynamic_matrix_expansion"]
+
+HASH_CHUNK_BYTES = 1 << 20
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def matrix_sha256(matrix):
+    """
+    SHA-256 of the content of a dense or sparse matrix: its shape and its
+    non-zeros in CSR order, so the same matrix hashes the same whatever its
+    storage or file formatting.
+    """
+    csr = scipy.sparse.csr_matrix(matrix, dtype=np.float64, copy=True)
+    csr.sum_duplicates()
+    csr.eliminate_zeros()
+    digest = hashlib.sha256(np.asarray(csr.shape, dtype=np.int64).tobytes())
+    for array in (csr.indptr.astype(np.int64), csr.indices.astype(np.int64), csr.data):
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+def code_version(modules=GENERATOR_MODULES):
+    """
+    Short hash of the source files of the generation code.
+
+    :param modules: names of the modules producing the outputs
+    """
+    digest = hashlib.sha256()
+    for name in modules:
+        with open(importlib.import_module(name).__file__, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+def output_seed(base_seed, index):
+    """Seed of output 'index' of a dataset generated with 'base_seed', independent of the other outputs."""
+    return int(np.random.SeedSequence([base_seed, index]).generate_state(1)[0])
+
+class DatasetManifest:
+    """
+    Recipes and checksums of the outputs of one output directory.
+
+    :param directory: output directory holding the manifest and the outputs
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.outputs = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as file:
+                    manifest = json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {self.path}: {e}")
+                return
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.outputs = manifest.get("outputs", {})
+
+    def entry(self, name):
+        return self.outputs.get(name)
+
+    def is_current(self, name, recipe):
+        """
+        Whether output 'name' was generated from 'recipe' and its file is intact.
+
+        :param recipe: dict of JSON values, e.g. source_sha256, parameters, seed and code_version
+        """
+        entry = self.outputs.get(name)
+        if entry is None or any(entry.get(key) != value for key, value in _as_json(recipe).items()):
+            return False
+        path = os.path.join(self.directory, name)
+        return os.path.exists(path) and file_sha256(path) == entry.get("sha256")
+
+    def record(self, name, recipe, **extra):
+        """Record the recipe and checksum of output 'name', which must already be written, and save."""
+        path = os.path.join(self.directory, name)
+        self.outputs[name] = {**_as_json(recipe), **_as_json(extra), "sha256": file_sha256(path)}
+        self.save()
+
+    def save(self):
+        """Write the manifest atomically, so a crash never leaves it half written."""
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({"version": MANIFEST_VERSION, "outputs": self.outputs}, file, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+def _as_json(values):
+    """Values as they read back from JSON (tuples become lists, numpy scalars plain numbers)."""
+    return json.loads(json.dumps(values, default=lambda value: value.item()))
@@ -1,4 +1,5 @@
 import scipy.io
+import scipy.sparse
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -11,30 +12,101 @@ def load_matrix(file_path):
         print("Error loading the matrix:", e)
         return None
 
-def scale_original_matrix(original_matrix, desired_rows, desired_cols):
+# How 'scale_original_matrix' merges non-zeros that land on the same cell
+COLLISION_POLICIES = ["last", "sum", "max", "mean"]
+
+def get_nonzero_entries(matrix):
+    """Row indices, column indices and values of the non-zeros of a dense or sparse matrix, in row-major order."""
+    if scipy.sparse.issparse(matrix):
+        csr = scipy.sparse.csr_matrix(matrix)
+        csr.sum_duplicates()
+        coo = csr.tocoo()
+        mask = coo.data != 0
+        return coo.row[mask].astype(np.int64), coo.col[mask].astype(np.int64), coo.data[mask]
+    rows, cols = np.nonzero(matrix)
+    return rows.astype(np.int64), cols.astype(np.int64), matrix[rows, cols]
+
+def pool_by_key(keys, values, policy):
+    """
+    Merge values sharing a key.
+
+    Parameters:
+    - keys: integer key of every value.
+    - values: the values, in the order they would be written.
+    - policy: "last" (last written wins), "sum", "max", "mean" or "max_abs" (largest
+      magnitude with its sign, the positive value on ties).
+
+    Returns:
+    - (unique_keys, pooled_values), sorted by key.
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_values = values[order]
+    if sorted_keys.size == 0:
+        return sorted_keys, sorted_values
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    ends = np.r_[starts[1:], sorted_keys.size]
+
+    if policy == "last":
+        pooled = sorted_values[ends - 1]
+    elif policy == "sum":
+        pooled = np.add.reduceat(sorted_values, starts)
+    elif policy == "max":
+        pooled = np.maximum.reduceat(sorted_values, starts)
+    elif policy == "mean":
+        pooled = np.add.reduceat(sorted_values, starts) / (ends - starts)
+    elif policy == "max_abs":
+        # The largest magnitude is either the maximum or the minimum; ties keep the positive one
+        highs = np.maximum.reduceat(sorted_values, starts)
+        lows = np.minimum.reduceat(sorted_values, starts)
+        pooled = np.where(highs >= -lows, highs, lows)
+    else:
+        raise ValueError(f"Unknown collision policy: {policy}")
+    return sorted_keys[starts], pooled
+
+def scale_original_matrix(original_matrix, desired_rows, desired_cols, collision="last"):
     """
     Scale the original matrix to the desired dimensions similarly to 'expand_matrix'
     but without the jitter or extra density. This produces a 'reference scaled matrix'.
-    """
-    scaled_matrix = np.zeros((desired_rows, desired_cols))
-    non_zero_positions = np.argwhere(original_matrix != 0)
-    non_zero_values = original_matrix[original_matrix != 0]
 
+    Built in one shot from the index arrays in O(nnz), so the result is cheap enough
+    to keep around as the reference for loss computations.
+
+    Parameters:
+    - original_matrix: dense array or scipy.sparse matrix.
+    - desired_rows, desired_cols: dimensions of the reference.
+    - collision: how non-zeros landing on the same cell are merged, one of
+      COLLISION_POLICIES; "last" matches the old element-by-element placement.
+
+    Returns:
+    - scipy.sparse.csr_matrix of shape (desired_rows, desired_cols).
+    """
+    if collision not in COLLISION_POLICIES:
+        raise ValueError(f"Unknown collision policy: {collision}")
+    rows, cols, values = get_nonzero_entries(original_matrix)
     row_scale = desired_rows / original_matrix.shape[0]
     col_scale = desired_cols / original_matrix.shape[1]
 
-    for i, (row, col) in enumerate(non_zero_positions):
-        new_row = int(row * row_scale)
-        new_col = int(col * col_scale)
-        
-        # Clamp to bounds
-        new_row = min(max(new_row, 0), desired_rows - 1)
-        new_col = min(max(new_col, 0), desired_cols - 1)
-        
-        scaled_matrix[new_row, new_col] = non_zero_values[i]
-    
+    # Scaled positions, clamped to the bounds (same rounding as expand_matrix)
+    new_rows = np.clip((rows * row_scale).astype(np.int64), 0, desired_rows - 1)
+    new_cols = np.clip((cols * col_scale).astype(np.int64), 0, desired_cols - 1)
+
+    keys, pooled = pool_by_key(new_rows * desired_cols + new_cols, values, collision)
+    scaled_matrix = scipy.sparse.csr_matrix(
+        (pooled, (keys // desired_cols, keys % desired_cols)), shape=(desired_rows, desired_cols)
+    )
+    # A sum or mean can cancel to zero
+    scaled_matrix.eliminate_zeros()
     return scaled_matrix
 
+def load_matrix_sparse(file_path):
+    """Load a matrix from a .mtx file as a CSR matrix without densifying it."""
+    try:
+        return scipy.sparse.csr_matrix(scipy.io.mmread(file_path))
+    except Exception as e:
+        print("Error loading the matrix:", e)
+        return None
+
 def get_desired_dimensions():
     """Get desired dimensions from the user."""
     try:
@@ -98,6 +170,232 @@ def expand_matrix(original_matrix, desired_rows, desired_cols, additional_densit
     
     return expanded_matrix
 
+def expand_matrix_sparse(original_matrix, desired_rows, desired_cols, additional_density):
+    """
+    Sparse counterpart of 'expand_matrix' that never allocates a dense output.
+    
+    Original non-zeros are placed at their scaled positions (a later one wins on
+    collision), then 'additional_density' jittered non-zeros are added around each
+    of them without overwriting an occupied cell.
+    
+    Parameters:
+    - original_matrix: The input matrix (dense array or scipy.sparse matrix).
+    - desired_rows: Number of rows in the expanded matrix.
+    - desired_cols: Number of columns in the expanded matrix.
+    - additional_density: Number of new non-zeros to add around each scaled position.
+    
+    Returns:
+    - expanded_matrix: scipy.sparse.csr_matrix with the expanded pattern.
+    """
+    if scipy.sparse.issparse(original_matrix):
+        coo = original_matrix.tocoo()
+        mask = coo.data != 0
+        rows, cols, non_zero_values = coo.row[mask], coo.col[mask], coo.data[mask]
+    else:
+        rows, cols = np.nonzero(original_matrix)
+        non_zero_values = original_matrix[rows, cols]
+    
+    if non_zero_values.size == 0:
+        return scipy.sparse.csr_matrix((desired_rows, desired_cols))
+    
+    min_value = non_zero_values.min()
+    max_value = non_zero_values.max()
+    
+    row_scale = desired_rows / original_matrix.shape[0]
+    col_scale = desired_cols / original_matrix.shape[1]
+    
+    new_rows = np.clip((rows * row_scale).astype(np.int64), 0, desired_rows - 1)
+    new_cols = np.clip((cols * col_scale).astype(np.int64), 0, desired_cols - 1)
+    
+    # Originals: keep the last value written to each cell
+    keys = new_rows * desired_cols + new_cols
+    unique_keys, original_values = pool_by_key(keys, non_zero_values, "last")
+    
+    # Jitter: additional_density draws in [-3, 3] around every placed original
+    num_jitter = keys.size * additional_density
+    jittered_rows = np.clip(np.repeat(new_rows, additional_density) + np.random.randint(-3, 4, num_jitter), 0, desired_rows - 1)
+    jittered_cols = np.clip(np.repeat(new_cols, additional_density) + np.random.randint(-3, 4, num_jitter), 0, desired_cols - 1)
+    jitter_keys = jittered_rows * desired_cols + jittered_cols
+    jitter_keys = np.unique(jitter_keys)
+    free = ~np.isin(jitter_keys, unique_keys, assume_unique=True)
+    jitter_keys = jitter_keys[free]
+    jitter_values = np.random.uniform(min_value, max_value, jitter_keys.size)
+    
+    all_keys = np.concatenate([unique_keys, jitter_keys])
+    all_values = np.concatenate([original_values, jitter_values])
+    expanded_matrix = scipy.sparse.csr_matrix(
+        (all_values, (all_keys // desired_cols, all_keys % desired_cols)),
+        shape=(desired_rows, desired_cols)
+    )
+    expanded_matrix.sort_indices()
+    return expanded_matrix
+
+
+# Value pooling of 'coarsen_matrix' for the original non-zeros merged into one cell
+COARSEN_POOLING = ["sum", "mean", "max_abs", "pattern"]
+
+def restriction_operator(original_size, desired_size):
+    """
+    Sparse 0/1 operator of shape (desired_size, original_size) mapping every
+    original index i to the coarse index int(i * desired_size / original_size).
+    """
+    return scipy.sparse.csr_matrix(
+        (np.ones(original_size), (_coarse_indices(original_size, desired_size), np.arange(original_size))),
+        shape=(desired_size, original_size)
+    )
+
+def _coarse_indices(original_size, desired_size):
+    return np.minimum((np.arange(original_size) * (desired_size / original_size)).astype(np.int64),
+                      desired_size - 1)
+
+def coarsen_matrix(original_matrix, desired_rows, desired_cols, pooling="mean"):
+    """
+    Downscale a matrix by merging blocks of rows and columns, computed as R * A * C^T
+    with the restriction operators R and C, in O(nnz) time and memory.
+
+    Parameters:
+    - original_matrix: dense array or scipy.sparse matrix, at least as large as the target.
+    - desired_rows, desired_cols: dimensions of the coarse matrix.
+    - pooling: "sum" of the merged values, their "mean" (over the merged non-zeros),
+      the value of largest magnitude ("max_abs"), or "pattern" (1 wherever any
+      original non-zero was merged).
+
+    Returns:
+    - scipy.sparse.csr_matrix of shape (desired_rows, desired_cols).
+    """
+    if pooling not in COARSEN_POOLING:
+        raise ValueError(f"Unknown pooling: {pooling}")
+    csr = scipy.sparse.csr_matrix(original_matrix, dtype=np.float64, copy=True)
+    csr.sum_duplicates()
+    csr.eliminate_zeros()
+    if pooling == "max_abs":
+        # Not a linear operation, so merge the mapped entries directly
+        rows, cols, values = get_nonzero_entries(csr)
+        keys = (_coarse_indices(csr.shape[0], desired_rows)[rows] * desired_cols
+                + _coarse_indices(csr.shape[1], desired_cols)[cols])
+        keys, pooled = pool_by_key(keys, values, "max_abs")
+        coarse = scipy.sparse.csr_matrix((pooled, (keys // desired_cols, keys % desired_cols)),
+                                         shape=(desired_rows, desired_cols))
+        coarse.sort_indices()
+        return coarse
+
+    row_restriction = restriction_operator(csr.shape[0], desired_rows)
+    col_restriction = restriction_operator(csr.shape[1], desired_cols)
+    pattern = csr.copy()
+    pattern.data[:] = 1.0
+    counts = (row_restriction @ pattern @ col_restriction.T).tocsr()
+    counts.sort_indices()
+    if pooling == "pattern":
+        counts.data[:] = 1.0
+        return counts
+
+    sums = (row_restriction @ csr @ col_restriction.T).tocsr()
+    if pooling == "mean":
+        sums = sums.multiply(counts.power(-1)).tocsr()
+    # Merged values can cancel to zero
+    sums.eliminate_zeros()
+    sums.sort_indices()
+    return sums
+
+# Pattern blocks P of 'expand_matrix_kronecker'
+KRONECKER_PATTERNS = ["identity", "tridiagonal", "full"]
+
+def kronecker_pattern(factor_rows, factor_cols, kind="tridiagonal"):
+    """
+    Pattern block P of shape (factor_rows, factor_cols) with ones on its non-zeros.
+
+    Parameters:
+    - kind: "identity" (one copy per diagonal position, keeps the original sparsity),
+      "tridiagonal" (couples neighbouring copies, like a refined FEM mesh) or "full".
+    """
+    if kind == "identity":
+        return scipy.sparse.eye(factor_rows, factor_cols, format="csr")
+    if kind == "tridiagonal":
+        return scipy.sparse.diags([1.0, 1.0, 1.0], [-1, 0, 1], shape=(factor_rows, factor_cols), format="csr")
+    if kind == "full":
+        return scipy.sparse.csr_matrix(np.ones((factor_rows, factor_cols)))
+    raise ValueError(f"Unknown Kronecker pattern: {kind}")
+
+def expand_matrix_kronecker(original_matrix, desired_rows, desired_cols, pattern="tridiagonal", noise=0.0):
+    """
+    Expand a matrix by an integer factor as the Kronecker product A (x) P, so every
+    original non-zero becomes a copy of the pattern block P scaled by its value.
+    This keeps the block structure of FEM matrices (e.g. bcsstk11/16) instead of
+    scattering jitter around scaled positions.
+
+    Parameters:
+    - original_matrix: dense array or scipy.sparse matrix.
+    - desired_rows, desired_cols: integer multiples of the original dimensions.
+    - pattern: name from KRONECKER_PATTERNS, or a (factor_rows, factor_cols) array or sparse matrix.
+    - noise: relative value noise; every value is multiplied by 1 + uniform(-noise, noise).
+
+    Returns:
+    - scipy.sparse.csr_matrix with nnz(A) * nnz(P) non-zeros.
+    """
+    original_rows, original_cols = original_matrix.shape
+    if desired_rows % original_rows or desired_cols % original_cols:
+        raise ValueError(
+            f"Kronecker expansion needs integer factors, but {original_rows}x{original_cols} "
+            f"does not divide {desired_rows}x{desired_cols}."
+        )
+    factor_rows, factor_cols = desired_rows // original_rows, desired_cols // original_cols
+
+    if isinstance(pattern, str):
+        block = kronecker_pattern(factor_rows, factor_cols, pattern)
+    else:
+        block = scipy.sparse.csr_matrix(pattern, dtype=np.float64)
+        if block.shape != (factor_rows, factor_cols):
+            raise ValueError(f"Pattern block must be {factor_rows}x{factor_cols}, got {block.shape[0]}x{block.shape[1]}.")
+
+    csr = scipy.sparse.csr_matrix(original_matrix, dtype=np.float64, copy=True)
+    csr.eliminate_zeros()
+    expanded_matrix = scipy.sparse.kron(csr, block, format="csr")
+    if noise > 0:
+        expanded_matrix.data *= 1.0 + np.random.uniform(-noise, noise, expanded_matrix.nnz)
+    expanded_matrix.eliminate_zeros()
+    expanded_matrix.sort_indices()
+    return expanded_matrix
+
+def is_downscale(original_shape, desired_rows, desired_cols):
+    """True when the target is nowhere larger than the original and smaller in at least one dimension."""
+    return (desired_rows <= original_shape[0] and desired_cols <= original_shape[1]
+            and (desired_rows, desired_cols) != tuple(original_shape))
+
+def create_matrix(original_matrix, desired_rows, desired_cols, additional_density, engine="dense",
+                  mode="auto", pooling="mean", pattern="tridiagonal", noise=0.0):
+    """
+    Create one matrix of the desired size from the original.
+
+    Parameters:
+    - original_matrix: dense array or scipy.sparse matrix.
+    - desired_rows, desired_cols: dimensions of the result.
+    - additional_density: jittered non-zeros added per placed non-zero.
+    - engine: "dense" or "sparse"; the result is a dense array or a CSR matrix accordingly.
+    - mode: "expand" (expand_matrix), "coarsen" (coarsen_matrix, then jitter at the same
+      size), "kronecker" (expand_matrix_kronecker, then jitter at the same size) or
+      "auto", which coarsens when the target is a downscale and expands otherwise.
+    - pooling: value pooling of the coarsen mode.
+    - pattern, noise: pattern block and relative value noise of the kronecker mode.
+
+    Returns:
+    - The created matrix.
+    """
+    if mode == "auto":
+        mode = "coarsen" if is_downscale(original_matrix.shape, desired_rows, desired_cols) else "expand"
+
+    if mode in ("coarsen", "kronecker"):
+        if mode == "coarsen":
+            created = coarsen_matrix(original_matrix, desired_rows, desired_cols, pooling)
+        else:
+            created = expand_matrix_kronecker(original_matrix, desired_rows, desired_cols, pattern, noise)
+        if additional_density > 0:
+            created = expand_matrix_sparse(created, desired_rows, desired_cols, additional_density)
+        return created.toarray() if engine == "dense" else created
+    if mode == "expand":
+        if engine == "sparse":
+            return expand_matrix_sparse(original_matrix, desired_rows, desired_cols, additional_density)
+        return expand_matrix(original_matrix, desired_rows, desired_cols, additional_density)
+    raise ValueError(f"Unknown mode: {mode}")
 
 def display_matrices(original_matrix, expanded_matrix):
     """Display the original and expanded matrices' sparsity patterns side by side and show non-zero counts."""
@@ -123,23 +421,24 @@ def display_matrices(original_matrix, expanded_matrix):
     plt.show()
 
 
-# Example usage
-file_path = "/Users/fako/Desktop/Grad/MatrixExpansion/685_bus.mtx"
-original_matrix = load_matrix(file_path)
+if __name__ == "__main__":
+    # Example usage
+    file_path = "/Users/fako/Desktop/Grad/MatrixExpansion/685_bus.mtx"
+    original_matrix = load_matrix(file_path)
 
-if original_matrix is not None:
-    print("Original matrix loaded successfully.")
-    print("Shape of original matrix:", original_matrix.shape)
+    if original_matrix is not None:
+        print("Original matrix loaded successfully.")
+        print("Shape of original matrix:", original_matrix.shape)
     
-    desired_rows, desired_cols, additional_density = get_desired_dimensions()
-    if desired_rows and desired_cols:
-        print(f"Desired dimensions: {desired_rows}x{desired_cols}")
-        expanded_matrix = expand_matrix(original_matrix, desired_rows, desired_cols, additional_density)
-        print("Expanded matrix created successfully.")
+        desired_rows, desired_cols, additional_density = get_desired_dimensions()
+        if desired_rows and desired_cols:
+            print(f"Desired dimensions: {desired_rows}x{desired_cols}")
+            expanded_matrix = expand_matrix(original_matrix, desired_rows, desired_cols, additional_density)
+            print("Expanded matrix created successfully.")
         
-        # Display both matrices side by side
-        # display_matrices(original_matrix, expanded_matrix)
+            # Display both matrices side by side
+            # display_matrices(original_matrix, expanded_matrix)
+        else:
+            print("Failed to get valid dimensions.")
     else:
-        print("Failed to get valid dimensions.")
-else:
-    print("Failed to load the matrix.")
\ No newline at end of file
+        print("Failed to load the matrix.")
\ No newline at end of file
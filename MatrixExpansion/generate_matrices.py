@@ -1,9 +1,18 @@
-from dynamic_matrix_expansion import load_matrix, expand_matrix, display_matrices
+from dynamic_matrix_expansion import load_matrix, load_matrix_sparse, create_matrix, display_matrices
 from scipy.sparse import csr_matrix
 import scipy.io
 import numpy as np
+import hashlib
+import heapq
+import json
 import os
-from compute_loss import compute_matrix_properties, compute_property_loss, perturb_matrix, weights
+from compute_loss import (compute_matrix_properties, compute_property_loss, compute_population_loss, compile_property_plan,
+                          weight_vector, perturb_matrix, weights, PropertyProfile, PropertyVector, cascade_score,
+                          population_loss_parts)
+from perturbation_moves import targeted_move
+from pattern_statistics import PatternState
+from memory_planner import read_mtx_size, plan_job, describe_plan
+from dataset_manifest import DatasetManifest, matrix_sha256, code_version, output_seed
 
 def get_desired_informations():
     """Get desired information from the user."""
@@ -17,33 +26,137 @@ def get_desired_informations():
         print("Invalid input. Please enter integers.")
         return None, None, None, None
     
-def generate_multiple_matrices(original_matrix, desired_rows, desired_cols, desired_density, desired_num):
-    original_props = compute_matrix_properties(original_matrix)
+def iter_generated_matrices(original_matrix, desired_rows, desired_cols, desired_density, desired_num,
+                            output_directory="generated-matrices", engine="dense", mode="auto",
+                            seed=None, incremental=True):
+    """
+    Generate matrices one at a time, saving each before it is yielded, so that
+    nothing but the current matrix has to stay in memory.
 
-    loss_values = []
-    generated_matrices = []
+    With incremental set, the output directory keeps a dataset_manifest.DatasetManifest
+    and outputs that are still up to date are loaded instead of regenerated; they
+    are yielded with None properties and the loss recorded in the manifest.
+
+    :param output_directory: where the .mtx files are written, or None to skip writing
+    :param seed: base seed; output i is generated from dataset_manifest.output_seed(seed, i).
+                 None reuses the seeds recorded in the manifest and draws new ones from
+                 np.random for the outputs it doesn't know
+    :param incremental: skip the outputs whose recipe and file are unchanged
+    :return: iterator of (index, matrix, properties, loss) with 0-based indices
+    """
+    # Only the properties carrying weight in the loss are computed
+    plan = compile_property_plan(weights)
+    original_props = compute_matrix_properties(original_matrix, plan=plan)
+
+    manifest = None
+    if output_directory is not None and incremental:
+        manifest = DatasetManifest(output_directory)
+        source_hash = matrix_sha256(original_matrix)
+        version = code_version()
+        parameters = {"rows": desired_rows, "cols": desired_cols, "density": desired_density,
+                      "engine": engine, "mode": mode}
+        weights_hash = hashlib.sha256(json.dumps(weights, sort_keys=True).encode()).hexdigest()[:16]
 
     for i in range(desired_num):
+        name = f"expanded_matrix_{i+1}.mtx"
+        save_path = f"{output_directory}/{name}"
+
+        if manifest is not None:
+            entry = manifest.entry(name)
+            if seed is not None:
+                matrix_seed = output_seed(seed, i)
+            elif entry is not None:
+                matrix_seed = entry["seed"]
+            else:
+                matrix_seed = int(np.random.randint(2 ** 31))
+            recipe = {"source_sha256": source_hash, "parameters": parameters,
+                      "seed": matrix_seed, "code_version": version}
+
+            if manifest.is_current(name, recipe):
+                expanded_matrix = load_matrix_sparse(save_path) if engine == "sparse" else load_matrix(save_path)
+                if expanded_matrix is not None:
+                    new_props = None
+                    if entry.get("weights_sha256") != weights_hash:
+                        # Same matrix, different loss weights: only the loss is stale
+                        new_props = compute_matrix_properties(expanded_matrix, plan=plan)
+                        loss_val = compute_property_loss(original_props, new_props, weights)
+                        manifest.record(name, recipe, loss=loss_val, weights_sha256=weights_hash)
+                    else:
+                        loss_val = entry["loss"]
+                    print(f"Matrix {i+1} is up to date in {save_path}, loss = {loss_val:.1f}")
+                    yield i, expanded_matrix, new_props, loss_val
+                    continue
+            np.random.seed(matrix_seed)
+        elif seed is not None:
+            np.random.seed(output_seed(seed, i))
+
         print(f"Generating matrix {i+1}/{desired_num}...")
         
-        # Expand the matrix
-        expanded_matrix = expand_matrix(original_matrix, desired_rows, desired_cols, desired_density)
-        generated_matrices.append(expanded_matrix)
+        # Expand the matrix (or coarsen it when the target is smaller)
+        expanded_matrix = create_matrix(original_matrix, desired_rows, desired_cols, desired_density,
+                                        engine=engine, mode=mode)
 
         # Compute the newly created matrix properties
-        new_props = compute_matrix_properties(expanded_matrix)
+        new_props = compute_matrix_properties(expanded_matrix, plan=plan)
 
         # Compute property-based loss
         loss_val = compute_property_loss(original_props, new_props, weights)
-        loss_values.append(loss_val)
-
         print(f"Loss for matrix {i+1} = {loss_val:.1f}")
         
-        # Save the generated matrices in .mtx format
-        save_path = f"{output_directory}/expanded_matrix_{i+1}.mtx"
-        scipy.io.mmwrite(save_path, csr_matrix(expanded_matrix))
-        
-        print(f"Matrix {i+1} saved to {save_path}")
+        # Save the generated matrices in .mtx format; the file only appears once complete
+        if output_directory is not None:
+            temporary_path = save_path + ".tmp"
+            with open(temporary_path, "wb") as file:
+                scipy.io.mmwrite(file, csr_matrix(expanded_matrix))
+            os.replace(temporary_path, save_path)
+            if manifest is not None:
+                manifest.record(name, recipe, loss=loss_val, weights_sha256=weights_hash)
+            print(f"Matrix {i+1} saved to {save_path}")
+
+        yield i, expanded_matrix, new_props, loss_val
+
+def keep_best(generated, k):
+    """
+    Consume (index, matrix, properties, loss) tuples keeping only the k with the
+    lowest loss in memory (the earlier one on ties); the others are dropped as
+    soon as they are beaten.
+
+    :return: list of the kept tuples sorted by loss, and the list of all losses in order
+    """
+    # Max-heap on loss through negated keys; the indices are unique, so matrices are never compared
+    heap = []
+    loss_values = []
+    for index, matrix, props, loss_val in generated:
+        loss_values.append(loss_val)
+        entry = (-loss_val, -index, matrix, props)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+    best = sorted(heap, key=lambda entry: (-entry[0], -entry[1]))
+    return [(-index, matrix, props, -loss_val) for loss_val, index, matrix, props in best], loss_values
+
+def generate_multiple_matrices(original_matrix, desired_rows, desired_cols, desired_density, desired_num,
+                               output_directory="generated-matrices", engine="dense", mode="auto", keep=None,
+                               seed=None, incremental=True):
+    """
+    Generate and save desired_num matrices; see iter_generated_matrices for seed and incremental.
+
+    :param keep: number of matrices kept in memory, the ones with the lowest loss;
+                 None keeps all of them in generation order
+    :return: (kept matrices, losses of all generated matrices in generation order)
+    """
+    generated = iter_generated_matrices(original_matrix, desired_rows, desired_cols, desired_density, desired_num,
+                                        output_directory, engine, mode, seed, incremental)
+    if keep is None:
+        generated_matrices = []
+        loss_values = []
+        for _, expanded_matrix, _, loss_val in generated:
+            generated_matrices.append(expanded_matrix)
+            loss_values.append(loss_val)
+    else:
+        best, loss_values = keep_best(generated, keep)
+        generated_matrices = [matrix for _, matrix, _, _ in best]
 
     # Summarize best matrix
     best_idx = np.argmin(loss_values)
@@ -55,7 +168,10 @@ def generate_multiple_matrices(original_matrix, desired_rows, desired_cols, desi
 def optimize_multiple_matrices(original_matrix,
                                init_matrices,  # list of generated matrices
                                weights,
-                               max_iters=50):
+                               max_iters=50,
+                               profile=False,
+                               moves="targeted",
+                               cascade=True):
     """
     Minimizes the sum of property-based losses for all matrices simultaneously.
     local_search style / coordinate descent approach.
@@ -64,7 +180,13 @@ def optimize_multiple_matrices(original_matrix,
     :param init_matrices: list of 10 numpy arrays (expanded matrices)
     :param weights: dictionary of property weights
     :param max_iters: number of local search iterations
-    :return: a list of optimized matrices (10 of them)
+    :param profile: time every property group over the whole run and print the breakdown
+    :param moves: "targeted" aims every perturbation at a property dominating the matrix's loss
+                  (see perturbation_moves), including structural moves that insert, delete
+                  or relocate non-zeros; "random" always uses perturb_matrix
+    :param cascade: score perturbed matrices with cascade_score, so a move is rejected as
+                    soon as its cheapest properties already make it worse
+    :return: a list of optimized matrices (10 of them), plus the PropertyProfile if profile is set
     """
     import copy
     import numpy as np
@@ -73,77 +195,143 @@ def optimize_multiple_matrices(original_matrix,
     matrices = [copy.deepcopy(mat) for mat in init_matrices]
     # matrices = init_matrices
     
-    # Precompute original properties once
-    orig_props = compute_matrix_properties(original_matrix)
+    # Precompute original properties once, limited to the weighted ones
+    plan = compile_property_plan(weights)
+    orig_props = compute_matrix_properties(original_matrix, plan=plan)
+    weight_values = weight_vector(weights)
+    property_profile = PropertyProfile() if profile else None
     
-    # Helper to compute the total cost
-    def total_loss(matrices_list):
-        loss_sum = 0.0
-        for mat in matrices_list:
-            mat_props = compute_matrix_properties(mat)
-            loss_sum += compute_property_loss(orig_props, mat_props, weights)
-        return loss_sum
+    # Helper to compute the property vector of one matrix
+    def properties_of(mat):
+        if property_profile:
+            mat_props, _ = compute_matrix_properties(mat, profile=property_profile, plan=plan)
+        else:
+            mat_props = compute_matrix_properties(mat, plan=plan)
+        return mat_props.values
     
-    current_loss = total_loss(matrices)
+    # One row of properties per matrix; a perturbation only recomputes its own row
+    population = np.vstack([properties_of(mat) for mat in matrices])
+    # Proposed and accepted count of every move type
+    move_stats = {}
+    # Incremental pattern statistics of every matrix, built on first use and kept in sync by the move ops
+    pattern_states = [None] * len(matrices)
+    current_loss = compute_population_loss(orig_props, population, weight_values).sum()
+
+    # Moves are compared on (infinite terms, finite loss), so they still have to improve
+    # the finite part while some matrix is singular and the total loss is inf
+    def loss_key():
+        infinite, finite = population_loss_parts(orig_props, population, weight_values)
+        return int(infinite.sum()), float(finite.sum())
+
+    current_key = loss_key()
     
     for iteration in range(max_iters):
         # pick one matrix index at random
         k = np.random.randint(len(matrices))
         
-        # small perturbation to the chosen matrix
-        old_matrix = copy.deepcopy(matrices[k])
-        old_loss = current_loss
+        # small perturbation to the chosen matrix (perturb_matrix returns a copy)
+        old_matrix = matrices[k]
+        old_row = population[k].copy()
+        old_key = current_key
         
         # Change matrix proeprties hoping that it reduces loss
-        matrices[k] = perturb_matrix(matrices[k])
+        if moves == "targeted":
+            if pattern_states[k] is None:
+                pattern_states[k] = PatternState(matrices[k])
+            matrices[k], move, ops = targeted_move(matrices[k], orig_props, PropertyVector(old_row), weight_values,
+                                                   pattern_state=pattern_states[k])
+        else:
+            matrices[k], move, ops = perturb_matrix(matrices[k]), "random", []
+        move_stats.setdefault(move, [0, 0])[0] += 1
+        if cascade:
+            # Only row k changes, so the move loses as soon as row k is worse than before
+            old_row_loss = compute_population_loss(orig_props, old_row, weight_values)[0]
+            _, new_props, complete = cascade_score(matrices[k], orig_props, weight_values, old_row_loss,
+                                                   plan=plan, profile=property_profile)
+            population[k] = new_props.values
+        else:
+            population[k] = properties_of(matrices[k])
+            complete = True
         
         # compute new total loss
-        new_loss = total_loss(matrices)
+        new_key = loss_key() if complete else None
         
-        if new_loss > old_loss:
+        if not complete or new_key > old_key:
             # revert if no improvement
             matrices[k] = old_matrix
+            population[k] = old_row
+            if ops:
+                pattern_states[k].undo(ops)
         else:
-            current_loss = new_loss
+            current_key = new_key
+            current_loss = compute_population_loss(orig_props, population, weight_values).sum()
+            move_stats[move][1] += 1
         
 # if (iteration+1) % 500 == 0:
         print(f"Iter {iteration+1}, current loss = {current_loss:.1f}")
     
+    print("Accepted moves: " + ", ".join(f"{move} {accepted}/{proposed}"
+                                         for move, (proposed, accepted) in sorted(move_stats.items())))
+    if property_profile:
+        print(property_profile.report(weights))
+        return matrices, property_profile
     return matrices
 
 
-# File paths
-file_path = "original-matrices/685_bus.mtx"
-output_directory = "generated-matrices"
+if __name__ == "__main__":
+    # File paths
+    file_path = "original-matrices/685_bus.mtx"
+    output_directory = "generated-matrices"
+    memory_budget = None  # Bytes; None uses half of the physical memory
+    keep = None  # Number of best matrices kept in memory for the optimization; None keeps all
+    seed = None  # Base seed of the outputs; None reuses the seeds recorded in the output manifest
 
-# Ensure the output directory exists
-os.makedirs(output_directory, exist_ok=True)
+    # Ensure the output directory exists
+    os.makedirs(output_directory, exist_ok=True)
 
-# Load the original matrix
-original_matrix = load_matrix(file_path)
+    source_rows, source_cols, source_nnz = read_mtx_size(file_path)
+    print(f"Original matrix: {source_rows}x{source_cols}, {source_nnz} non-zeros")
 
-if original_matrix is not None:
-    print("Original matrix loaded successfully.")
-    print("Shape of original matrix:", original_matrix.shape)
-    
     # Get user inputs
     desired_rows, desired_cols, desired_density, num_matrices = get_desired_informations()
-    
+
     if all(v is not None for v in [desired_rows, desired_cols, desired_density, num_matrices]):
         print(f"Desired dimensions: {desired_rows}x{desired_cols}, Density: {desired_density}, Matrices: {num_matrices}")
-        
-        # Generate the matrices
-        generated_matrices, loss_values = generate_multiple_matrices(original_matrix, desired_rows, desired_cols, desired_density, num_matrices)
 
-        print("Optimizing generated matrices properties ...")
+        # Check the job fits in memory before allocating anything
+        try:
+            plan = plan_job((source_rows, source_cols), source_nnz, desired_rows, desired_cols, desired_density,
+                            memory_budget=memory_budget)
+        except MemoryError as e:
+            print(f"Refusing to start: {e}")
+            plan = None
+
+        if plan is not None:
+            print(describe_plan(plan))
+
+            # Load the original matrix
+            if plan["engine"] == "sparse":
+                original_matrix = load_matrix_sparse(file_path)
+            else:
+                original_matrix = load_matrix(file_path)
+
+            if original_matrix is not None:
+                print("Original matrix loaded successfully.")
+
+                # Generate the matrices
+                generated_matrices, loss_values = generate_multiple_matrices(
+                    original_matrix, desired_rows, desired_cols, desired_density, num_matrices,
+                    output_directory, engine=plan["engine"], keep=keep, seed=seed
+                )
 
-        # Optimize matrices
-        optimized_matrices = optimize_multiple_matrices(original_matrix, generated_matrices, weights, max_iters=5000)
+                print("Optimizing generated matrices properties ...")
 
+                # Optimize matrices
+                optimized_matrices = optimize_multiple_matrices(original_matrix, generated_matrices, weights, max_iters=5000)
+            else:
+                print("Failed to load the matrix.")
     else:
         print("Failed to get valid dimensions or inputs.")
-else:
-    print("Failed to load the matrix.")
 
 """
 Iter 120, current loss = 414832.4
@@ -0,0 +1,78 @@
+"""
+Sinkhorn-style diagonal scaling of sparse matrices.
+
+Replaces the row/column balancing loop of the old 'scale_matrix': the scaled
+matrix is D_r * A * D_c, and both diagonals are updated from row and column
+sums computed with bincount over the CSR arrays, so no iteration loops over
+rows or transposes the matrix.
+"""
+import numpy as np
+import scipy.sparse
+
+from dynamic_matrix_expansion import scale_original_matrix
+
+def balance_matrix(matrix, tol=1e-4, max_iters=100, stall_tol=1e-8, return_scaling=False):
+    """
+    Scale rows and columns so that every non-empty row and column of |A| sums to 1.
+
+    Each iteration divides the rows and the columns by the square root of their
+    current sums, like the old scale_matrix. Unlike the old routine, which used
+    the signed sums and took square roots of negative sums on matrices with
+    negative entries (685_bus, arc130, bcsstk11, bcsstk16, epb1), this balances
+    |A|: the results only agree on non-negative matrices.
+
+    :param matrix: scipy.sparse matrix or dense array
+    :param tol: stop when every row and column sum is within tol of 1
+    :param max_iters: maximum number of iterations
+    :param stall_tol: stop when the largest deviation changes by less than this
+                      (relative), e.g. for patterns that can't be balanced
+    :param return_scaling: also return the row and column scaling vectors
+    :return: balanced CSR matrix, or (matrix, row_scaling, col_scaling, iterations)
+    """
+    csr = scipy.sparse.csr_matrix(matrix, dtype=np.float64, copy=True)
+    csr.sum_duplicates()
+    num_rows, num_cols = csr.shape
+    row_ids = np.repeat(np.arange(num_rows), np.diff(csr.indptr))
+    col_ids = csr.indices
+    magnitudes = np.abs(csr.data)
+
+    row_scaling = np.ones(num_rows)
+    col_scaling = np.ones(num_cols)
+    previous_deviation = np.inf
+    iterations = 0
+    for iterations in range(1, max_iters + 1):
+        scaled = magnitudes * row_scaling[row_ids] * col_scaling[col_ids]
+        row_sums = np.bincount(row_ids, weights=scaled, minlength=num_rows)
+        col_sums = np.bincount(col_ids, weights=scaled, minlength=num_cols)
+
+        # Empty rows and columns keep a factor of 1
+        row_has_entries = row_sums > 0
+        col_has_entries = col_sums > 0
+        row_scaling[row_has_entries] /= np.sqrt(row_sums[row_has_entries])
+        col_scaling[col_has_entries] /= np.sqrt(col_sums[col_has_entries])
+
+        # Convergence is judged on the sums before this iteration's update
+        deviation = max(np.abs(row_sums[row_has_entries] - 1).max(initial=0.0),
+                        np.abs(col_sums[col_has_entries] - 1).max(initial=0.0))
+        if deviation < tol or abs(previous_deviation - deviation) < stall_tol * previous_deviation:
+            break
+        previous_deviation = deviation
+
+    csr.data *= row_scaling[row_ids] * col_scaling[col_ids]
+    if return_scaling:
+        return csr, row_scaling, col_scaling, iterations
+    return csr
+
+def scale_matrix(matrix, desired_rows, desired_cols, tol=1e-4, max_iters=100):
+    """
+    Resize a matrix to the desired dimensions with scale_original_matrix, then
+    balance its row and column sums with balance_matrix.
+    When several entries land on the same position the last one wins, as in the old version.
+
+    :param matrix: scipy.sparse matrix or dense array
+    :param desired_rows: rows of the result
+    :param desired_cols: columns of the result
+    :return: scaled and balanced CSR matrix
+    """
+    resized = scale_original_matrix(matrix, desired_rows, desired_cols, collision="last")
+    return balance_matrix(resized, tol=tol, max_iters=max_iters)
@@ -0,0 +1,283 @@
+"""
+Peak memory and run time estimates for the generation pipeline, used to pick the
+dense or sparse code path before any large allocation happens.
+
+The estimates are deliberately coarse (within a small factor); their purpose is
+to refuse jobs that can't fit and to pick the cheaper engine, not to predict
+exact numbers.
+"""
+import os
+
+import numpy as np
+
+BYTES_PER_VALUE = 8
+# COO triplet (value, row, col) plus CSR/sort scratch space per stored non-zero
+BYTES_PER_SPARSE_ENTRY = 40
+
+# Dense buffers alive at once while computing properties:
+# the matrix, a boolean mask, abs()/median copies and a per-axis reduction
+DENSE_PROPERTY_COPIES = 4
+# The dense 1-norm condition number holds the matrix, its LU factors and its inverse
+DENSE_CONDITION_COPIES = 3
+# Fill-in factor assumed for the sparse LU used by the condition estimate
+SPARSE_LU_FILL = 20
+
+# Rough throughputs of the vectorized kernels on one core
+DENSE_VALUES_PER_SECOND = 2e8
+SPARSE_ENTRIES_PER_SECOND = 1e7
+DENSE_FLOPS_PER_SECOND = 5e9
+# Python-level loop over original non-zeros in the dense expand_matrix
+DENSE_EXPAND_ENTRIES_PER_SECOND = 2e5
+# mmwrite/mmread text throughput
+MTX_ENTRIES_PER_SECOND = 1e6
+
+STAGES = ["load", "expand", "properties", "condition_number", "write"]
+
+# Target rows per band of the streaming engine (see streaming_expansion)
+STREAMING_BAND_ROWS = 65536
+# Source rows per jitter stream of the streaming engine; a band draws at most two extra chunks
+STREAMING_CHUNK_ROWS = 4096
+
+def get_default_memory_budget():
+    """Half of the physical memory in bytes, or None if it can't be determined."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def read_mtx_size(file_path):
+    """
+    Read (rows, cols, nnz) from the header of a .mtx file without loading it.
+    For symmetric files the stored triangle is mirrored, so nnz is doubled.
+    """
+    with open(file_path, "r") as file:
+        banner = file.readline().lower().split()
+        for line in file:
+            if not line.startswith("%") and line.strip():
+                size = [int(token) for token in line.split()]
+                break
+        else:
+            raise ValueError(f"No size line found in {file_path}")
+    rows, cols = size[0], size[1]
+    nnz = size[2] if len(size) > 2 else rows * cols
+    if len(banner) > 4 and banner[4] in ("symmetric", "skew-symmetric", "hermitian"):
+        nnz *= 2
+    return rows, cols, nnz
+
+def estimate_output_nonzeros(source_nnz, desired_rows, desired_cols, additional_density):
+    """Upper estimate of the non-zero count produced by expand_matrix."""
+    return min(source_nnz * (1 + additional_density), desired_rows * desired_cols)
+
+def kronecker_pattern_nonzeros(factor_rows, factor_cols, pattern="tridiagonal"):
+    """Non-zeros of the Kronecker pattern block P, named as in dynamic_matrix_expansion.kronecker_pattern or given."""
+    if pattern == "identity":
+        return min(factor_rows, factor_cols)
+    if pattern == "tridiagonal":
+        # Lengths of the diagonals -1, 0 and 1
+        return sum(max(0, min(factor_rows + min(offset, 0), factor_cols - max(offset, 0))) for offset in (-1, 0, 1))
+    if pattern == "full":
+        return factor_rows * factor_cols
+    if isinstance(pattern, str):
+        raise ValueError(f"Unknown Kronecker pattern: {pattern}")
+    return pattern.nnz if hasattr(pattern, "nnz") else int(np.count_nonzero(pattern))
+
+def placed_nonzeros(source_shape, source_nnz, desired_rows, desired_cols, mode="expand", pattern="tridiagonal"):
+    """
+    Upper estimate of the non-zeros a create_matrix mode places before adding jitter:
+    the source non-zeros for "expand", at most one per merged cell for "coarsen",
+    and nnz(A) * nnz(P) for "kronecker".
+    """
+    if mode == "expand":
+        return source_nnz
+    if mode == "coarsen":
+        return min(source_nnz, desired_rows * desired_cols)
+    if mode == "kronecker":
+        factor_rows = max(1, desired_rows // source_shape[0])
+        factor_cols = max(1, desired_cols // source_shape[1])
+        return source_nnz * kronecker_pattern_nonzeros(factor_rows, factor_cols, pattern)
+    raise ValueError(f"Unknown mode: {mode}")
+
+def estimate_stage_costs(source_shape, source_nnz, desired_rows, desired_cols, additional_density, engine,
+                         band_rows=STREAMING_BAND_ROWS, mode="expand", pattern="tridiagonal"):
+    """
+    Estimate peak memory (bytes) and time (seconds) of every pipeline stage.
+
+    The "streaming" engine writes the output band by band without holding it, so
+    its memory is bounded by the band size and it computes no properties. It only
+    implements the "expand" mode.
+
+    :param source_shape: (rows, cols) of the source matrix
+    :param source_nnz: number of stored non-zeros in the source
+    :param desired_rows: rows of the expanded matrix
+    :param desired_cols: columns of the expanded matrix
+    :param additional_density: jitter non-zeros added per original non-zero
+    :param engine: "dense", "sparse" or "streaming"
+    :param band_rows: target rows per band of the streaming engine
+    :param mode: create_matrix mode, "expand", "coarsen" or "kronecker"
+    :param pattern: Kronecker pattern block of the "kronecker" mode
+    :return: dict mapping stage name to {"memory": bytes, "time": seconds}
+    """
+    if engine == "streaming" and mode != "expand":
+        raise ValueError(f"The streaming engine can't run the {mode} mode")
+    source_cells = source_shape[0] * source_shape[1]
+    output_cells = desired_rows * desired_cols
+    placed_nnz = placed_nonzeros(source_shape, source_nnz, desired_rows, desired_cols, mode, pattern)
+    output_nnz = estimate_output_nonzeros(placed_nnz, desired_rows, desired_cols, additional_density)
+    # Coarsen and Kronecker hold their placed non-zeros while the jitter is added
+    placed_sparse_bytes = 0 if mode == "expand" else placed_nnz * BYTES_PER_SPARSE_ENTRY
+    square = desired_rows == desired_cols
+    source_sparse_bytes = source_nnz * BYTES_PER_SPARSE_ENTRY
+    output_sparse_bytes = output_nnz * BYTES_PER_SPARSE_ENTRY
+    read_time = source_nnz / MTX_ENTRIES_PER_SECOND
+    write_time = output_nnz / MTX_ENTRIES_PER_SECOND
+
+    if engine == "dense":
+        source_bytes = source_cells * BYTES_PER_VALUE
+        output_bytes = output_cells * BYTES_PER_VALUE
+        n = min(desired_rows, desired_cols)
+        if mode == "expand":
+            dense_expand = {
+                "memory": source_bytes + output_bytes,
+                "time": output_cells / DENSE_VALUES_PER_SECOND
+                        + source_nnz * (1 + additional_density) / DENSE_EXPAND_ENTRIES_PER_SECOND
+            }
+        else:
+            # Coarsen and Kronecker run on the sparse kernels and densify the result
+            dense_expand = {
+                "memory": source_bytes + placed_sparse_bytes + 2 * output_sparse_bytes + output_bytes,
+                "time": output_cells / DENSE_VALUES_PER_SECOND + output_nnz / SPARSE_ENTRIES_PER_SECOND
+            }
+        return {
+            "load": {
+                "memory": source_sparse_bytes + source_bytes,
+                "time": read_time + source_cells / DENSE_VALUES_PER_SECOND
+            },
+            "expand": dense_expand,
+            "properties": {
+                "memory": source_bytes + DENSE_PROPERTY_COPIES * output_bytes + output_sparse_bytes,
+                "time": DENSE_PROPERTY_COPIES * output_cells / DENSE_VALUES_PER_SECOND
+                        + output_nnz / SPARSE_ENTRIES_PER_SECOND
+            },
+            "condition_number": {
+                "memory": source_bytes + DENSE_CONDITION_COPIES * output_bytes if square else 0,
+                "time": 2 * n ** 3 / DENSE_FLOPS_PER_SECOND if square else 0.0
+            },
+            "write": {
+                "memory": source_bytes + output_bytes + output_cells + output_sparse_bytes,
+                "time": write_time + output_cells / DENSE_VALUES_PER_SECOND
+            }
+        }
+
+    if engine == "sparse":
+        return {
+            "load": {
+                "memory": 2 * source_sparse_bytes,
+                "time": read_time
+            },
+            "expand": {
+                "memory": source_sparse_bytes + placed_sparse_bytes + 2 * output_sparse_bytes,
+                "time": output_nnz / SPARSE_ENTRIES_PER_SECOND
+            },
+            "properties": {
+                "memory": source_sparse_bytes + 4 * output_sparse_bytes
+                          + 8 * (desired_rows + desired_cols) * BYTES_PER_VALUE,
+                "time": 10 * output_nnz / SPARSE_ENTRIES_PER_SECOND
+            },
+            "condition_number": {
+                "memory": source_sparse_bytes + SPARSE_LU_FILL * output_sparse_bytes if square else 0,
+                "time": SPARSE_LU_FILL * output_nnz / SPARSE_ENTRIES_PER_SECOND if square else 0.0
+            },
+            "write": {
+                "memory": source_sparse_bytes + output_sparse_bytes,
+                "time": write_time
+            }
+        }
+
+    if engine == "streaming":
+        # One band of output plus the jitter of the source chunks around it
+        band_fraction = min(1.0, (band_rows + 6) / desired_rows)
+        chunk_nnz = min(source_nnz, 2 * STREAMING_CHUNK_ROWS * source_nnz / source_shape[0])
+        band_bytes = (band_fraction * output_nnz + chunk_nnz * (1 + additional_density)) * BYTES_PER_SPARSE_ENTRY
+        return {
+            "load": {
+                "memory": 2 * source_sparse_bytes,
+                "time": read_time
+            },
+            "expand": {
+                "memory": source_sparse_bytes + band_bytes,
+                "time": output_nnz / SPARSE_ENTRIES_PER_SECOND
+            },
+            "properties": {"memory": 0, "time": 0.0},
+            "condition_number": {"memory": 0, "time": 0.0},
+            "write": {
+                "memory": source_sparse_bytes + band_bytes,
+                "time": write_time
+            }
+        }
+
+    raise ValueError(f"Unknown engine: {engine}")
+
+def plan_job(source_shape, source_nnz, desired_rows, desired_cols, additional_density,
+             memory_budget=None, engine="auto", stages=STAGES, mode="expand", pattern="tridiagonal"):
+    """
+    Choose the engine for a generation job and check that it fits in memory.
+
+    With engine="auto", the faster of the engines whose peak memory fits in the
+    budget is chosen. The "streaming" engine skips the property stages, so it is
+    only used when asked for explicitly. A MemoryError is raised before anything
+    is allocated when no allowed engine fits.
+
+    :param source_shape: (rows, cols) of the source matrix
+    :param source_nnz: number of stored non-zeros in the source
+    :param desired_rows: rows of the expanded matrix
+    :param desired_cols: columns of the expanded matrix
+    :param additional_density: jitter non-zeros added per original non-zero
+    :param memory_budget: budget in bytes (default: half of physical memory)
+    :param engine: "auto", "dense", "sparse" or "streaming"
+    :param stages: stages the job runs, e.g. no property stages when only expanding and writing
+    :param mode: create_matrix mode of the job, "expand", "coarsen" or "kronecker"
+    :param pattern: Kronecker pattern block of the "kronecker" mode
+    :return: dict with "engine", "peak_memory", "total_time" and per-stage "stages"
+    """
+    if memory_budget is None:
+        memory_budget = get_default_memory_budget() or float("inf")
+    candidates = ["dense", "sparse"] if engine == "auto" else [engine]
+
+    plans = []
+    for candidate in candidates:
+        costs = estimate_stage_costs(source_shape, source_nnz, desired_rows, desired_cols,
+                                     additional_density, candidate, mode=mode, pattern=pattern)
+        job_stages = {name: costs[name] for name in stages}
+        plans.append({
+            "engine": candidate,
+            "stages": job_stages,
+            "peak_memory": max(stage["memory"] for stage in job_stages.values()),
+            "total_time": sum(stage["time"] for stage in job_stages.values()),
+            "memory_budget": memory_budget
+        })
+
+    fitting = [plan for plan in plans if plan["peak_memory"] <= memory_budget]
+    if not fitting:
+        smallest = min(plans, key=lambda plan: plan["peak_memory"])
+        worst_stage = max(smallest["stages"], key=lambda name: smallest["stages"][name]["memory"])
+        raise MemoryError(
+            f"A {desired_rows}x{desired_cols} job needs about {format_bytes(smallest['peak_memory'])} "
+            f"({smallest['engine']} engine, '{worst_stage}' stage) but the memory budget is "
+            f"{format_bytes(memory_budget)}."
+        )
+    return min(fitting, key=lambda plan: plan["total_time"])
+
+def format_bytes(num_bytes):
+    """Human readable byte count."""
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if abs(num_bytes) < 1024 or unit == "TB":
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+def describe_plan(plan):
+    """Multi-line summary of a plan for printing."""
+    lines = [f"Engine: {plan['engine']}, peak memory ~{format_bytes(plan['peak_memory'])}, "
+             f"time ~{plan['total_time']:.1f} s"]
+    for name, stage in plan["stages"].items():
+        lines.append(f"  {name:<17} {format_bytes(stage['memory']):>10}  {stage['time']:8.2f} s")
+    return "\n".join(lines)
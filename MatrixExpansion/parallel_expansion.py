@@ -0,0 +1,198 @@
+"""
+Parallel expansion of a single large matrix over worker processes.
+
+Usage:
+    python parallel_expansion.py source.mtx rows cols density --workers 8 --output expanded.mtx
+
+The target rows are split into bands, and each worker expands whole bands with
+streaming_expansion.BandedSource. The source CSR arrays are placed in shared
+memory once and attached by every worker. Every band writes its non-zeros into
+its own slice of preallocated shared output buffers, sized from an upper bound
+on what the band can receive (its originals plus all jitter drawn by its halo).
+
+A band owns every cell in its rows, including jitter drawn from originals in a
+neighbouring band, so the bands never overlap and concatenating them in order
+gives the sorted CSR arrays directly. Jitter comes from per-chunk random
+streams, so the result only depends on the seed, not on the number of workers
+or bands.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.io
+import scipy.sparse
+
+from streaming_expansion import BandedSource, JITTER_RADIUS, band_ranges
+
+# Bands per worker, so that uneven bands still balance out
+BANDS_PER_WORKER = 4
+
+# Shared arrays attached by the current worker process
+_worker = {}
+
+def _share_array(array):
+    """Copy an array into a new shared memory block; returns (block, spec) where spec can be pickled."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+def _empty_shared_array(size, dtype):
+    dtype = np.dtype(dtype)
+    block = shared_memory.SharedMemory(create=True, size=max(size * dtype.itemsize, 1))
+    return block, (block.name, (size,), dtype.str)
+
+def _attach_array(spec):
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+def _init_worker(source_specs, output_specs, shape, desired_rows, desired_cols, additional_density, seed):
+    """
+    Attach the shared source and output arrays and rebuild the BandedSource on
+    them. The parent shares the source in canonical form, so it is used in place.
+    """
+    blocks = []
+    arrays = []
+    for spec in source_specs + output_specs:
+        block, array = _attach_array(spec)
+        blocks.append(block)
+        arrays.append(array)
+    data, indices, indptr, out_rows, out_cols, out_values = arrays
+    csr = scipy.sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+    csr.has_canonical_format = True
+    _worker["blocks"] = blocks
+    _worker["source"] = BandedSource(csr, desired_rows, desired_cols, additional_density, seed, copy=False)
+    _worker["output"] = (out_rows, out_cols, out_values)
+
+def _release_worker():
+    blocks = _worker.pop("blocks", [])
+    _worker.clear()
+    for block in blocks:
+        block.close()
+
+def _expand_band_task(row_start, row_stop, offset, capacity):
+    """Expand one band into its slice of the shared output; returns the number of non-zeros written."""
+    rows, cols, values = _worker["source"].expand_band(row_start, row_stop)
+    count = values.size
+    if count > capacity:
+        raise RuntimeError(f"Band {row_start}:{row_stop} produced {count} non-zeros for a capacity of {capacity}")
+    out_rows, out_cols, out_values = _worker["output"]
+    out_rows[offset:offset + count] = rows
+    out_cols[offset:offset + count] = cols
+    out_values[offset:offset + count] = values
+    return count
+
+def band_capacities(source, bands):
+    """
+    Upper bound on the non-zeros of every band: the originals scaling into the
+    band plus every jitter draw around the originals of its halo.
+    """
+    indptr = source.csr.indptr
+    capacities = []
+    for row_start, row_stop in bands:
+        source_start, source_stop = source.source_rows(row_start, row_stop)
+        capacity = int(indptr[source_stop] - indptr[source_start])
+        if source.additional_density > 0:
+            halo_start, halo_stop = source.source_rows(max(row_start - JITTER_RADIUS, 0),
+                                                       min(row_stop + JITTER_RADIUS, source.desired_rows))
+            capacity += int(indptr[halo_stop] - indptr[halo_start]) * source.additional_density
+        capacities.append(capacity)
+    return np.array(capacities, dtype=np.int64)
+
+def expand_matrix_parallel(original_matrix, desired_rows, desired_cols, additional_density,
+                           workers=None, band_rows=None, seed=None):
+    """
+    Expand a matrix like expand_matrix_sparse, with the bands of target rows spread over worker processes.
+
+    :param original_matrix: dense array or scipy.sparse matrix
+    :param desired_rows: rows of the expanded matrix
+    :param desired_cols: columns of the expanded matrix
+    :param additional_density: jittered non-zeros added per original non-zero
+    :param workers: number of worker processes (default: CPU count)
+    :param band_rows: target rows per band (default: BANDS_PER_WORKER bands per worker)
+    :param seed: seed of the jitter streams, see BandedSource
+    :return: scipy.sparse.csr_matrix with sorted indices
+    """
+    workers = workers or os.cpu_count() or 1
+    # BandedSource copies the source into canonical CSR form, which is what the workers share
+    source = BandedSource(original_matrix, desired_rows, desired_cols, additional_density, seed, copy=False)
+    if band_rows is None:
+        band_rows = max(1, -(-desired_rows // (workers * BANDS_PER_WORKER)))
+    bands = band_ranges(desired_rows, band_rows)
+    capacities = band_capacities(source, bands)
+    offsets = np.concatenate([[0], np.cumsum(capacities)])
+    total_capacity = int(offsets[-1])
+
+    csr = source.csr
+    blocks = []
+    try:
+        source_specs = []
+        for array in (csr.data, csr.indices, csr.indptr):
+            block, spec = _share_array(array)
+            blocks.append(block)
+            source_specs.append(spec)
+        output_specs = []
+        for dtype in (np.int64, np.int64, np.float64):
+            block, spec = _empty_shared_array(total_capacity, dtype)
+            blocks.append(block)
+            output_specs.append(spec)
+        init_args = (source_specs, output_specs, csr.shape, desired_rows, desired_cols,
+                     additional_density, source.seed)
+        tasks = [(row_start, row_stop, int(offsets[i]), int(capacities[i]))
+                 for i, (row_start, row_stop) in enumerate(bands)]
+
+        if workers == 1:
+            _init_worker(*init_args)
+            counts = [_expand_band_task(*task) for task in tasks]
+            _release_worker()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as executor:
+                # Neighbouring bands share jitter chunks, so hand them out in runs
+                chunksize = max(1, len(tasks) // (workers * BANDS_PER_WORKER))
+                counts = list(executor.map(_expand_band_task, *zip(*tasks), chunksize=chunksize))
+
+        # Bands are in row order and sorted inside, so their slices concatenate into sorted CSR arrays
+        out_rows, out_cols, out_values = (np.ndarray((total_capacity,), dtype=np.dtype(spec[2]), buffer=block.buf)
+                                          for spec, block in zip(output_specs, blocks[3:]))
+        slices = [slice(offset, offset + count) for offset, count in zip(offsets[:-1], counts)]
+        rows = np.concatenate([out_rows[s] for s in slices])
+        cols = np.concatenate([out_cols[s] for s in slices])
+        values = np.concatenate([out_values[s] for s in slices])
+        del out_rows, out_cols, out_values
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=desired_rows))])
+    expanded_matrix = scipy.sparse.csr_matrix((values, cols, indptr), shape=(desired_rows, desired_cols))
+    expanded_matrix.has_sorted_indices = True
+    return expanded_matrix
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand one large matrix in parallel.")
+    parser.add_argument("source", help="Source .mtx file")
+    parser.add_argument("rows", type=int, help="Rows of the expanded matrix")
+    parser.add_argument("cols", type=int, help="Columns of the expanded matrix")
+    parser.add_argument("density", type=int, help="Jittered non-zeros added per original non-zero")
+    parser.add_argument("--workers", type=int, help="Number of worker processes")
+    parser.add_argument("--band-rows", type=int, help="Target rows per band")
+    parser.add_argument("--seed", type=int, help="Seed of the jitter streams")
+    parser.add_argument("--output", default="expanded_matrix.mtx", help="Where to write the result")
+    args = parser.parse_args()
+
+    original_matrix = scipy.sparse.csr_matrix(scipy.io.mmread(args.source))
+    start = time.perf_counter()
+    expanded_matrix = expand_matrix_parallel(original_matrix, args.rows, args.cols, args.density,
+                                             workers=args.workers, band_rows=args.band_rows, seed=args.seed)
+    print(f"Expanded to {args.rows}x{args.cols} with {expanded_matrix.nnz} non-zeros "
+          f"in {time.perf_counter() - start:.2f} s")
+    scipy.io.mmwrite(args.output, expanded_matrix)
+    print(f"Saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
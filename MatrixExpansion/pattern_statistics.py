@@ -0,0 +1,212 @@
+"""
+Incrementally maintained statistics of a sparsity pattern.
+
+PatternState keeps per-diagonal counts, row/column degrees (and histograms of
+those degrees), the distance-to-diagonal histogram and the set of entries
+without a symmetric partner. Inserting, deleting or relocating one non-zero
+updates all of them in O(1), so the pattern properties of compute_matrix_properties
+can be read after every single move without recomputing anything.
+"""
+import numpy as np
+import scipy.sparse
+
+# Properties that only depend on the pattern, as returned by PatternState.properties
+PATTERN_PROPERTIES = [
+    "pattern_symmetry",
+    "nonzeros_per_row_min", "nonzeros_per_row_max", "nonzeros_per_row_avg", "nonzeros_per_row_std",
+    "nonzeros_per_col_min", "nonzeros_per_col_max", "nonzeros_per_col_avg", "nonzeros_per_col_std",
+    "avg_distance_to_diagonal", "num_diagonals_with_nonzeros", "bandwidth",
+    "num_structurally_unsymmetric_elements",
+]
+
+def _pattern_coordinates(matrix):
+    if scipy.sparse.issparse(matrix):
+        coo = scipy.sparse.coo_matrix(matrix)
+        coo.sum_duplicates()
+        keep = coo.data != 0
+        return coo.row[keep].astype(np.int64), coo.col[keep].astype(np.int64)
+    rows, cols = np.nonzero(matrix)
+    return rows.astype(np.int64), cols.astype(np.int64)
+
+class IndexedSet:
+    """Set with O(1) add, remove and uniform random choice."""
+    def __init__(self, items=()):
+        self.items = []
+        self.positions = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def choice(self):
+        return self.items[np.random.randint(len(self.items))]
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def __len__(self):
+        return len(self.items)
+
+class _DegreeStats:
+    """Degrees of the rows (or columns) with their sum, sum of squares and min/max."""
+    def __init__(self, degrees, max_degree):
+        self.degrees = degrees.astype(np.int64)
+        self.histogram = np.bincount(self.degrees, minlength=max_degree + 1)
+        self.total = int(self.degrees.sum())
+        self.total_squares = int((self.degrees ** 2).sum())
+        self.min = int(self.degrees.min()) if self.degrees.size else 0
+        self.max = int(self.degrees.max()) if self.degrees.size else 0
+
+    def change(self, index, delta):
+        old = int(self.degrees[index])
+        new = old + delta
+        self.degrees[index] = new
+        self.histogram[old] -= 1
+        self.histogram[new] += 1
+        self.total += delta
+        self.total_squares += new * new - old * old
+        # Degrees move by one, so the extremes move by at most one
+        if new < self.min:
+            self.min = new
+        elif old == self.min and self.histogram[old] == 0:
+            self.min = old + 1
+        if new > self.max:
+            self.max = new
+        elif old == self.max and self.histogram[old] == 0:
+            self.max = old - 1
+
+    def describe(self, prefix, props):
+        count = self.degrees.size
+        mean = self.total / count if count > 0 else None
+        props[f"{prefix}_min"] = self.min if count > 0 else None
+        props[f"{prefix}_max"] = self.max if count > 0 else None
+        props[f"{prefix}_avg"] = mean
+        props[f"{prefix}_std"] = (np.sqrt(max(self.total_squares - count * mean * mean, 0.0) / (count - 1))
+                                  if count > 1 else None)
+
+class PatternState:
+    """
+    Pattern statistics of a matrix, updated in O(1) per inserted, deleted or
+    relocated non-zero (the bandwidth is amortized O(1)).
+    """
+    def __init__(self, matrix):
+        rows, cols = _pattern_coordinates(matrix)
+        self.shape = matrix.shape
+        num_rows, num_cols = self.shape
+        self.entries = IndexedSet(zip(rows.tolist(), cols.tolist()))
+
+        self.row_degrees = _DegreeStats(np.bincount(rows, minlength=num_rows), num_cols)
+        self.col_degrees = _DegreeStats(np.bincount(cols, minlength=num_cols), num_rows)
+
+        # Offset j - i is stored at index j - i + num_rows - 1
+        self.diagonal_counts = np.bincount(cols - rows + num_rows - 1, minlength=num_rows + num_cols - 1)
+        self.num_diagonals = int(np.count_nonzero(self.diagonal_counts))
+        distances = np.abs(cols - rows)
+        self.distance_counts = np.bincount(distances, minlength=max(num_rows, num_cols))
+        self.distance_sum = int(distances.sum())
+        self.bandwidth = int(distances.max()) if distances.size else 0
+
+        # Off-diagonal entries (i, j) whose partner (j, i) is not stored
+        self.unpaired = IndexedSet(entry for entry in self.entries.items
+                                   if entry[0] != entry[1] and (entry[1], entry[0]) not in self.entries)
+
+    def __contains__(self, entry):
+        return entry in self.entries
+
+    @property
+    def nnz(self):
+        return len(self.entries)
+
+    def add(self, i, j):
+        """Insert a non-zero at (i, j), which must be empty."""
+        self.entries.add((i, j))
+        self.row_degrees.change(i, 1)
+        self.col_degrees.change(j, 1)
+        self._change_diagonal(i, j, 1)
+        if i != j:
+            if (j, i) in self.entries:
+                self.unpaired.discard((j, i))
+            else:
+                self.unpaired.add((i, j))
+
+    def remove(self, i, j):
+        """Delete the non-zero at (i, j), which must be stored."""
+        self.entries.discard((i, j))
+        self.row_degrees.change(i, -1)
+        self.col_degrees.change(j, -1)
+        self._change_diagonal(i, j, -1)
+        if i != j:
+            if (i, j) in self.unpaired:
+                self.unpaired.discard((i, j))
+            elif (j, i) in self.entries:
+                self.unpaired.add((j, i))
+
+    def move(self, i, j, new_i, new_j):
+        """Relocate the non-zero at (i, j) to the empty position (new_i, new_j)."""
+        self.remove(i, j)
+        self.add(new_i, new_j)
+
+    def apply(self, ops):
+        """Apply ("add", i, j, value), ("remove", i, j, value) and ("move", i, j, new_i, new_j) ops."""
+        for op in ops:
+            if op[0] == "add":
+                self.add(op[1], op[2])
+            elif op[0] == "remove":
+                self.remove(op[1], op[2])
+            else:
+                self.move(*op[1:])
+
+    def undo(self, ops):
+        """Revert ops previously applied with apply()."""
+        for op in reversed(ops):
+            if op[0] == "add":
+                self.remove(op[1], op[2])
+            elif op[0] == "remove":
+                self.add(op[1], op[2])
+            else:
+                self.move(op[3], op[4], op[1], op[2])
+
+    def _change_diagonal(self, i, j, delta):
+        index = j - i + self.shape[0] - 1
+        before = self.diagonal_counts[index]
+        self.diagonal_counts[index] += delta
+        if before == 0 or self.diagonal_counts[index] == 0:
+            self.num_diagonals += delta
+
+        distance = abs(j - i)
+        self.distance_counts[distance] += delta
+        self.distance_sum += delta * distance
+        if delta > 0:
+            self.bandwidth = max(self.bandwidth, distance)
+        else:
+            while self.bandwidth > 0 and self.distance_counts[self.bandwidth] == 0:
+                self.bandwidth -= 1
+
+    @property
+    def num_unsymmetric(self):
+        # Every unpaired entry of A is missing from A^T and its mirror is missing from A
+        return 2 * len(self.unpaired)
+
+    def properties(self):
+        """The PATTERN_PROPERTIES values, matching compute_matrix_properties."""
+        nnz = self.nnz
+        props = {"pattern_symmetry": 1.0 if not self.unpaired else 0.0}
+        self.row_degrees.describe("nonzeros_per_row", props)
+        self.col_degrees.describe("nonzeros_per_col", props)
+        props["avg_distance_to_diagonal"] = self.distance_sum / nnz if nnz > 0 else None
+        props["num_diagonals_with_nonzeros"] = self.num_diagonals
+        props["bandwidth"] = self.bandwidth if nnz > 0 else 0
+        props["num_structurally_unsymmetric_elements"] = self.num_unsymmetric
+        return props
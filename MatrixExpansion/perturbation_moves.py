@@ -0,0 +1,416 @@
+"""
+Loss-guided perturbation moves for optimize_multiple_matrices.
+
+Instead of randomizing every value like 'perturb_matrix', a move is aimed at
+one of the properties that dominate the loss: the property is drawn with a
+probability proportional to its weighted loss term, and the move tied to it
+pushes the matrix toward the original value of that property.
+"""
+import numpy as np
+import scipy.sparse
+
+from compute_loss import PROPERTY_KEYS, PROPERTY_INDEX, PropertyVector, loss_contributions, perturb_matrix, weight_vector
+from pattern_statistics import PATTERN_PROPERTIES
+
+# Properties each move is aimed at; properties without a move fall back to perturb_matrix
+MOVE_TARGETS = {
+    "rescale_values": ["value_min", "value_max", "value_avg", "value_std", "norm_1", "norm_inf", "frobenius_norm"]
+                      + [f"{prefix}_mean_{agg}" for prefix in ["row", "col"] for agg in ["min", "max", "mean", "std"]],
+    "shift_row_extremes": [f"row_{stat}_{agg}" for stat in ["min", "max"] for agg in ["min", "max", "mean", "std"]],
+    "shift_col_extremes": [f"col_{stat}_{agg}" for stat in ["min", "max"] for agg in ["min", "max", "mean", "std"]],
+    "shift_diagonal_distance": ["avg_distance_to_diagonal", "bandwidth", "num_diagonals_with_nonzeros"],
+}
+# With a PatternState, every property in pattern_statistics.PATTERN_PROPERTIES uses the structural move instead
+MOVE_OF_PROPERTY = {name: move for move, names in MOVE_TARGETS.items() for name in names}
+
+# Fraction of the non-zeros relocated by one diagonal distance move
+RELOCATE_FRACTION = 0.05
+
+def get_entries(matrix):
+    """(rows, cols, values) of the non-zeros of a dense or sparse matrix."""
+    if scipy.sparse.issparse(matrix):
+        coo = scipy.sparse.csr_matrix(matrix).tocoo()
+        keep = coo.data != 0
+        return coo.row[keep].astype(np.int64), coo.col[keep].astype(np.int64), coo.data[keep].astype(np.float64)
+    rows, cols = np.nonzero(matrix)
+    return rows.astype(np.int64), cols.astype(np.int64), matrix[rows, cols].astype(np.float64)
+
+def with_entries(matrix, rows, cols, values):
+    """New matrix of the same kind and shape as 'matrix' holding exactly the given entries."""
+    if scipy.sparse.issparse(matrix):
+        return scipy.sparse.csr_matrix((values, (rows, cols)), shape=matrix.shape)
+    new_matrix = np.zeros(matrix.shape, dtype=np.result_type(matrix.dtype, values.dtype))
+    new_matrix[rows, cols] = values
+    return new_matrix
+
+def choose_target_property(original_props, matrix_props, weights, movable=None):
+    """
+    Draw a property with probability proportional to its weighted loss term.
+    Infinite terms (e.g. a singular candidate's condition number) are left out:
+    no move can aim at them, and drawing them would only fall back to random moves.
+
+    :param movable: names of the properties that have a move (default: all)
+    :return: property name, or None when no movable property has a finite, non-zero term
+    """
+    contributions = loss_contributions(original_props, matrix_props, weights)
+    contributions = np.nan_to_num(contributions, nan=0.0, posinf=0.0)
+    if movable is not None:
+        contributions = np.where(np.isin(PROPERTY_KEYS, list(movable)), contributions, 0.0)
+    total = contributions.sum()
+    if total <= 0:
+        return None
+    return PROPERTY_KEYS[np.random.choice(len(contributions), p=contributions / total)]
+
+def rescale_values(values, target_name, original_props, matrix_props, step):
+    """
+    Affine map of the non-zero values toward the original value statistics:
+    min/max map the value range, avg/std match mean and spread, and the
+    norms and row/column means scale all values by the ratio of targets.
+    """
+    target, current = original_props[target_name], matrix_props[target_name]
+    if target is None or current is None:
+        return None
+
+    if target_name in ("value_min", "value_max"):
+        low, high = values.min(), values.max()
+        target_low = original_props["value_min"] if original_props["value_min"] is not None else low
+        target_high = original_props["value_max"] if original_props["value_max"] is not None else high
+        if high == low:
+            goal = np.full_like(values, target_high)
+        else:
+            goal = target_low + (values - low) * (target_high - target_low) / (high - low)
+    elif target_name in ("value_avg", "value_std"):
+        mean, std = values.mean(), values.std(ddof=1) if values.size > 1 else 0.0
+        target_mean = original_props["value_avg"] if original_props["value_avg"] is not None else mean
+        target_std = original_props["value_std"] if original_props["value_std"] is not None else std
+        goal = target_mean + (values - mean) * (target_std / std if std > 0 else 1.0)
+    else:
+        if current == 0:
+            return None
+        goal = values * (target / current)
+
+    return values + step * (goal - values)
+
+def shift_extremes(rows, cols, values, shape, axis, target_name, original_props, matrix_props, step):
+    """
+    Move the smallest or largest stored value of every row (column) so that the
+    statistics of the row (column) extremes approach the original ones.
+    "_std" targets rescale the extremes around their mean, the others shift them.
+
+    The row (column) statistics count implicit zeros, so a stored extreme is only
+    the extreme of its line when the line is full or the value lies beyond 0 (a
+    negative minimum, a positive maximum); the other lines are left alone.
+
+    :return: new values, or None when no line has a movable extreme
+    """
+    prefix, stat, agg = target_name.split("_")
+    mean_name = f"{prefix}_{stat}_mean"
+    target, current = original_props[target_name], matrix_props[target_name]
+    if target is None or current is None or original_props[mean_name] is None or matrix_props[mean_name] is None:
+        return None
+
+    groups = rows if axis == "row" else cols
+    length = shape[1] if axis == "row" else shape[0]
+    # Stored values sorted inside each row (column); extremes are the group ends
+    order = np.lexsort((values, groups))
+    sorted_groups = groups[order]
+    boundaries = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    ends = np.r_[boundaries[1:], sorted_groups.size]
+    if stat == "min":
+        extremes = order[boundaries]
+        beyond_zero = values[extremes] < 0
+    else:
+        extremes = order[ends - 1]
+        beyond_zero = values[extremes] > 0
+    extremes = extremes[beyond_zero | (ends - boundaries == length)]
+    if extremes.size == 0:
+        return None
+
+    new_values = values.copy()
+    if agg == "std":
+        mean = values[extremes].mean()
+        ratio = target / current if current > 0 else 1.0
+        goal = mean + (values[extremes] - mean) * ratio
+    else:
+        goal = values[extremes] + (original_props[mean_name] - matrix_props[mean_name])
+    new_values[extremes] += step * (goal - values[extremes])
+    return new_values
+
+def relocate_entries(rows, cols, values, shape, indices, new_cols):
+    """
+    Move the entries at 'indices' to 'new_cols' in their own row, dropping moves
+    that fall outside the matrix or onto an occupied (or doubly targeted) position.
+    """
+    num_rows, num_cols = shape
+    new_cols = np.asarray(new_cols, dtype=np.int64)
+    valid = (new_cols >= 0) & (new_cols < num_cols) & (new_cols != cols[indices])
+    indices, new_cols = indices[valid], new_cols[valid]
+
+    keys = rows * num_cols + cols
+    new_keys = rows[indices] * num_cols + new_cols
+    _, first = np.unique(new_keys, return_index=True)
+    free = np.zeros(new_keys.size, dtype=bool)
+    free[first] = True
+    free &= ~np.isin(new_keys, keys)
+
+    moved_cols = cols.copy()
+    moved_cols[indices[free]] = new_cols[free]
+    return rows, moved_cols, values
+
+def shift_diagonal_distance(rows, cols, values, shape, target_name, original_props, matrix_props, step):
+    """
+    Relocate non-zeros inside their rows to move the pattern toward the original
+    average distance to the diagonal, bandwidth or number of used diagonals.
+    """
+    target, current = original_props[target_name], matrix_props[target_name]
+    if target is None or current is None or rows.size == 0:
+        return None
+
+    offsets = cols - rows
+    distances = np.abs(offsets)
+    # Entries on the diagonal move to a random side
+    sides = np.where(offsets != 0, np.sign(offsets), np.random.choice([-1, 1], offsets.size))
+
+    if target_name == "avg_distance_to_diagonal":
+        count = max(1, int(RELOCATE_FRACTION * rows.size))
+        indices = np.random.choice(rows.size, count, replace=False)
+        # Moving a fraction f of the entries by delta / f moves the average by delta
+        delta = step * (target - current) * rows.size / count
+        new_distances = np.maximum(np.rint(distances[indices] + delta), 0).astype(np.int64)
+    elif target_name == "bandwidth":
+        target = int(target)
+        if current > target:
+            # Pull the entries beyond the target bandwidth inside it
+            indices = np.flatnonzero(distances > target)
+            indices = indices[np.random.rand(indices.size) < max(step, 1.0 / indices.size)]
+            new_distances = np.random.randint(0, target + 1, indices.size)
+        else:
+            indices = np.random.choice(rows.size, 1)
+            new_distances = np.array([target])
+    else:
+        used, counts = np.unique(offsets, return_counts=True)
+        if current > target:
+            # Empty the least used diagonals onto the most used ones
+            lonely = used[counts == counts.min()]
+            indices = np.flatnonzero(np.isin(offsets, lonely))
+            indices = indices[:max(1, int(step * (current - target)))]
+            goal_offsets = np.random.choice(used[counts > counts.min()] if (counts > counts.min()).any() else used,
+                                            indices.size)
+            return relocate_entries(rows, cols, values, shape, indices, rows[indices] + goal_offsets)
+        count = min(max(1, int(step * (target - current))), rows.size)
+        indices = np.random.choice(rows.size, count, replace=False)
+        # Random offsets not used yet anywhere in the pattern
+        candidates = np.setdiff1d(np.arange(-shape[0] + 1, shape[1]), used)
+        if candidates.size == 0:
+            return None
+        return relocate_entries(rows, cols, values, shape, indices,
+                                rows[indices] + np.random.choice(candidates, count))
+
+    new_cols = rows[indices] + sides[indices] * new_distances
+    # Flip to the other side of the diagonal when the first one is out of range
+    outside = (new_cols < 0) | (new_cols >= shape[1])
+    new_cols[outside] = rows[indices][outside] - sides[indices][outside] * new_distances[outside]
+    # and to the last column on that side when neither fits
+    new_cols = np.clip(new_cols, 0, shape[1] - 1)
+    return relocate_entries(rows, cols, values, shape, indices, new_cols)
+
+# Single-entry ops tried by one structural move
+STRUCTURAL_TRIALS = 32
+
+def _propose_structural_op(state, target_name, target, current, value_pool):
+    """One insert/delete/relocate op aimed at 'target_name', or None if none applies."""
+    num_rows, num_cols = state.shape
+    random_value = value_pool[np.random.randint(value_pool.size)]
+
+    if target_name.startswith("nonzeros_per_"):
+        degrees = state.row_degrees if target_name.startswith("nonzeros_per_row") else state.col_degrees
+        on_rows = degrees is state.row_degrees
+        kind = np.random.choice(["add", "remove", "move"])
+        if kind == "add" or state.nnz == 0:
+            # New entries go to the emptiest row (column) when the minimum is too low
+            line = int(np.argmin(degrees.degrees)) if target_name.endswith("_min") and target > current \
+                else np.random.randint(degrees.degrees.size)
+            other = np.random.randint(num_cols if on_rows else num_rows)
+            i, j = (line, other) if on_rows else (other, line)
+            return None if (i, j) in state else ("add", i, j, random_value)
+        i, j = state.entries.choice()
+        if kind == "remove":
+            return ("remove", i, j, None)
+        # Relocate along the other axis, changing one row (column) degree
+        new_i, new_j = (np.random.randint(num_rows), j) if on_rows else (i, np.random.randint(num_cols))
+        return None if (new_i, new_j) in state else ("move", i, j, new_i, new_j)
+
+    if target_name in ("num_structurally_unsymmetric_elements", "pattern_symmetry"):
+        if target_name == "pattern_symmetry":
+            unsymmetric_target = 0 if target == 1.0 else 2
+        else:
+            unsymmetric_target = target
+        if state.num_unsymmetric > unsymmetric_target and len(state.unpaired):
+            # Either give an unpaired entry its partner or delete it
+            i, j = state.unpaired.choice()
+            return ("add", j, i, random_value) if np.random.rand() < 0.5 else ("remove", i, j, None)
+        i, j = state.entries.choice()
+        new_j = np.random.randint(num_cols)
+        return None if (i, new_j) in state else ("move", i, j, i, new_j)
+
+    # Distance to the diagonal: relocate an entry inside its row
+    if state.nnz == 0:
+        return None
+    i, j = state.entries.choice()
+    if target_name == "bandwidth" and target > current:
+        distance = int(target)
+    elif target_name == "bandwidth":
+        distance = np.random.randint(int(target) + 1)
+    elif target_name == "avg_distance_to_diagonal":
+        distance = np.random.randint(int(2 * target) + 1)
+    else:
+        distance = np.random.randint(max(num_rows, num_cols))
+    new_j = i + distance if np.random.rand() < 0.5 else i - distance
+    if not 0 <= new_j < num_cols:
+        new_j = i - distance if new_j >= num_cols else i + distance
+    if not 0 <= new_j < num_cols or (i, new_j) in state:
+        return None
+    return ("move", i, j, i, new_j)
+
+def structural_move(matrix, state, target_name, original_props, weights, step):
+    """
+    Insert, delete or relocate single non-zeros aimed at a pattern property.
+    Every op is scored on the pattern part of the loss, read from 'state' in O(1),
+    and kept only if it lowers it.
+
+    :param matrix: dense array or scipy.sparse matrix described by 'state' (left unchanged)
+    :param state: PatternState of 'matrix'; the kept ops stay applied to it
+    :return: (new matrix, kept ops), or (None, []) when nothing improved
+    """
+    w = weight_vector(weights)
+    terms = [(name, w[PROPERTY_INDEX[name]], original_props[name]) for name in PATTERN_PROPERTIES
+             if w[PROPERTY_INDEX[name]] and original_props[name] is not None]
+
+    def pattern_loss():
+        props = state.properties()
+        return sum(weight * abs(target - props[name]) for name, weight, target in terms
+                   if props[name] is not None)
+
+    _, _, value_pool = get_entries(matrix)
+    if value_pool.size == 0:
+        return None, []
+    target = original_props[target_name]
+    best_loss = pattern_loss()
+    kept = []
+    for _ in range(max(1, int(step * STRUCTURAL_TRIALS))):
+        current = state.properties()[target_name]
+        op = _propose_structural_op(state, target_name, target, current, value_pool)
+        if op is None:
+            continue
+        state.apply([op])
+        loss = pattern_loss()
+        if loss < best_loss:
+            best_loss = loss
+            kept.append(op)
+        else:
+            state.undo([op])
+
+    if not kept:
+        return None, []
+    return apply_ops(matrix, kept), kept
+
+def apply_ops(matrix, ops):
+    """Copy of 'matrix' with ("add", i, j, value), ("remove", i, j, _) and ("move", i, j, new_i, new_j) applied."""
+    sparse = scipy.sparse.issparse(matrix)
+    new_matrix = scipy.sparse.lil_matrix(matrix) if sparse else matrix.copy()
+    for op in ops:
+        if op[0] == "add":
+            new_matrix[op[1], op[2]] = op[3]
+        elif op[0] == "remove":
+            new_matrix[op[1], op[2]] = 0
+        else:
+            _, i, j, new_i, new_j = op
+            new_matrix[new_i, new_j] = new_matrix[i, j]
+            new_matrix[i, j] = 0
+    if sparse:
+        new_matrix = new_matrix.tocsr()
+        new_matrix.eliminate_zeros()
+    return new_matrix
+
+def _values_at(matrix, rows, cols):
+    if scipy.sparse.issparse(matrix):
+        return np.asarray(scipy.sparse.csr_matrix(matrix)[rows, cols]).ravel()
+    return matrix[rows, cols]
+
+def _pattern_ops(rows, cols, new_rows, new_cols, new_values):
+    """
+    Ops turning the pattern of entries (rows, cols) into that of (new_rows, new_cols, new_values):
+    a "move" for every relocated entry and a "remove" for every entry whose value became zero.
+    Relocations only target positions that were empty, so the ops can be applied in order.
+    """
+    ops = [("move", int(rows[k]), int(cols[k]), int(new_rows[k]), int(new_cols[k]))
+           for k in np.flatnonzero((new_rows != rows) | (new_cols != cols))]
+    ops += [("remove", int(new_rows[k]), int(new_cols[k]), None) for k in np.flatnonzero(new_values == 0)]
+    return ops
+
+def targeted_move(matrix, original_props, matrix_props, weights, pattern_state=None):
+    """
+    Propose a perturbation of 'matrix' aimed at a property that dominates its loss.
+
+    :param matrix: dense array or scipy.sparse matrix to perturb (left unchanged)
+    :param original_props: PropertyVector or props dict of the reference matrix
+    :param matrix_props: PropertyVector or props dict of 'matrix'
+    :param weights: weights dict, or the array from weight_vector(weights)
+    :param pattern_state: PatternState of 'matrix'; enables structural moves for the
+                          pattern properties. Every move's pattern changes are applied
+                          to it as ops (none for a pure value move), so the caller
+                          undoes them when the proposal is rejected.
+    :return: (new matrix, move name, pattern ops); "random" when perturb_matrix was used
+             because no property with a loss term has a move that can act on 'matrix'
+    """
+    original_props = PropertyVector.from_props(original_props)
+    matrix_props = PropertyVector.from_props(matrix_props)
+    movable = set(MOVE_OF_PROPERTY)
+    if pattern_state is not None:
+        movable.update(PATTERN_PROPERTIES)
+    rows, cols, values = get_entries(matrix)
+
+    def tracked(new_matrix, new_move, result=None):
+        # Perturbed values can hit zero and relocations move entries: keep the pattern state in sync
+        if pattern_state is None:
+            return new_matrix, new_move, []
+        if result is None:
+            result = (rows, cols, _values_at(new_matrix, rows, cols))
+        ops = _pattern_ops(rows, cols, *result)
+        pattern_state.apply(ops)
+        return new_matrix, new_move, ops
+
+    if values.size == 0:
+        return tracked(perturb_matrix(matrix), "random")
+
+    # Partial steps keep some proposals small enough to be accepted
+    step = np.random.uniform(0.25, 1.0)
+    while True:
+        target_name = choose_target_property(original_props, matrix_props, weights, movable)
+        if target_name is None:
+            return tracked(perturb_matrix(matrix), "random")
+        move = MOVE_OF_PROPERTY[target_name]
+        if pattern_state is not None and target_name in PATTERN_PROPERTIES:
+            move = "structural"
+
+        if move == "structural":
+            new_matrix, ops = structural_move(matrix, pattern_state, target_name, original_props, weights, step)
+            if new_matrix is not None:
+                return new_matrix, move, ops
+            result = None
+        elif move == "rescale_values":
+            result = rescale_values(values, target_name, original_props, matrix_props, step)
+            result = None if result is None else (rows, cols, result)
+        elif move in ("shift_row_extremes", "shift_col_extremes"):
+            axis = "row" if move == "shift_row_extremes" else "col"
+            result = shift_extremes(rows, cols, values, matrix.shape, axis, target_name,
+                                    original_props, matrix_props, step)
+            result = None if result is None else (rows, cols, result)
+        else:
+            result = shift_diagonal_distance(rows, cols, values, matrix.shape, target_name,
+                                             original_props, matrix_props, step)
+
+        if result is not None:
+            return tracked(with_entries(matrix, *result), move, result)
+        # The move can't act on this matrix; aim at another property
+        movable.discard(target_name)
@@ -0,0 +1,180 @@
+"""
+Out-of-core expansion for outputs that don't fit in memory.
+
+The output is produced one band of target rows at a time and appended to a .mtx
+file, so only the source matrix and a single band are ever held in memory.
+
+Every band is computed independently from the source: its originals are the
+source rows that scale into the band, and its jitter comes from the source rows
+that scale into the band plus a halo of JITTER_RADIUS rows on each side, because
+jitter can land up to that many rows away from its original. Jitter is drawn
+per chunk of STREAMING_CHUNK_ROWS source rows from its own random stream, so a
+chunk shared by two bands draws the same jitter in both and the result does not
+depend on the band size.
+"""
+import numpy as np
+import scipy.sparse
+
+from dynamic_matrix_expansion import pool_by_key
+from memory_planner import STREAMING_BAND_ROWS, STREAMING_CHUNK_ROWS
+
+# Jitter offsets are drawn in [-JITTER_RADIUS, JITTER_RADIUS], as in expand_matrix
+JITTER_RADIUS = 3
+
+MTX_BANNER = "%%MatrixMarket matrix coordinate real general\n"
+
+class BandedSource:
+    """
+    Source matrix in CSR form with everything needed to expand any band of target rows.
+
+    :param original_matrix: dense array or scipy.sparse matrix
+    :param desired_rows: rows of the expanded matrix
+    :param desired_cols: columns of the expanded matrix
+    :param additional_density: jittered non-zeros added per original non-zero
+    :param seed: seed of the jitter streams (default: drawn from np.random, so
+                 np.random.seed makes the expansion reproducible)
+    :param copy: copy the source into canonical CSR form; with False, original_matrix
+                 must already be a float64 CSR matrix with sorted, unique indices and
+                 no explicit zeros, and is used as is (e.g. arrays in shared memory)
+    """
+    def __init__(self, original_matrix, desired_rows, desired_cols, additional_density, seed=None, copy=True):
+        if copy:
+            csr = scipy.sparse.csr_matrix(original_matrix, dtype=np.float64, copy=True)
+            csr.sum_duplicates()
+            csr.eliminate_zeros()
+        else:
+            csr = original_matrix
+        self.csr = csr
+        self.desired_rows = desired_rows
+        self.desired_cols = desired_cols
+        self.additional_density = additional_density
+        self.seed = int(np.random.randint(2 ** 31)) if seed is None else seed
+        # Jitter of the chunks used by the last band, which the next band mostly shares
+        self.jitter_cache = {}
+
+        self.min_value = csr.data.min() if csr.nnz else 0.0
+        self.max_value = csr.data.max() if csr.nnz else 0.0
+        # Target row of every source row and target column of every stored entry
+        self.target_rows = np.minimum((np.arange(csr.shape[0]) * (desired_rows / csr.shape[0])).astype(np.int64),
+                                      desired_rows - 1)
+        self.target_cols = np.minimum((csr.indices * (desired_cols / csr.shape[1])).astype(np.int64),
+                                      desired_cols - 1)
+
+    def source_rows(self, row_start, row_stop):
+        """Range of source rows whose scaled row lies in [row_start, row_stop)."""
+        return (int(np.searchsorted(self.target_rows, row_start, "left")),
+                int(np.searchsorted(self.target_rows, row_stop, "left")))
+
+    def scaled_entries(self, source_start, source_stop):
+        """Scaled (rows, cols, values) of the source entries in rows [source_start, source_stop), in order."""
+        start, stop = self.csr.indptr[source_start], self.csr.indptr[source_stop]
+        counts = np.diff(self.csr.indptr[source_start:source_stop + 1])
+        rows = np.repeat(self.target_rows[source_start:source_stop], counts)
+        return rows, self.target_cols[start:stop], self.csr.data[start:stop]
+
+    def chunk_jitter(self, chunk):
+        """Jittered (rows, cols, values) around the entries of one chunk of source rows, before any filtering."""
+        source_start = chunk * STREAMING_CHUNK_ROWS
+        source_stop = min(source_start + STREAMING_CHUNK_ROWS, self.csr.shape[0])
+        rows, cols, _ = self.scaled_entries(source_start, source_stop)
+        num_jitter = rows.size * self.additional_density
+        rng = np.random.default_rng([self.seed, chunk])
+        offsets = rng.integers(-JITTER_RADIUS, JITTER_RADIUS + 1, (2, num_jitter))
+        jittered_rows = np.clip(np.repeat(rows, self.additional_density) + offsets[0], 0, self.desired_rows - 1)
+        jittered_cols = np.clip(np.repeat(cols, self.additional_density) + offsets[1], 0, self.desired_cols - 1)
+        return jittered_rows, jittered_cols, rng.uniform(self.min_value, self.max_value, num_jitter)
+
+    def expand_band(self, row_start, row_stop):
+        """
+        Expanded non-zeros in target rows [row_start, row_stop), as in expand_matrix_sparse:
+        originals landing on the same cell keep the last value, and jitter never
+        overwrites an original or another jittered non-zero.
+
+        :return: (rows, cols, values) sorted in row-major order
+        """
+        desired_cols = self.desired_cols
+        rows, cols, values = self.scaled_entries(*self.source_rows(row_start, row_stop))
+        original_keys, original_values = pool_by_key(rows * desired_cols + cols, values, "last")
+
+        jitter_keys = np.empty(0, dtype=np.int64)
+        jitter_values = np.empty(0)
+        if self.additional_density > 0 and self.csr.nnz:
+            halo_start, halo_stop = self.source_rows(max(row_start - JITTER_RADIUS, 0),
+                                                     min(row_stop + JITTER_RADIUS, self.desired_rows))
+            if halo_stop > halo_start:
+                chunks = range(halo_start // STREAMING_CHUNK_ROWS, (halo_stop - 1) // STREAMING_CHUNK_ROWS + 1)
+                self.jitter_cache = {chunk: self.jitter_cache.get(chunk) or self.chunk_jitter(chunk)
+                                     for chunk in chunks}
+                # Draws follow the source entries, so the halo rows are one contiguous run of every chunk
+                indptr = self.csr.indptr
+                density = self.additional_density
+                jittered = []
+                for chunk, draws in self.jitter_cache.items():
+                    chunk_start = chunk * STREAMING_CHUNK_ROWS
+                    chunk_stop = chunk_start + STREAMING_CHUNK_ROWS
+                    draw_start = (indptr[max(halo_start, chunk_start)] - indptr[chunk_start]) * density
+                    draw_stop = (indptr[min(halo_stop, chunk_stop)] - indptr[chunk_start]) * density
+                    jittered.append([draw[draw_start:draw_stop] for draw in draws])
+                jittered_rows, jittered_cols, jittered_values = (np.concatenate(parts) for parts in zip(*jittered))
+
+                inside = (jittered_rows >= row_start) & (jittered_rows < row_stop)
+                keys = jittered_rows[inside] * desired_cols + jittered_cols[inside]
+                # The first draw landing on a free cell keeps its value
+                jitter_keys, first = np.unique(keys, return_index=True)
+                jitter_values = jittered_values[inside][first]
+                free = ~np.isin(jitter_keys, original_keys, assume_unique=True)
+                jitter_keys, jitter_values = jitter_keys[free], jitter_values[free]
+
+        keys = np.concatenate([original_keys, jitter_keys])
+        values = np.concatenate([original_values, jitter_values])
+        order = np.argsort(keys, kind="stable")
+        keys, values = keys[order], values[order]
+        return keys // desired_cols, keys % desired_cols, values
+
+def band_ranges(desired_rows, band_rows=STREAMING_BAND_ROWS):
+    """(row_start, row_stop) of every band of at most band_rows target rows."""
+    return [(start, min(start + band_rows, desired_rows)) for start in range(0, desired_rows, band_rows)]
+
+def iter_expanded_bands(original_matrix, desired_rows, desired_cols, additional_density,
+                        band_rows=STREAMING_BAND_ROWS, seed=None):
+    """
+    Generate the expansion band by band.
+
+    :return: iterator of (row_start, row_stop, rows, cols, values), with global 0-based indices
+    """
+    source = BandedSource(original_matrix, desired_rows, desired_cols, additional_density, seed)
+    for row_start, row_stop in band_ranges(desired_rows, band_rows):
+        yield (row_start, row_stop) + source.expand_band(row_start, row_stop)
+
+def expand_matrix_streaming(original_matrix, output_path, desired_rows, desired_cols, additional_density,
+                            band_rows=STREAMING_BAND_ROWS, seed=None):
+    """
+    Expand a matrix straight into a .mtx file, one band of target rows at a time,
+    so peak memory is bounded by the band size rather than the output size.
+
+    The size line is written with room for the largest possible non-zero count
+    and filled in once all bands have been written.
+
+    :param original_matrix: dense array or scipy.sparse matrix
+    :param output_path: .mtx file to write
+    :param desired_rows: rows of the expanded matrix
+    :param desired_cols: columns of the expanded matrix
+    :param additional_density: jittered non-zeros added per original non-zero
+    :param band_rows: target rows generated and written at a time
+    :param seed: seed of the jitter streams, see BandedSource
+    :return: number of non-zeros written
+    """
+    size_width = len(f"{desired_rows} {desired_cols} {desired_rows * desired_cols}")
+    nnz = 0
+    with open(output_path, "wb") as file:
+        file.write(MTX_BANNER.encode())
+        size_offset = file.tell()
+        file.write(f"{desired_rows} {desired_cols} 0".ljust(size_width).encode() + b"\n")
+        for _, _, rows, cols, values in iter_expanded_bands(original_matrix, desired_rows, desired_cols,
+                                                            additional_density, band_rows, seed):
+            if values.size:
+                np.savetxt(file, np.column_stack([rows + 1, cols + 1, values]), fmt="%d %d %.17g")
+            nnz += values.size
+        file.seek(size_offset)
+        file.write(f"{desired_rows} {desired_cols} {nnz}".ljust(size_width).encode())
+    return nnz
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+import scipy.io
+import scipy.sparse as sp
+
+from matrix_scaling import balance_matrix, scale_matrix
+
+MATRIX_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "original-matrices")
+
+def _old_scale_matrix(matrix, desired_rows, desired_cols, tol=1e-4, max_iters=100):
+    """The scale_matrix of Old Files/main.py, which balances the signed row and column sums."""
+    scaled_matrix = sp.lil_matrix((desired_rows, desired_cols))
+    original_rows, original_cols = matrix.shape
+    row_scale = desired_rows / original_rows
+    col_scale = desired_cols / original_cols
+    for i, j in zip(*matrix.nonzero()):
+        new_i = int(i * row_scale)
+        new_j = int(j * col_scale)
+        if new_i < desired_rows and new_j < desired_cols:
+            scaled_matrix[new_i, new_j] = matrix[i, j]
+    scaled_matrix = scaled_matrix.tocsr()
+
+    for _ in range(max_iters):
+        row_norms = np.array(scaled_matrix.sum(axis=1)).flatten()
+        col_norms = np.array(scaled_matrix.sum(axis=0)).flatten()
+        row_scaling_factors = np.sqrt(1.0 / (row_norms + 1e-10))
+        col_scaling_factors = np.sqrt(1.0 / (col_norms + 1e-10))
+        for i in range(desired_rows):
+            scaled_matrix.data[scaled_matrix.indptr[i]:scaled_matrix.indptr[i + 1]] *= row_scaling_factors[i]
+        scaled_matrix = scaled_matrix.transpose().tocsr()
+        for i in range(desired_cols):
+            scaled_matrix.data[scaled_matrix.indptr[i]:scaled_matrix.indptr[i + 1]] *= col_scaling_factors[i]
+        scaled_matrix = scaled_matrix.transpose().tocsr()
+        if max(np.abs(row_norms - 1).max(), np.abs(col_norms - 1).max()) < tol:
+            break
+    return scaled_matrix
+
+def _load(name):
+    return sp.csr_matrix(scipy.io.mmread(os.path.join(MATRIX_DIRECTORY, f"{name}.mtx")))
+
+# The old routine balances signed sums, so it is only a reference on non-negative matrices
+@pytest.mark.parametrize("name", ["cage7", "cage8"])
+def test_balance_matches_old_routine_on_nonnegative_matrices(name):
+    matrix = _load(name)
+    assert matrix.data.min() >= 0
+    for iterations in (1, 5, 30):
+        expected = _old_scale_matrix(matrix, *matrix.shape, tol=0, max_iters=iterations)
+        result = balance_matrix(matrix, tol=0, max_iters=iterations, stall_tol=0)
+        assert abs(result - expected).max() <= 1e-8 * abs(expected).max()
+
+def test_scale_matrix_matches_old_routine_on_nonnegative_matrices():
+    matrix = _load("cage7")
+    rows, cols = 2 * matrix.shape[0] // 3, 3 * matrix.shape[1] // 2
+    expected = _old_scale_matrix(matrix, rows, cols)
+    result = scale_matrix(matrix, rows, cols)
+    assert result.shape == expected.shape
+    assert abs(result - expected).max() <= 1e-8 * abs(expected).max()
+
+def test_balance_uses_absolute_values():
+    matrix = sp.csr_matrix(np.array([[2.0, -1.0], [-1.0, 2.0]]))
+    balanced = balance_matrix(matrix, tol=1e-10, max_iters=1000)
+    magnitudes = abs(balanced)
+    np.testing.assert_allclose(np.asarray(magnitudes.sum(axis=1)).ravel(), 1.0, atol=1e-8)
+    np.testing.assert_allclose(np.asarray(magnitudes.sum(axis=0)).ravel(), 1.0, atol=1e-8)
+    assert (np.sign(balanced.toarray()) == np.sign(matrix.toarray())).all()
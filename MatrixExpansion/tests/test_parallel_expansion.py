@@ -0,0 +1,45 @@
+import numpy as np
+import scipy.sparse
+
+import parallel_expansion
+from parallel_expansion import _init_worker, _release_worker, _share_array, expand_matrix_parallel
+from streaming_expansion import BandedSource
+
+def _source():
+    matrix = scipy.sparse.random(60, 50, density=0.1, random_state=0, format="csr")
+    # An explicit zero, which the parent must drop before sharing
+    matrix.data[0] = 0.0
+    return matrix
+
+def test_worker_uses_shared_source_in_place():
+    source = BandedSource(_source(), 120, 100, 2, seed=0)
+    blocks, specs = [], []
+    try:
+        for array in (source.csr.data, source.csr.indices, source.csr.indptr):
+            block, spec = _share_array(array)
+            blocks.append(block)
+            specs.append(spec)
+        output_specs = []
+        for dtype in (np.int64, np.int64, np.float64):
+            block, spec = parallel_expansion._empty_shared_array(16, dtype)
+            blocks.append(block)
+            output_specs.append(spec)
+        _init_worker(specs, output_specs, source.csr.shape, 120, 100, 2, source.seed)
+        # The data block the worker attached, as opposed to a private copy of it
+        worker_block = parallel_expansion._worker["blocks"][0]
+        shared_data = np.ndarray(source.csr.data.shape, dtype=np.float64, buffer=worker_block.buf)
+        worker_csr = parallel_expansion._worker["source"].csr
+        assert np.shares_memory(worker_csr.data, shared_data)
+        assert worker_csr.nnz == source.csr.nnz
+        del shared_data, worker_csr
+        _release_worker()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def test_parallel_matches_single_process():
+    matrix = _source()
+    expected = expand_matrix_parallel(matrix, 120, 100, 2, workers=1, seed=3)
+    result = expand_matrix_parallel(matrix, 120, 100, 2, workers=2, seed=3)
+    assert (expected != result).nnz == 0
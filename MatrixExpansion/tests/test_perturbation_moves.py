@@ -0,0 +1,48 @@
+import numpy as np
+import scipy.sparse
+
+from compute_loss import compute_matrix_properties
+from perturbation_moves import get_entries, shift_extremes, targeted_move, with_entries
+
+def _sparse_matrix(low, high, seed=0):
+    rng = np.random.default_rng(seed)
+    return scipy.sparse.random(200, 200, density=0.01, random_state=seed, format="csr",
+                               data_rvs=lambda size: rng.uniform(low, high, size))
+
+def _targeting(matrix, name, offset):
+    """Properties of 'matrix' with 'name' and its mean moved by 'offset', as the original to aim at."""
+    props = compute_matrix_properties(matrix)
+    original = dict(props)
+    prefix, stat, _ = name.split("_")
+    for key in (name, f"{prefix}_{stat}_mean"):
+        original[key] = props[key] + offset
+    return original, props
+
+def test_shift_extremes_skips_implicit_zero_extremes():
+    # Every row holds implicit zeros and only positive values, so every row minimum is 0
+    matrix = _sparse_matrix(0.5, 1.0)
+    original, props = _targeting(matrix, "row_min_mean", -0.5)
+    assert props["row_min_mean"] == 0
+    rows, cols, values = get_entries(matrix)
+    assert shift_extremes(rows, cols, values, matrix.shape, "row", "row_min_mean", original, props, 1.0) is None
+
+def test_shift_extremes_changes_the_targeted_statistic():
+    matrix = _sparse_matrix(-1.0, 1.0)
+    for name, offset in [("row_min_mean", -0.2), ("col_max_mean", 0.2), ("row_min_std", 0.1)]:
+        original, props = _targeting(matrix, name, offset)
+        rows, cols, values = get_entries(matrix)
+        axis = name.split("_")[0]
+        new_values = shift_extremes(rows, cols, values, matrix.shape, axis, name, original, props, 1.0)
+        new_props = compute_matrix_properties(with_entries(matrix, rows, cols, new_values))
+        assert abs(new_props[name] - original[name]) < abs(props[name] - original[name])
+
+def test_targeted_move_aims_elsewhere_when_extremes_cannot_move():
+    np.random.seed(0)
+    matrix = _sparse_matrix(0.5, 1.0)
+    original, props = _targeting(matrix, "row_min_mean", -0.5)
+    # Only the row minimum and the value range are off, and the row minima can't move
+    original["value_max"] = props["value_max"] * 2
+    weights = {"row_min_mean": 1000, "value_max": 1}
+    for _ in range(10):
+        _, move, _ = targeted_move(matrix, original, props, weights)
+        assert move == "rescale_values"
@@ -0,0 +1,246 @@
+"""
+Virtual datasets: recipes instead of stored matrices.
+
+A VirtualDataset holds one recipe per matrix, (source, size, density, mode,
+seed), and only materializes a matrix when it is indexed. Expansion is
+deterministic for a given recipe, so the recipes, saved as a small JSON file,
+stand in for the .mtx files they describe.
+
+Usage:
+    dataset = VirtualDataset.from_grid(["original-matrices/cage7.mtx"], [(5000, 5000)], [1, 3], count=1000, seed=0)
+    dataset.save("cage7_dataset.json")
+    dataset = VirtualDataset.load("cage7_dataset.json", cache_directory="dataset-cache")
+    matrix = dataset[42]
+
+Materialized matrices are kept in an in-memory LRU cache of cache_size
+matrices, and optionally in a disk cache of .npz files named after the hash
+of their recipe. Recipes in "expand" mode go through streaming_expansion's
+banded expansion, seeded per recipe. The other modes go through create_matrix
+under a temporary np.random seed.
+
+Every recipe records the source hash and the code version it was made with. A
+source whose content changed is refused. A code version change gets a warning,
+because the same recipe may then produce a different matrix.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+import scipy.io
+import scipy.sparse
+
+from dataset_manifest import GENERATOR_MODULES, code_version, matrix_sha256, output_seed
+from dynamic_matrix_expansion import create_matrix, load_matrix_sparse
+from parallel_expansion import expand_matrix_parallel
+
+DATASET_VERSION = 1
+# Modules whose source decides what a recipe materializes: create_matrix, plus the banded
+# expansion of "expand" recipes, whose jitter streams follow memory_planner's chunk size
+VIRTUAL_DATASET_MODULES = GENERATOR_MODULES + ["parallel_expansion", "streaming_expansion", "memory_planner"]
+# Matrices kept in memory by default
+DEFAULT_CACHE_SIZE = 8
+
+def recipe_key(recipe):
+    """Hash naming the disk cache file of a recipe."""
+    return hashlib.sha256(json.dumps(recipe, sort_keys=True).encode()).hexdigest()[:32]
+
+def materialize_recipe(recipe, original_matrix, workers=1):
+    """
+    Build the matrix a recipe describes.
+
+    :param recipe: recipe dict, see VirtualDataset
+    :param original_matrix: the loaded source matrix
+    :param workers: worker processes of the banded expansion ("expand" mode only)
+    :return: scipy.sparse.csr_matrix
+    """
+    rows, cols, density = recipe["rows"], recipe["cols"], recipe["density"]
+    if recipe["mode"] == "expand":
+        return expand_matrix_parallel(original_matrix, rows, cols, density, workers=workers, seed=recipe["seed"])
+    # create_matrix draws from np.random, so seed it and give the caller its state back afterwards
+    state = np.random.get_state()
+    try:
+        np.random.seed(recipe["seed"])
+        created = create_matrix(original_matrix, rows, cols, density, engine="sparse", mode=recipe["mode"])
+    finally:
+        np.random.set_state(state)
+    return scipy.sparse.csr_matrix(created)
+
+class VirtualDataset:
+    """
+    Sequence of matrices that are materialized from their recipes on access.
+
+    A recipe is a dict with "source" (.mtx path), "source_sha256", "rows",
+    "cols", "density", "mode", "seed" and "code_version".
+
+    :param recipes: list of recipes
+    :param cache_size: number of materialized matrices kept in memory (0 disables the cache)
+    :param cache_directory: directory of the disk cache, or None for no disk cache
+    :param workers: worker processes used to expand one matrix
+    """
+    def __init__(self, recipes, cache_size=DEFAULT_CACHE_SIZE, cache_directory=None, workers=1):
+        self.recipes = list(recipes)
+        self.cache_size = cache_size
+        self.cache_directory = cache_directory
+        self.workers = workers
+        self.cache = OrderedDict()
+        self.sources = {}
+        self.version = code_version(VIRTUAL_DATASET_MODULES)
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        self.warned_versions = set()
+        if cache_directory is not None:
+            os.makedirs(cache_directory, exist_ok=True)
+
+    @classmethod
+    def from_grid(cls, sources, sizes, densities, count=1, seed=0, mode="expand", **kwargs):
+        """
+        Recipes for every source x size x density, 'count' matrices each, like a batch_generate manifest.
+
+        :param sources: .mtx paths
+        :param sizes: (rows, cols) pairs
+        :param densities: jittered non-zeros added per original non-zero
+        :param count: matrices per combination
+        :param seed: base seed; recipe i gets dataset_manifest.output_seed(seed, i)
+        :param mode: create_matrix mode of every recipe
+        :param kwargs: passed on to VirtualDataset
+        """
+        version = code_version(VIRTUAL_DATASET_MODULES)
+        recipes = []
+        for source in sources:
+            original_matrix = load_matrix_sparse(source)
+            if original_matrix is None:
+                raise ValueError(f"Failed to load {source}")
+            source_hash = matrix_sha256(original_matrix)
+            for rows, cols in sizes:
+                for density in densities:
+                    for _ in range(count):
+                        recipes.append({
+                            "source": source,
+                            "source_sha256": source_hash,
+                            "rows": int(rows),
+                            "cols": int(cols),
+                            "density": int(density),
+                            "mode": mode,
+                            "seed": output_seed(seed, len(recipes)),
+                            "code_version": version
+                        })
+        return cls(recipes, **kwargs)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Dataset from a recipe file written by save."""
+        with open(path, "r") as file:
+            dataset = json.load(file)
+        if dataset.get("version") != DATASET_VERSION:
+            raise ValueError(f"Unsupported dataset version in {path}: {dataset.get('version')}")
+        return cls(dataset["recipes"], **kwargs)
+
+    def save(self, path):
+        """Write the recipes as JSON; this is all that needs to be stored."""
+        with open(path, "w") as file:
+            json.dump({"version": DATASET_VERSION, "recipes": self.recipes}, file, indent=1)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Dataset index {index} out of range for {len(self)} matrices")
+
+        if index in self.cache:
+            self.stats["hits"] += 1
+            self.cache.move_to_end(index)
+            return self.cache[index]
+
+        recipe = self.recipes[index]
+        cache_path = self.cache_path(recipe)
+        if cache_path is not None and os.path.exists(cache_path):
+            self.stats["disk_hits"] += 1
+            matrix = scipy.sparse.load_npz(cache_path).tocsr()
+        else:
+            self.stats["misses"] += 1
+            matrix = self.materialize(index)
+            if cache_path is not None:
+                # Written under a temporary name, so readers never see half a file
+                temporary_path = cache_path + ".tmp.npz"
+                scipy.sparse.save_npz(temporary_path, matrix)
+                os.replace(temporary_path, cache_path)
+
+        if self.cache_size > 0:
+            self.cache[index] = matrix
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return matrix
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def cache_path(self, recipe):
+        if self.cache_directory is None:
+            return None
+        return os.path.join(self.cache_directory, f"{recipe_key(recipe)}.npz")
+
+    def source(self, recipe):
+        """Loaded source matrix of a recipe, checked against the recorded hash."""
+        path = recipe["source"]
+        if path not in self.sources:
+            original_matrix = load_matrix_sparse(path)
+            if original_matrix is None:
+                raise ValueError(f"Failed to load {path}")
+            self.sources[path] = (original_matrix, matrix_sha256(original_matrix))
+        original_matrix, source_hash = self.sources[path]
+        if source_hash != recipe["source_sha256"]:
+            raise ValueError(f"{path} changed since the recipe was made; its matrices can't be reproduced")
+        return original_matrix
+
+    def materialize(self, index):
+        """Build matrix 'index' from its recipe, bypassing the caches."""
+        recipe = self.recipes[index]
+        if recipe["code_version"] != self.version and recipe["code_version"] not in self.warned_versions:
+            self.warned_versions.add(recipe["code_version"])
+            print(f"Warning: recipes made with code version {recipe['code_version']} are materialized with "
+                  f"{self.version}; matrices may differ from the original ones")
+        return materialize_recipe(recipe, self.source(recipe), self.workers)
+
+    def export(self, index, path):
+        """Write matrix 'index' to a .mtx file."""
+        scipy.io.mmwrite(path, self[index])
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a virtual dataset of expanded matrices.")
+    parser.add_argument("output", help="Recipe file to write")
+    parser.add_argument("--sources", nargs="+", required=True, help="Source .mtx files or glob patterns")
+    parser.add_argument("--sizes", nargs="+", required=True, help="Target sizes as ROWSxCOLS")
+    parser.add_argument("--densities", nargs="+", type=int, default=[1], help="Additional densities")
+    parser.add_argument("--count", type=int, default=1, help="Matrices per source, size and density")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed of the recipes")
+    parser.add_argument("--mode", default="expand", help="create_matrix mode of the recipes")
+    parser.add_argument("--check", type=int, default=0, help="Materialize this many matrices as a check")
+    args = parser.parse_args()
+
+    sources = []
+    for pattern in args.sources:
+        matches = sorted(glob.glob(pattern))
+        sources.extend(matches if matches else [pattern])
+    sizes = [tuple(int(value) for value in size.lower().split("x")) for size in args.sizes]
+
+    dataset = VirtualDataset.from_grid(sources, sizes, args.densities, args.count, args.seed, args.mode)
+    dataset.save(args.output)
+    print(f"Saved {len(dataset)} recipes to {args.output} ({os.path.getsize(args.output)} bytes)")
+
+    for index in range(min(args.check, len(dataset))):
+        start = time.perf_counter()
+        matrix = dataset[index]
+        print(f"Matrix {index}: {matrix.shape[0]}x{matrix.shape[1]}, {matrix.nnz} non-zeros "
+              f"in {time.perf_counter() - start:.2f} s")
+
+if __name__ == "__main__":
+    main()
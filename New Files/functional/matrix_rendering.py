@@ -0,0 +1,220 @@
+import numpy as np
+import scipy.sparse
+
+# Default image resolution (height, width) used for the density plots
+DEFAULT_RESOLUTION = (600, 800)
+
+def get_nonzero_entries(matrix):
+    """
+    Get the coordinates and values of the non-zeros of a matrix.
+
+    Parameters:
+        matrix (np.ndarray or scipy.sparse matrix): The matrix to inspect.
+
+    Returns:
+        tuple: (row_indices, col_indices, values) as NumPy arrays.
+    """
+    if scipy.sparse.issparse(matrix):
+        coo = matrix.tocoo()
+        mask = coo.data != 0
+        return coo.row[mask], coo.col[mask], coo.data[mask]
+    row_indices, col_indices = np.nonzero(matrix)
+    return row_indices, col_indices, matrix[row_indices, col_indices]
+
+def get_nonzero_coordinates(matrix):
+    """
+    Get the row and column indices of the non-zeros of a matrix.
+
+    Parameters:
+        matrix (np.ndarray or scipy.sparse matrix): The matrix to inspect.
+
+    Returns:
+        tuple: (row_indices, col_indices) as NumPy arrays.
+    """
+    if scipy.sparse.issparse(matrix):
+        return get_nonzero_entries(matrix)[:2]
+    return np.nonzero(matrix)
+
+def compute_density_image(row_indices, col_indices, shape, view=None, resolution=DEFAULT_RESOLUTION):
+    """
+    Bin non-zero positions into a 2-D count image in O(nnz).
+
+    Parameters:
+        row_indices (np.ndarray): Row index of every non-zero.
+        col_indices (np.ndarray): Column index of every non-zero.
+        shape (tuple): (num_rows, num_cols) of the matrix.
+        view (tuple): Visible window (row_start, row_stop, col_start, col_stop),
+            defaults to the whole matrix.
+        resolution (tuple): Maximum (height, width) of the image in pixels.
+
+    Returns:
+        tuple: (image, view) where image[i, j] counts the non-zeros falling in that pixel.
+    """
+    num_rows, num_cols = shape
+    if view is None:
+        view = (0, num_rows, 0, num_cols)
+    row_start, row_stop, col_start, col_stop = view
+    row_start, col_start = max(int(np.floor(row_start)), 0), max(int(np.floor(col_start)), 0)
+    row_stop, col_stop = min(int(np.ceil(row_stop)), num_rows), min(int(np.ceil(col_stop)), num_cols)
+    view = (row_start, row_stop, col_start, col_stop)
+
+    # Never use more pixels than there are rows/columns in the window
+    height = max(1, min(resolution[0], row_stop - row_start))
+    width = max(1, min(resolution[1], col_stop - col_start))
+
+    rows = np.asarray(row_indices, dtype=np.int64)
+    cols = np.asarray(col_indices, dtype=np.int64)
+    if view != (0, num_rows, 0, num_cols):
+        visible = (rows >= row_start) & (rows < row_stop) & (cols >= col_start) & (cols < col_stop)
+        rows = rows[visible]
+        cols = cols[visible]
+
+    row_bins = ((rows - row_start) * height) // max(row_stop - row_start, 1)
+    col_bins = ((cols - col_start) * width) // max(col_stop - col_start, 1)
+    counts = np.bincount(row_bins * width + col_bins, minlength=height * width)
+
+    return counts.reshape(height, width), view
+
+def draw_density_image(ax, image, view, cmap="Greys"):
+    """
+    Draw a density image on a matplotlib axis using matrix coordinates.
+
+    Parameters:
+        ax (matplotlib.axes.Axes): The axis to draw on.
+        image (np.ndarray): Count image from compute_density_image.
+        view (tuple): (row_start, row_stop, col_start, col_stop) covered by the image.
+        cmap (str): Colormap name.
+
+    Returns:
+        matplotlib.image.AxesImage: The drawn image.
+    """
+    row_start, row_stop, col_start, col_stop = view
+    # Log scaling keeps single non-zeros visible next to dense blocks
+    return ax.imshow(
+        np.log1p(image),
+        cmap=cmap,
+        interpolation="nearest",
+        aspect="auto",
+        origin="upper",
+        extent=(col_start - 0.5, col_stop - 0.5, row_stop - 0.5, row_start - 0.5)
+    )
+
+def _aggregate_tiles(rows, cols, width, sums, maxs, counts):
+    """Merge entries that share a (row, col) cell, returning them in row-major order."""
+    keys = rows * width + cols
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if keys.size else np.array([], dtype=np.int64)
+    unique_keys = keys[starts]
+    return (
+        unique_keys // width,
+        unique_keys % width,
+        np.add.reduceat(sums[order], starts) if keys.size else sums,
+        np.maximum.reduceat(maxs[order], starts) if keys.size else maxs,
+        np.add.reduceat(counts[order], starts) if keys.size else counts
+    )
+
+def build_tile_pyramid(matrix):
+    """
+    Build a multi-resolution aggregation pyramid from the non-zeros of a matrix.
+
+    Level k stores, for every 2^k x 2^k tile holding at least one non-zero, the
+    sum, maximum and count of its values. Only occupied tiles are stored, so no
+    level holds more entries than the matrix has non-zeros.
+
+    Parameters:
+        matrix (np.ndarray or scipy.sparse matrix): The matrix to aggregate.
+
+    Returns:
+        dict: "shape", "value_range" and "levels", a list of per-level dicts with
+        "shape", "indptr", "indices", "sum", "max" and "count".
+    """
+    rows, cols, values = get_nonzero_entries(matrix)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    num_rows, num_cols = matrix.shape
+    value_range = (values.min(), values.max()) if values.size else (0.0, 0.0)
+
+    height, width = num_rows, num_cols
+    sums, maxs, counts = values, values, np.ones(values.size, dtype=np.int64)
+    levels = []
+    while True:
+        rows, cols, sums, maxs, counts = _aggregate_tiles(rows, cols, max(width, 1), sums, maxs, counts)
+        indptr = np.zeros(height + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=height), out=indptr[1:])
+        levels.append({
+            "shape": (height, width),
+            "indptr": indptr,
+            "indices": cols,
+            "sum": sums,
+            "max": maxs,
+            "count": counts
+        })
+        if height <= 1 and width <= 1:
+            break
+        rows, cols = rows // 2, cols // 2
+        height, width = (height + 1) // 2, (width + 1) // 2
+
+    return {"shape": (num_rows, num_cols), "value_range": value_range, "levels": levels}
+
+def query_tile_pyramid(pyramid, view=None, resolution=DEFAULT_RESOLUTION, statistic="mean"):
+    """
+    Read the visible part of a tile pyramid at the coarsest level that still fills the resolution.
+
+    Parameters:
+        pyramid (dict): Pyramid from build_tile_pyramid.
+        view (tuple): Visible window (row_start, row_stop, col_start, col_stop)
+            in matrix coordinates, defaults to the whole matrix.
+        resolution (tuple): Maximum (height, width) of the image in pixels.
+        statistic (str): "sum", "max", "count" or "mean" of the values in each tile.
+
+    Returns:
+        tuple: (image, view) where empty tiles are NaN and view is the window
+        actually covered by the image in matrix coordinates.
+    """
+    num_rows, num_cols = pyramid["shape"]
+    if view is None:
+        view = (0, num_rows, 0, num_cols)
+    row_start, row_stop, col_start, col_stop = view
+    row_start, col_start = max(int(np.floor(row_start)), 0), max(int(np.floor(col_start)), 0)
+    row_stop = max(min(int(np.ceil(row_stop)), num_rows), row_start + 1)
+    col_stop = max(min(int(np.ceil(col_stop)), num_cols), col_start + 1)
+
+    # Finest level whose tiles in the window fit in the requested resolution
+    level_index = 0
+    while (level_index + 1 < len(pyramid["levels"]) and
+           ((row_stop - row_start) >> level_index > resolution[0] or
+            (col_stop - col_start) >> level_index > resolution[1])):
+        level_index += 1
+    level = pyramid["levels"][level_index]
+    tile_size = 1 << level_index
+
+    tile_row_start, tile_col_start = row_start // tile_size, col_start // tile_size
+    tile_row_stop = min(-(-row_stop // tile_size), level["shape"][0])
+    tile_col_stop = min(-(-col_stop // tile_size), level["shape"][1])
+
+    # Only the row band of the window is read from the level
+    first, last = level["indptr"][tile_row_start], level["indptr"][tile_row_stop]
+    tile_rows = np.repeat(
+        np.arange(tile_row_start, tile_row_stop),
+        np.diff(level["indptr"][tile_row_start:tile_row_stop + 1])
+    )
+    tile_cols = level["indices"][first:last]
+    visible = (tile_cols >= tile_col_start) & (tile_cols < tile_col_stop)
+
+    if statistic == "mean":
+        tile_values = level["sum"][first:last] / level["count"][first:last]
+    elif statistic in ("sum", "max", "count"):
+        tile_values = level[statistic][first:last]
+    else:
+        raise ValueError(f"Unknown tile statistic: {statistic}")
+
+    image = np.full((tile_row_stop - tile_row_start, tile_col_stop - tile_col_start), np.nan)
+    image[tile_rows[visible] - tile_row_start, tile_cols[visible] - tile_col_start] = tile_values[visible]
+
+    covered_view = (
+        tile_row_start * tile_size, min(tile_row_stop * tile_size, num_rows),
+        tile_col_start * tile_size, min(tile_col_stop * tile_size, num_cols)
+    )
+    return image, covered_view
@@ -0,0 +1,28 @@
+from functional.script_modules import load_script_module
+
+# The estimates are shared with the command line scripts
+planner = load_script_module("memory_planner")
+
+# Matrix creation only expands and writes; it computes no properties
+CREATION_STAGES = ["load", "expand", "write"]
+
+def plan_creation(file_path, desired_rows, desired_cols, desired_density, memory_budget=None):
+    """
+    Choose the dense or sparse engine for matrix creation before anything is allocated.
+
+    Parameters:
+        file_path (str): Path to the input matrix file.
+        desired_rows (int): Rows of the created matrices.
+        desired_cols (int): Columns of the created matrices.
+        desired_density (int): Non-zeros added around each original non-zero.
+        memory_budget (int): Budget in bytes, defaults to half of the physical memory.
+
+    Returns:
+        dict: "engine", "peak_memory", "total_time" and per-stage "stages".
+
+    Raises:
+        MemoryError: If neither engine fits in the memory budget.
+    """
+    source_rows, source_cols, source_nnz = planner.read_mtx_size(file_path)
+    return planner.plan_job((source_rows, source_cols), source_nnz, desired_rows, desired_cols, desired_density,
+                            memory_budget=memory_budget, stages=CREATION_STAGES)
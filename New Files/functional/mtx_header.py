@@ -0,0 +1,99 @@
+import os
+
+# Cache of parsed headers keyed by file path, holding (mtime, size, header)
+_header_cache = {}
+
+def read_mtx_header(file_path):
+    """
+    Read only the banner, comments and size line of a .mtx file.
+
+    Parameters:
+        file_path (str): Path to the .mtx file.
+
+    Returns:
+        dict: Header fields ("num_rows", "num_cols", "num_nonzeros", "format",
+        "field", "symmetry" and "comments", the "key: value" comment pairs),
+        or None if the file is not a Matrix Market file.
+    """
+    try:
+        with open(file_path, "r", errors="replace") as file:
+            banner = file.readline().split()
+            if len(banner) < 5 or banner[0].lower() != "%%matrixmarket":
+                return None
+
+            comments = {}
+            for line in file:
+                if line.startswith("%"):
+                    if ":" in line:
+                        key, value = line.strip("% \n").split(":", 1)
+                        comments[key.strip()] = value.strip()
+                elif line.strip():
+                    size = [int(token) for token in line.split()]
+                    break
+            else:
+                return None
+    except (OSError, ValueError) as e:
+        print(f"Error reading .mtx header: {e}")
+        return None
+
+    matrix_format = banner[2].lower()
+    num_rows, num_cols = size[0], size[1]
+    # Array files store every entry, so there is no count on the size line
+    num_nonzeros = size[2] if matrix_format == "coordinate" and len(size) > 2 else num_rows * num_cols
+    return {
+        "num_rows": num_rows,
+        "num_cols": num_cols,
+        "num_nonzeros": num_nonzeros,
+        "format": matrix_format,
+        "field": banner[3].lower(),
+        "symmetry": banner[4].lower(),
+        "comments": comments
+    }
+
+def get_mtx_header(file_path):
+    """
+    Read the header of a .mtx file, reusing the cached result while the file is unchanged.
+
+    Parameters:
+        file_path (str): Path to the .mtx file.
+
+    Returns:
+        dict: Header fields as returned by read_mtx_header, or None.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        _header_cache.pop(file_path, None)
+        return None
+
+    cached = _header_cache.get(file_path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    header = read_mtx_header(file_path)
+    _header_cache[file_path] = (stat.st_mtime_ns, stat.st_size, header)
+    return header
+
+def scan_mtx_folder(folder_path, on_header=None, should_stop=None):
+    """
+    Read the headers of all .mtx files in a folder.
+
+    Parameters:
+        folder_path (str): Folder to scan.
+        on_header (callable): Called with (file_name, header) as each file is read.
+        should_stop (callable): Polled between files; the scan ends early when it returns True.
+
+    Returns:
+        dict: Header of every .mtx file in the folder keyed by file name.
+    """
+    headers = {}
+    for file_name in sorted(os.listdir(folder_path)):
+        if should_stop is not None and should_stop():
+            break
+        if not file_name.lower().endswith(".mtx"):
+            continue
+        header = get_mtx_header(os.path.join(folder_path, file_name))
+        headers[file_name] = header
+        if on_header is not None:
+            on_header(file_name, header)
+    return headers
@@ -1,5 +1,33 @@
 import scipy.io
+import scipy.sparse
+import scipy.sparse.linalg
 import numpy as np
+from statistics import NormalDist
+
+# Rows or columns sampled by the getters when approximate results are asked for
+DEFAULT_SAMPLE_SIZE = 1000
+DEFAULT_CONFIDENCE = 0.95
+
+# Property groups computed by inspect_matrix, in display order
+INSPECTION_GROUPS = [
+    "basic_properties",
+    "symmetry",
+    "nonzeros_per_row",
+    "nonzeros_per_col",
+    "nonzero_values",
+    "row_statistics",
+    "col_statistics",
+    "distance_to_diagonal",
+    "structural_unsymmetry",
+    "norms",
+    "condition_number",
+]
+
+# Statistics computed for every row and column
+LINE_STATISTICS = ["min", "max", "mean", "std", "median"]
+
+# Groups built from per-row or per-column values, which can be estimated from a sample of lines
+SAMPLED_GROUPS = {"nonzeros_per_row", "nonzeros_per_col", "row_statistics", "col_statistics"}
 
 # Utility function to load matrix
 
@@ -11,160 +39,370 @@ def load_mtx_file(file_path):
         print(f"Error loading .mtx file: {e}")
         return None
 
-# 1. Basic Properties
-def get_basic_properties(matrix):
-    num_rows, num_cols = matrix.shape
-    num_nonzeros = np.count_nonzero(matrix)
-    density_percent = 100 * num_nonzeros / (num_rows * num_cols)
+# Summaries of per-line values, exact or estimated from a sample of lines
+def summarize_lines(prefix, line_values, population=None, confidence=DEFAULT_CONFIDENCE, mean_name="mean"):
+    """
+    Min, max, mean and std of a per-line statistic. When the values come from a
+    sample of 'population' lines, a "confidence_intervals" entry maps every
+    summary to a (low, high) interval: normal approximations with the finite
+    population correction for the mean and std, and one-sided bounds for the
+    min and max (a sampled max can only be below the true one).
+    """
+    summary = {
+        f"{prefix}_min": np.min(line_values),
+        f"{prefix}_max": np.max(line_values),
+        f"{prefix}_{mean_name}": np.mean(line_values),
+        f"{prefix}_std": np.std(line_values)
+    }
+    if population is None:
+        return summary
+
+    sample = line_values.size
+    if sample == population:
+        summary["confidence_intervals"] = {key: (value, value) for key, value in summary.items()}
+        return summary
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    correction = np.sqrt(1 - sample / population)
+    spread = np.std(line_values, ddof=1) if sample > 1 else np.inf
+    mean_half = z * correction * spread / np.sqrt(sample)
+    if sample > 1 and spread > 0:
+        # Standard error of the std, corrected for the kurtosis of the values
+        kurtosis = np.mean((line_values - np.mean(line_values)) ** 4) / spread ** 4
+        std_half = z * correction * spread * np.sqrt(max(kurtosis - (sample - 3) / (sample - 1), 0.0) / (4 * sample))
+    else:
+        std_half = np.inf if sample < 2 else 0.0
+    mean, std = summary[f"{prefix}_{mean_name}"], summary[f"{prefix}_std"]
+    summary["confidence_intervals"] = {
+        f"{prefix}_min": (-np.inf, summary[f"{prefix}_min"]),
+        f"{prefix}_max": (summary[f"{prefix}_max"], np.inf),
+        f"{prefix}_{mean_name}": (mean - mean_half, mean + mean_half),
+        f"{prefix}_std": (max(std - std_half, 0.0), std + std_half)
+    }
+    return summary
+
+def _merge_summaries(summaries):
+    merged = {}
+    intervals = {}
+    for summary in summaries:
+        intervals.update(summary.pop("confidence_intervals", {}))
+        merged.update(summary)
+    if intervals:
+        merged["confidence_intervals"] = intervals
+    return merged
+
+# Single-pass inspector shared by all the getters
+class MatrixInspector:
+    """
+    Computes the inspection properties of a dense or scipy.sparse matrix.
+
+    The matrix is converted once to CSR without its zeros, and the intermediates
+    shared by several property groups (coordinates, per-line counts, the
+    transposed matrix, sorted line values...) are computed on first use and
+    reused by every later group. Everything works on the non-zeros only, apart
+    from the condition number of a dense input.
+
+    Parameters:
+        matrix (np.ndarray or scipy.sparse matrix): The matrix to inspect.
+    """
+    def __init__(self, matrix):
+        self.dense = None if scipy.sparse.issparse(matrix) else np.asarray(matrix)
+        csr = scipy.sparse.csr_matrix(matrix, copy=True)
+        csr.sum_duplicates()
+        csr.eliminate_zeros()
+        self.csr = csr
+        self.shape = csr.shape
+        self.cache = {}
+
+    def shared(self, name, compute):
+        # Threads racing on the same intermediate only compute it twice
+        if name not in self.cache:
+            self.cache[name] = compute()
+        return self.cache[name]
+
+    def lines(self, axis):
+        """Rows (axis=1) or columns (axis=0) as the rows of a CSR matrix."""
+        if axis == 1:
+            return self.csr
+        return self.shared("transpose", lambda: self.csr.T.tocsr())
+
+    def coordinates(self):
+        def compute():
+            rows = np.repeat(np.arange(self.shape[0]), np.diff(self.csr.indptr))
+            return rows, self.csr.indices.astype(np.int64)
+        return self.shared("coordinates", compute)
+
+    def distances(self):
+        def compute():
+            rows, cols = self.coordinates()
+            return np.abs(rows - cols)
+        return self.shared("distances", compute)
+
+    def mirrored(self):
+        """Mask of the non-zeros whose mirrored cell (col, row) is also a non-zero."""
+        def compute():
+            num_rows, num_cols = self.shape
+            rows, cols = self.coordinates()
+            # The mirror of a non-zero outside the leading square block lies outside the matrix
+            in_range = (rows < num_cols) & (cols < num_rows)
+            keys = rows * num_cols + cols
+            mirror_keys = cols[in_range] * num_cols + rows[in_range]
+            mask = np.zeros(self.csr.nnz, dtype=bool)
+            mask[in_range] = np.isin(mirror_keys, keys)
+            return mask
+        return self.shared("mirrored", compute)
+
+    def line_values(self, axis, sample_size=None, seed=None):
+        """
+        Per-line values of the rows (axis=1) or columns (axis=0), counting implicit zeros.
+
+        With a sample_size, only that many random lines are looked at.
+
+        Returns:
+            tuple: (dict of arrays with one entry per line, number of lines in the matrix or None when exact)
+        """
+        lines = self.lines(axis)
+        if sample_size is None:
+            return self.shared(f"line_values_{axis}", lambda: _line_values(lines)), None
+        num_lines = lines.shape[0]
+        index = np.sort(np.random.default_rng(seed).choice(num_lines, min(sample_size, num_lines), replace=False))
+        return _line_values(lines[index]), num_lines
+
+    # 1. Basic Properties
+    def basic_properties(self):
+        num_rows, num_cols = self.shape
+        num_nonzeros = self.csr.nnz
+        density_percent = 100 * num_nonzeros / (num_rows * num_cols)
+        return {
+            "num_rows": num_rows,
+            "num_cols": num_cols,
+            "num_nonzeros": num_nonzeros,
+            "density_percent": density_percent
+        }
+
+    # 2. Symmetry
+    def symmetry(self):
+        if self.shape[0] != self.shape[1]:
+            return {"pattern_symmetry": False, "numerical_symmetry": False}
+        pattern_symmetry = bool(np.all(self.mirrored()))
+        # Same test as np.allclose(matrix, matrix.T, atol=1e-8), on the non-zeros of either side
+        transpose = self.lines(0)
+        excess = abs(self.csr - transpose) - 1e-5 * abs(transpose)
+        numerical_symmetry = bool(excess.nnz == 0 or excess.data.max() <= 1e-8)
+        return {
+            "pattern_symmetry": pattern_symmetry,
+            "numerical_symmetry": numerical_symmetry
+        }
+
+    # 3. Nonzeros per Row
+    def nonzeros_per_row(self, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+        values, population = self.line_values(1, sample_size, seed)
+        return summarize_lines("nonzeros_per_row", values["count"], population, confidence, mean_name="avg")
+
+    # 4. Nonzeros per Column
+    def nonzeros_per_col(self, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+        values, population = self.line_values(0, sample_size, seed)
+        return summarize_lines("nonzeros_per_col", values["count"], population, confidence, mean_name="avg")
+
+    # 5. Nonzero Values Statistics
+    def nonzero_values(self):
+        nonzero_values = self.csr.data
+        return {
+            "value_min": np.min(nonzero_values),
+            "value_max": np.max(nonzero_values),
+            "value_avg": np.mean(nonzero_values),
+            "value_std": np.std(nonzero_values)
+        }
+
+    # 6. Row-wise Statistics
+    def row_statistics(self, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+        values, population = self.line_values(1, sample_size, seed)
+        return _merge_summaries([summarize_lines(f"row_{stat}", values[stat], population, confidence)
+                                 for stat in LINE_STATISTICS])
+
+    # 7. Column-wise Statistics
+    def col_statistics(self, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+        values, population = self.line_values(0, sample_size, seed)
+        return _merge_summaries([summarize_lines(f"col_{stat}", values[stat], population, confidence)
+                                 for stat in LINE_STATISTICS])
+
+    # 8. Distance to Diagonal
+    def distance_to_diagonal(self):
+        distances = self.distances()
+        avg_distance_to_diagonal = np.mean(distances)
+        num_diagonals_with_nonzeros = int(np.count_nonzero(np.bincount(distances)))
+        bandwidth = np.max(distances)
+        return {
+            "avg_distance_to_diagonal": avg_distance_to_diagonal,
+            "num_diagonals_with_nonzeros": num_diagonals_with_nonzeros,
+            "bandwidth": bandwidth
+        }
+
+    # 9. Structural Unsymmetry
+    def structural_unsymmetry(self):
+        # Cells where exactly one of (row, col) and (col, row) is a non-zero: every
+        # non-zero without a mirrored non-zero counts together with its empty mirror,
+        # unless that mirror lies outside a non-square matrix
+        rows, cols = self.coordinates()
+        num_rows, num_cols = self.shape
+        unmirrored = ~self.mirrored()
+        outside = unmirrored & ((rows >= num_cols) | (cols >= num_rows))
+        num_structurally_unsymmetric_elements = 2 * int(np.count_nonzero(unmirrored)) - int(np.count_nonzero(outside))
+        return {"num_structurally_unsymmetric_elements": num_structurally_unsymmetric_elements}
+
+    # 10. Norms
+    def norms(self):
+        magnitudes = np.abs(self.csr.data)
+        rows, cols = self.coordinates()
+        norm_1 = np.max(np.bincount(cols, weights=magnitudes, minlength=self.shape[1]))
+        norm_inf = np.max(np.bincount(rows, weights=magnitudes, minlength=self.shape[0]))
+        frobenius_norm = np.sqrt(np.dot(self.csr.data, self.csr.data))
+        return {
+            "norm_1": norm_1,
+            "norm_inf": norm_inf,
+            "frobenius_norm": frobenius_norm
+        }
+
+    # 11. Condition Number
+    def condition_number(self):
+        if self.dense is not None:
+            try:
+                condition_number = np.linalg.cond(self.dense, p=1)
+            except np.linalg.LinAlgError:
+                condition_number = float('inf')  # Handle singular matrices
+            return {"estimated_condition_number": condition_number}
+        # Sparse input: 1-norm estimate of the inverse from a sparse LU factorization
+        if self.shape[0] != self.shape[1]:
+            return {"estimated_condition_number": float('inf')}
+        try:
+            lu = scipy.sparse.linalg.splu(self.csr.tocsc())
+        except RuntimeError:
+            return {"estimated_condition_number": float('inf')}  # Handle singular matrices
+        inverse = scipy.sparse.linalg.LinearOperator(
+            self.shape, matvec=lu.solve, rmatvec=lambda x: lu.solve(x, trans="T"), dtype=np.float64)
+        condition_number = self.norms()["norm_1"] * scipy.sparse.linalg.onenormest(inverse)
+        return {"estimated_condition_number": condition_number}
+
+def _line_values(lines):
+    """
+    Count of non-zeros and min, max, mean, std and median of every row of a CSR
+    matrix without stored zeros, counting the implicit zeros of each row.
+    """
+    num_lines, length = lines.shape
+    counts = np.diff(lines.indptr)
+    line_ids = np.repeat(np.arange(num_lines), counts)
+    # Sort values inside each line; lines stay in order
+    sorted_data = lines.data[np.lexsort((lines.data, line_ids))]
+    starts = lines.indptr[:-1]
+    has_zeros = counts < length
+
+    def stored_at(index):
+        if not sorted_data.size:
+            return np.zeros(num_lines)
+        return sorted_data[np.clip(index, 0, sorted_data.size - 1)]
+
+    smallest = np.where(counts > 0, stored_at(starts), 0.0)
+    largest = np.where(counts > 0, stored_at(lines.indptr[1:] - 1), 0.0)
+    means = np.bincount(line_ids, weights=lines.data, minlength=num_lines) / length
+    deviations = np.bincount(line_ids, weights=(lines.data - means[line_ids]) ** 2, minlength=num_lines)
+    stds = np.sqrt((deviations + (length - counts) * means ** 2) / length)
+
+    negatives = np.bincount(line_ids[sorted_data < 0], minlength=num_lines)
+    zeros = length - counts
+
+    def value_at(position):
+        # Full sorted line = negatives, then implicit zeros, then positives
+        in_negatives = position < negatives
+        in_positives = position >= negatives + zeros
+        stored = stored_at(starts + np.where(in_positives, position - zeros, position))
+        return np.where(in_negatives | in_positives, stored, 0.0)
+
+    medians = 0.5 * (value_at(np.full(num_lines, (length - 1) // 2)) + value_at(np.full(num_lines, length // 2)))
     return {
-        "num_rows": num_rows,
-        "num_cols": num_cols,
-        "num_nonzeros": num_nonzeros,
-        "density_percent": density_percent
+        "count": counts,
+        "min": np.where(has_zeros, np.minimum(smallest, 0.0), smallest),
+        "max": np.where(has_zeros, np.maximum(largest, 0.0), largest),
+        "mean": means,
+        "std": stds,
+        "median": medians
     }
 
+def inspect_matrix(matrix, groups=None, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+    """
+    Computes the selected property groups of a matrix in one pass, sharing the
+    intermediates between groups.
+
+    Parameters:
+        matrix (np.ndarray, scipy.sparse matrix or MatrixInspector): The matrix to inspect.
+        groups (list): Names from INSPECTION_GROUPS (default: all of them).
+        sample_size (int): When set, the SAMPLED_GROUPS are estimated from that
+            many random rows/columns and carry a "confidence_intervals" entry.
+        confidence (float): Confidence level of the intervals.
+        seed (int): Seed of the line sample.
+
+    Returns:
+        dict: Property dictionary of every group, keyed by group name.
+    """
+    inspector = as_inspector(matrix)
+    results = {}
+    for group in groups or INSPECTION_GROUPS:
+        if group not in INSPECTION_GROUPS:
+            raise ValueError(f"Unknown property group: {group}")
+        compute = getattr(inspector, group)
+        if group in SAMPLED_GROUPS:
+            results[group] = compute(sample_size, confidence, seed)
+        else:
+            results[group] = compute()
+    return results
+
+def as_inspector(matrix):
+    """Wraps a matrix in a MatrixInspector, or returns it unchanged if it already is one."""
+    return matrix if isinstance(matrix, MatrixInspector) else MatrixInspector(matrix)
+
+# Per-group getters. They accept a matrix or a MatrixInspector; passing the same
+# inspector to several getters computes the shared intermediates only once.
+# The per-line getters take an optional sample_size: the statistics are then
+# estimated from that many random rows (columns), with confidence intervals
+
+# 1. Basic Properties
+def get_basic_properties(matrix):
+    return as_inspector(matrix).basic_properties()
+
 # 2. Symmetry
 def get_symmetry(matrix):
-    transpose = matrix.T
-    pattern_symmetry = np.array_equal(matrix != 0, transpose != 0)
-    numerical_symmetry = np.allclose(matrix, transpose, atol=1e-8)
-    return {
-        "pattern_symmetry": pattern_symmetry,
-        "numerical_symmetry": numerical_symmetry
-    }
+    return as_inspector(matrix).symmetry()
 
 # 3. Nonzeros per Row
-def get_nonzeros_per_row_stats(matrix):
-    nonzeros_per_row = np.count_nonzero(matrix, axis=1)
-    return {
-        "nonzeros_per_row_min": np.min(nonzeros_per_row),
-        "nonzeros_per_row_max": np.max(nonzeros_per_row),
-        "nonzeros_per_row_avg": np.mean(nonzeros_per_row),
-        "nonzeros_per_row_std": np.std(nonzeros_per_row)
-    }
+def get_nonzeros_per_row_stats(matrix, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+    return as_inspector(matrix).nonzeros_per_row(sample_size, confidence, seed)
 
 # 4. Nonzeros per Column
-def get_nonzeros_per_col_stats(matrix):
-    nonzeros_per_col = np.count_nonzero(matrix, axis=0)
-    return {
-        "nonzeros_per_col_min": np.min(nonzeros_per_col),
-        "nonzeros_per_col_max": np.max(nonzeros_per_col),
-        "nonzeros_per_col_avg": np.mean(nonzeros_per_col),
-        "nonzeros_per_col_std": np.std(nonzeros_per_col)
-    }
+def get_nonzeros_per_col_stats(matrix, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+    return as_inspector(matrix).nonzeros_per_col(sample_size, confidence, seed)
 
 # 5. Nonzero Values Statistics
 def get_nonzero_value_stats(matrix):
-    nonzero_values = matrix[matrix != 0]
-    return {
-        "value_min": np.min(nonzero_values),
-        "value_max": np.max(nonzero_values),
-        "value_avg": np.mean(nonzero_values),
-        "value_std": np.std(nonzero_values)
-    }
+    return as_inspector(matrix).nonzero_values()
 
 # 6. Row-wise Statistics
-def get_row_statistics(matrix):
-    row_mins = np.min(matrix, axis=1)
-    row_maxs = np.max(matrix, axis=1)
-    row_means = np.mean(matrix, axis=1)
-    row_stds = np.std(matrix, axis=1)
-    row_medians = np.median(matrix, axis=1)
-    return {
-        "row_min_min": np.min(row_mins),
-        "row_min_max": np.max(row_mins),
-        "row_min_mean": np.mean(row_mins),
-        "row_min_std": np.std(row_mins),
-
-        "row_max_min": np.min(row_maxs),
-        "row_max_max": np.max(row_maxs),
-        "row_max_mean": np.mean(row_maxs),
-        "row_max_std": np.std(row_maxs),
-
-        "row_mean_min": np.min(row_means),
-        "row_mean_max": np.max(row_means),
-        "row_mean_mean": np.mean(row_means),
-        "row_mean_std": np.std(row_means),
-
-        "row_std_min": np.min(row_stds),
-        "row_std_max": np.max(row_stds),
-        "row_std_mean": np.mean(row_stds),
-        "row_std_std": np.std(row_stds),
-
-        "row_median_min": np.min(row_medians),
-        "row_median_max": np.max(row_medians),
-        "row_median_mean": np.mean(row_medians),
-        "row_median_std": np.std(row_medians)
-    }
+def get_row_statistics(matrix, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+    return as_inspector(matrix).row_statistics(sample_size, confidence, seed)
 
 # 7. Column-wise Statistics
-def get_col_statistics(matrix):
-    col_mins = np.min(matrix, axis=0)
-    col_maxs = np.max(matrix, axis=0)
-    col_means = np.mean(matrix, axis=0)
-    col_stds = np.std(matrix, axis=0)
-    col_medians = np.median(matrix, axis=0)
-    return {
-        "col_min_min": np.min(col_mins),
-        "col_min_max": np.max(col_mins),
-        "col_min_mean": np.mean(col_mins),
-        "col_min_std": np.std(col_mins),
-
-        "col_max_min": np.min(col_maxs),
-        "col_max_max": np.max(col_maxs),
-        "col_max_mean": np.mean(col_maxs),
-        "col_max_std": np.std(col_maxs),
-
-        "col_mean_min": np.min(col_means),
-        "col_mean_max": np.max(col_means),
-        "col_mean_mean": np.mean(col_means),
-        "col_mean_std": np.std(col_means),
-
-        "col_std_min": np.min(col_stds),
-        "col_std_max": np.max(col_stds),
-        "col_std_mean": np.mean(col_stds),
-        "col_std_std": np.std(col_stds),
-
-        "col_median_min": np.min(col_medians),
-        "col_median_max": np.max(col_medians),
-        "col_median_mean": np.mean(col_medians),
-        "col_median_std": np.std(col_medians)
-    }
+def get_col_statistics(matrix, sample_size=None, confidence=DEFAULT_CONFIDENCE, seed=None):
+    return as_inspector(matrix).col_statistics(sample_size, confidence, seed)
 
 # 8. Distance to Diagonal
 def get_distance_to_diagonal(matrix):
-    rows, cols = np.nonzero(matrix)
-    distances = np.abs(rows - cols)
-    avg_distance_to_diagonal = np.mean(distances)
-    num_diagonals_with_nonzeros = len(np.unique(distances))
-    bandwidth = np.max(distances)
-    return {
-        "avg_distance_to_diagonal": avg_distance_to_diagonal,
-        "num_diagonals_with_nonzeros": num_diagonals_with_nonzeros,
-        "bandwidth": bandwidth
-    }
+    return as_inspector(matrix).distance_to_diagonal()
 
 # 9. Structural Unsymmetry
 def get_structural_unsymmetry(matrix):
-    unsymmetric = np.logical_xor(matrix != 0, matrix.T != 0)
-    num_structurally_unsymmetric_elements = np.sum(unsymmetric)
-    return {"num_structurally_unsymmetric_elements": num_structurally_unsymmetric_elements}
+    return as_inspector(matrix).structural_unsymmetry()
 
 # 10. Norms
 def get_matrix_norms(matrix):
-    norm_1 = np.linalg.norm(matrix, ord=1)
-    norm_inf = np.linalg.norm(matrix, ord=np.inf)
-    frobenius_norm = np.linalg.norm(matrix, ord='fro')
-    return {
-        "norm_1": norm_1,
-        "norm_inf": norm_inf,
-        "frobenius_norm": frobenius_norm
-    }
+    return as_inspector(matrix).norms()
 
 # 11. Condition Number
 def get_condition_number(matrix):
-    try:
-        condition_number = np.linalg.cond(matrix, p=1)
-    except np.linalg.LinAlgError:
-        condition_number = float('inf')  # Handle singular matrices
-    return {"estimated_condition_number": condition_number}
\ No newline at end of file
+    return as_inspector(matrix).condition_number()
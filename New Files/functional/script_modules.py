@@ -0,0 +1,29 @@
+import importlib.util
+import os
+import sys
+
+# MatrixExpansion holds the command line scripts; its modules import each other as
+# top-level modules and it is not a package, so they are loaded from their files
+SCRIPTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "MatrixExpansion")
+
+def load_script_module(name):
+    """
+    Load a module of MatrixExpansion once, so the GUI shares its code instead of a copy.
+
+    Parameters:
+        name (str): Module name, e.g. "memory_planner".
+
+    Returns:
+        module: The loaded module.
+    """
+    module_name = f"matrix_expansion_scripts.{name}"
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPTS_DIRECTORY, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[module_name]
+            raise
+    return sys.modules[module_name]
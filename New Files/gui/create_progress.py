@@ -11,7 +11,7 @@ WINDOW_WIDTH = 500
 WINDOW_HEIGHT = 300
 WINDOW_DIM = f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}"
 
-def open_create_progress_window(parent_window, file_path, output_directory, rows, cols, density, num):
+def open_create_progress_window(parent_window, file_path, output_directory, rows, cols, density, num, engine="dense"):
     """
     Opens the progress window to show the progress of matrix creation.
 
@@ -23,6 +23,7 @@ def open_create_progress_window(parent_window, file_path, output_directory, rows
         cols (int): Desired number of columns for the matrices.
         density (int): Desired density of the matrices.
         num (int): Number of matrices to create.
+        engine (str): "dense" or "sparse" code path for the expansion.
     """
     # Create a new Toplevel window
     progress_window = tk.Toplevel()
@@ -62,7 +63,8 @@ def open_create_progress_window(parent_window, file_path, output_directory, rows
                 desired_rows=rows,
                 desired_cols=cols,
                 desired_density=density,
-                desired_num=1
+                desired_num=1,
+                engine=engine
             )
             # Rename the generated file to ensure uniqueness
             os.rename(
@@ -8,6 +8,7 @@ from gui.window_utils import (
 )
 from functional.dynamic_matrix_expansion import create_multiple_matrices
 from gui.create_progress import open_create_progress_window
+from functional.memory_planner import plan_creation
 
 BUTTON_WIDTH = 300
 BUTTON_HEIGHT = 50
@@ -74,18 +75,30 @@ def open_create_window(root):
             cols = int(entry2.get())
             density = int(entry3.get())
             num = int(entry4.get())
-
-            open_create_progress_window(
-                parent_window=window,
-                file_path=file_path,
-                output_directory=output_directory,
-                rows=rows,
-                cols=cols,
-                density=density,
-                num=num
-            )
         except ValueError:
             tk.messagebox.showerror("Invalid Input", "Please provide valid numeric values for all fields.")
+            return
+
+        # Refuse jobs that can't fit in memory before anything is allocated
+        try:
+            plan = plan_creation(file_path, rows, cols, density)
+        except MemoryError as e:
+            tk.messagebox.showerror("Not Enough Memory", str(e))
+            return
+        except (OSError, ValueError) as e:
+            tk.messagebox.showerror("Invalid File", f"Could not read the matrix file: {e}")
+            return
+
+        open_create_progress_window(
+            parent_window=window,
+            file_path=file_path,
+            output_directory=output_directory,
+            rows=rows,
+            cols=cols,
+            density=density,
+            num=num,
+            engine=plan["engine"]
+        )
 
     # Add Create button
     create_button = tk.Button(window, text="Create", font=(FONT, FONT_SIZE), command=on_create_button_click)
@@ -1,5 +1,8 @@
 import os
+import queue
+import threading
 import tkinter as tk
+import tkinter.ttk as ttk
 from gui.window_utils import (
     add_folder_selector,
     setup_close_behavior,
@@ -8,12 +11,23 @@ from gui.window_utils import (
     upload_selected_file,
     open_matrix_inspection_window
 )
+from functional.mtx_header import scan_mtx_folder
 
 BUTTON_WIDTH = 300
 BUTTON_HEIGHT = 50
 WINDOW_DIM = "800x600"
 FONT = "Arial"
 FONT_SIZE = 14
+SCAN_POLL_MS = 100
+
+# Header fields shown next to each file name
+FILE_COLUMNS = [
+    ("num_rows", "Rows", 60),
+    ("num_cols", "Cols", 60),
+    ("num_nonzeros", "NNZ", 70),
+    ("field", "Field", 60),
+    ("symmetry", "Symmetry", 80),
+]
 
 def open_generate_window(root):
     """
@@ -30,14 +44,49 @@ def open_generate_window(root):
     # Set up close behavior
     setup_close_behavior(window, root)
 
+    # Headers are read by a background thread and handed over through this queue
+    header_queue = queue.Queue()
+    scan_state = {"stop": threading.Event()}
+
+    def poll_headers():
+        if not window.winfo_exists():
+            scan_state["stop"].set()
+            return
+        try:
+            while True:
+                folder_path, file_name, header = header_queue.get_nowait()
+                if folder_path != file_list.folder_path or not file_list.exists(file_name):
+                    continue  # Result of an abandoned scan
+                file_list.set(file_name, "status", "" if header else "?")
+                if header:
+                    for key, _, _ in FILE_COLUMNS:
+                        file_list.set(file_name, key, header[key])
+        except queue.Empty:
+            pass
+        window.after(SCAN_POLL_MS, poll_headers)
+
     # Function to update the file list
     def update_file_list(folder_path):
-        file_list.delete(0, tk.END)  # Clear the current list
+        file_list.delete(*file_list.get_children())  # Clear the current list
+        scan_state["stop"].set()  # Abandon the scan of the previous folder
         if folder_path and os.path.isdir(folder_path):
             files = [file for file in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, file))]
-            for file in files:
-                file_list.insert(tk.END, file)  # Add each file to the Listbox
-            file_list.folder_path = folder_path  # Store the folder path as an attribute of the Listbox
+            for file in sorted(files):
+                status = "..." if file.lower().endswith(".mtx") else ""
+                file_list.insert("", tk.END, iid=file, text=file, values=[""] * len(FILE_COLUMNS) + [status])
+            file_list.folder_path = folder_path  # Store the folder path as an attribute of the file list
+
+            stop_event = threading.Event()
+            scan_state["stop"] = stop_event
+            threading.Thread(
+                target=scan_mtx_folder,
+                args=(folder_path,),
+                kwargs={
+                    "on_header": lambda name, header: header_queue.put((folder_path, name, header)),
+                    "should_stop": stop_event.is_set
+                },
+                daemon=True
+            ).start()
 
     # Folder selector with callback
     def folder_selected_callback():
@@ -54,9 +103,18 @@ def open_generate_window(root):
     # Bind folder selection callback
     folder_var.trace_add("write", lambda *args: folder_selected_callback())
 
-    # Listbox to display files
-    file_list = tk.Listbox(window, font=(FONT, FONT_SIZE))
+    # File list with header metadata columns
+    file_list = ttk.Treeview(window, columns=[key for key, _, _ in FILE_COLUMNS] + ["status"])
+    file_list.heading("#0", text="File")
+    file_list.column("#0", width=150)
+    for key, title, width in FILE_COLUMNS:
+        file_list.heading(key, text=title)
+        file_list.column(key, width=width, anchor=tk.E)
+    file_list.heading("status", text="")
+    file_list.column("status", width=30)
+    file_list.folder_path = None
     file_list.place(x=50, y=150, width=BUTTON_WIDTH + 100, height=BUTTON_HEIGHT * 3)
+    window.after(SCAN_POLL_MS, poll_headers)
 
     # Upload and Inspect buttons
     upload_button = tk.Button(
@@ -1,9 +1,12 @@
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import filedialog, messagebox
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
+from functional.dynamic_matrix_expansion import load_matrix_sparse
 from functional.mtx_inspection import (
-    load_mtx_file,
+    MatrixInspector,
     get_basic_properties,
     get_symmetry,
     get_nonzeros_per_row_stats,
@@ -16,8 +19,15 @@ from functional.mtx_inspection import (
     get_matrix_norms,
     get_condition_number
 )
+from functional.matrix_rendering import (
+    get_nonzero_coordinates,
+    compute_density_image,
+    draw_density_image,
+    build_tile_pyramid,
+    query_tile_pyramid
+)
 import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import numpy as np
 
 WINDOW_WIDTH = 800
@@ -26,6 +36,26 @@ WINDOW_DIM = f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}"  # 800x600
 FONT = "Arial"
 FONT_SIZE = 14
 
+# Property groups cheap enough to show as soon as the matrix is loaded
+CHEAP_PROPERTY_GROUPS = [
+    ("Basic Properties", get_basic_properties),
+    ("Nonzeros per Row", get_nonzeros_per_row_stats),
+    ("Nonzeros per Column", get_nonzeros_per_col_stats),
+]
+
+# Property groups computed in the background and filled in as they finish
+SLOW_PROPERTY_GROUPS = [
+    ("Symmetry", get_symmetry),
+    ("Nonzero Values", get_nonzero_value_stats),
+    ("Distance to Diagonal", get_distance_to_diagonal),
+    ("Structural Unsymmetry", get_structural_unsymmetry),
+    ("Norms", get_matrix_norms),
+    ("Condition Number", get_condition_number),
+]
+
+INSPECTION_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+INSPECTION_POLL_MS = 100
+
 def setup_close_behavior(window, root):
     """
     Sets up behavior for the close button (WM_DELETE_WINDOW) on a secondary window.
@@ -142,12 +172,12 @@ uploaded_file_path = None
 def upload_selected_file(file_listbox):
     global uploaded_file_path
     try:
-        selected_index = file_listbox.curselection()
+        selected_index = file_listbox.selection()
         if not selected_index:
             messagebox.showwarning("No File Selected", "Please select a file from the list.")
             return None
         
-        selected_file = file_listbox.get(selected_index)
+        selected_file = file_listbox.item(selected_index[0], "text")
         folder_path = file_listbox.folder_path
 
         if not folder_path:
@@ -175,14 +205,36 @@ def open_matrix_graph_window(table_window, matrix):
 
     table_window.withdraw()
 
+    # Nonzeros are binned into a screen-sized image instead of drawn one marker each
+    row_indices, col_indices = get_nonzero_coordinates(matrix)
+    image, view = compute_density_image(row_indices, col_indices, matrix.shape)
+
     fig, ax = plt.subplots(figsize=(8, 6))
-    ax.spy(matrix, markersize=1)
+    density_image = draw_density_image(ax, image, view)
     ax.set_title("Matrix Graph", fontsize=14)
     ax.set_xlabel("Columns", fontsize=12)
     ax.set_ylabel("Rows", fontsize=12)
 
     canvas = FigureCanvasTkAgg(fig, master=graph_window)
+    toolbar = NavigationToolbar2Tk(canvas, graph_window)
+    toolbar.update()
     canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+    # Re-bin only the visible window after zooming or panning
+    def on_view_changed(changed_ax):
+        nonlocal density_image
+        col_start, col_stop = sorted(changed_ax.get_xlim())
+        row_start, row_stop = sorted(changed_ax.get_ylim())
+        new_view = (row_start + 0.5, row_stop + 0.5, col_start + 0.5, col_stop + 0.5)
+        new_image, new_view = compute_density_image(row_indices, col_indices, matrix.shape, view=new_view)
+        row_start, row_stop, col_start, col_stop = new_view
+        density_image.set_data(np.log1p(new_image))
+        density_image.set_extent((col_start - 0.5, col_stop - 0.5, row_stop - 0.5, row_start - 0.5))
+        density_image.set_clim(0, max(np.log1p(new_image).max(), 1e-12))
+        canvas.draw_idle()
+
+    ax.callbacks.connect("xlim_changed", on_view_changed)
+    ax.callbacks.connect("ylim_changed", on_view_changed)
     canvas.draw()
 
 def open_matrix_heatmap_window(table_window, matrix):
@@ -198,12 +250,22 @@ def open_matrix_heatmap_window(table_window, matrix):
 
     table_window.withdraw()
 
-    matrix_min = np.min(matrix)
-    matrix_max = np.max(matrix)
-    normalized_matrix = (matrix - matrix_min) / (matrix_max - matrix_min) if matrix_max > matrix_min else np.zeros_like(matrix)
+    # Tiles are aggregated once from the non-zeros; zooming reads only the visible ones
+    pyramid = build_tile_pyramid(matrix)
+    matrix_min, matrix_max = pyramid["value_range"]
+    value_span = matrix_max - matrix_min if matrix_max > matrix_min else 1.0
+
+    def normalize(image):
+        return (image - matrix_min) / value_span
+
+    image, view = query_tile_pyramid(pyramid)
+    row_start, row_stop, col_start, col_stop = view
 
     fig, ax = plt.subplots(figsize=(8, 6))
-    cax = ax.matshow(normalized_matrix, cmap='viridis')
+    cax = ax.imshow(
+        normalize(image), cmap='viridis', vmin=0, vmax=1, interpolation="nearest", aspect="auto",
+        extent=(col_start - 0.5, col_stop - 0.5, row_stop - 0.5, row_start - 0.5)
+    )
     fig.colorbar(cax)
 
     ax.set_title("Matrix Heatmap", pad=20, fontsize=14)
@@ -211,7 +273,22 @@ def open_matrix_heatmap_window(table_window, matrix):
     ax.set_ylabel("Rows", fontsize=12)
 
     canvas = FigureCanvasTkAgg(fig, master=heatmap_window)
+    toolbar = NavigationToolbar2Tk(canvas, heatmap_window)
+    toolbar.update()
     canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+    def on_view_changed(changed_ax):
+        col_start, col_stop = sorted(changed_ax.get_xlim())
+        row_start, row_stop = sorted(changed_ax.get_ylim())
+        new_view = (row_start + 0.5, row_stop + 0.5, col_start + 0.5, col_stop + 0.5)
+        new_image, new_view = query_tile_pyramid(pyramid, view=new_view)
+        row_start, row_stop, col_start, col_stop = new_view
+        cax.set_data(normalize(new_image))
+        cax.set_extent((col_start - 0.5, col_stop - 0.5, row_stop - 0.5, row_start - 0.5))
+        canvas.draw_idle()
+
+    ax.callbacks.connect("xlim_changed", on_view_changed)
+    ax.callbacks.connect("ylim_changed", on_view_changed)
     canvas.draw()
 
 def open_matrix_inspection_window(generate_window):
@@ -220,16 +297,25 @@ def open_matrix_inspection_window(generate_window):
         messagebox.showwarning("No File Uploaded", "Please upload a file before inspecting the matrix.")
         return
 
-    matrix = load_mtx_file(uploaded_file_path)
+    # Kept in CSR: the inspector, the density image and the tile pyramid only need the non-zeros
+    matrix = load_matrix_sparse(uploaded_file_path)
     if matrix is None:
         messagebox.showerror("Error", "Failed to load the matrix from the uploaded file.")
         return
+    # One inspector for all groups, so intermediates are shared between them
+    inspector = MatrixInspector(matrix)
 
     inspection_window = tk.Toplevel()
     inspection_window.geometry(WINDOW_DIM)
     inspection_window.title("Matrix Inspection")
 
+    executor = ThreadPoolExecutor(max_workers=INSPECTION_WORKERS)
+    pending_groups = {}
+
     def on_close():
+        for task in pending_groups.values():
+            task["future"].cancel()
+        executor.shutdown(wait=False)
         generate_window.deiconify()
         inspection_window.destroy()
 
@@ -273,20 +359,55 @@ def open_matrix_inspection_window(generate_window):
         "estimated_condition_number": "Estimated Condition Number",
     }
 
-    def add_properties_to_tree(property_dict):
+    def add_properties_to_tree(property_dict, index="end"):
         for key, value in property_dict.items():
             formal_name = formal_property_names.get(key, key.replace("_", " ").title())
-            tree.insert("", "end", values=(formal_name, value))
-
-    add_properties_to_tree(get_basic_properties(matrix))
-    add_properties_to_tree(get_symmetry(matrix))
-    add_properties_to_tree(get_nonzeros_per_row_stats(matrix))
-    add_properties_to_tree(get_nonzeros_per_col_stats(matrix))
-    add_properties_to_tree(get_nonzero_value_stats(matrix))
-    add_properties_to_tree(get_distance_to_diagonal(matrix))
-    add_properties_to_tree(get_structural_unsymmetry(matrix))
-    add_properties_to_tree(get_matrix_norms(matrix))
-    add_properties_to_tree(get_condition_number(matrix))
+            tree.insert("", index, values=(formal_name, value))
+            if index != "end":
+                index += 1
+
+    def timed_group(getter):
+        start = time.perf_counter()
+        property_dict = getter(inspector)
+        return property_dict, time.perf_counter() - start
+
+    def poll_property_groups():
+        if not inspection_window.winfo_exists():
+            return
+        now = time.perf_counter()
+        for header, task in list(pending_groups.items()):
+            future = task["future"]
+            if future.done():
+                del pending_groups[header]
+                try:
+                    property_dict, elapsed = future.result()
+                except Exception as e:
+                    tree.item(header, values=(task["name"], f"Failed: {e}"))
+                    continue
+                tree.item(header, values=(task["name"], f"Done in {elapsed:.2f} s"))
+                add_properties_to_tree(property_dict, tree.index(header) + 1)
+            elif future.running():
+                start = task.setdefault("start", now)
+                tree.item(header, values=(task["name"], f"Computing... {now - start:.1f} s"))
+
+        if pending_groups:
+            inspection_window.after(INSPECTION_POLL_MS, poll_property_groups)
+        else:
+            executor.shutdown(wait=False)
+
+    # Cheap groups are shown right away
+    for _, getter in CHEAP_PROPERTY_GROUPS:
+        add_properties_to_tree(getter(inspector))
+
+    # Slow groups get a pending row each and are filled in as they finish
+    tree.tag_configure("group", font=(FONT, FONT_SIZE - 2, "bold"))
+    for group_name, getter in SLOW_PROPERTY_GROUPS:
+        header = tree.insert("", "end", values=(group_name, "Pending..."), tags=("group",))
+        pending_groups[header] = {
+            "name": group_name,
+            "future": executor.submit(timed_group, getter)
+        }
+    inspection_window.after(INSPECTION_POLL_MS, poll_property_groups)
 
     tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 